@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Synthetic Hebrew address corpora for benchmarks and fuzzing
+Deterministic for a given seed, so runs on different machines see the same inputs
+"""
+
+import random
+
+CITIES = [
+    'תל אביב', 'ירושלים', 'חיפה', 'באר שבע', 'נתניה', 'אשדוד', 'רמת גן', 'פתח תקווה',
+    'אשקלון', 'רחובות', 'בני ברק', 'בת ים', 'כפר סבא', 'הרצליה', 'רעננה', 'ראש העין',
+    'תל אביב-יפו', 'קרית שמונה', 'מעלה אדומים', 'מודיעין-מכבים-רעות',
+]
+
+STREETS = [
+    'הרצל', 'בן גוריון', 'ויצמן', 'רוטשילד', 'דיזנגוף', 'אלנבי', 'שדרות העצמאות', 'הכרמל',
+    'הנביאים', "המלך ג'ורג'", 'כנרת', 'מגדל דוד', 'ז\'בוטינסקי', 'שד\' ירושלים', 'דרך מנחם בגין',
+    'רבי עקיבא', 'יהודה הלוי', 'אבן גבירול', "רח' הגפן", 'קיבוץ גלויות', 'הרב קוק', 'נחלת בנימין',
+]
+
+STREET_PREFIXES = ['', '', '', 'רחוב ', 'שדרות ', "רח' "]
+
+ENTRANCES = ['', '', '', 'א', 'ב', 'ג', '1', '2']
+
+RESPONSE_TEMPLATES = [
+    'RES{d}{zip}', 'RES{d}{zip}', 'RES{d}{zip}', ' RES{d}{zip}\n', '{zip}',
+    'המיקוד הוא {zip}', 'RES0', 'לא נמצא', '<html>ShieldSquare Captcha</html>',
+]
+
+
+def generate_addresses(count, seed=0):
+    """Yield (city, street, house, entrance) tuples"""
+    rng = random.Random(seed)
+    for _ in range(count):
+        street = rng.choice(STREET_PREFIXES) + rng.choice(STREETS)
+        house = str(rng.randint(1, 250))
+        if rng.random() < 0.05:
+            house += rng.choice(['א', 'ב', '/1'])
+        yield (rng.choice(CITIES), street, house, rng.choice(ENTRANCES))
+
+
+def generate_responses(count, seed=0):
+    """Yield raw API response bodies in the shapes SearchZip returns"""
+    rng = random.Random(seed)
+    for _ in range(count):
+        template = rng.choice(RESPONSE_TEMPLATES)
+        yield template.format(d=rng.randint(0, 9), zip=str(rng.randint(1000000, 9999999))[:rng.choice([5, 7, 7])])
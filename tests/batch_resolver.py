@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Async batch resolver for SearchZip lookups
+Keeps N lookups in flight and enforces a global requests-per-second ceiling
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class RateLimiter:
+    """Global requests-per-second ceiling shared by every in-flight lookup"""
+
+    def __init__(self, rate=None):
+        self.rate = rate
+        self._next_slot = 0.0
+
+    def _reserve(self):
+        """Reserve the next request slot and return how long to wait for it"""
+        if not self.rate:
+            return 0.0
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        # Reserve the slot before sleeping so concurrent callers queue up behind it
+        self._next_slot = slot + 1.0 / self.rate
+        return slot - now
+
+    async def acquire(self):
+        """Wait until the next request slot is available"""
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def wait(self):
+        """Blocking acquire() for sequential callers"""
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    def record(self, result):
+        """Feedback hook called with each lookup result - a fixed ceiling ignores it"""
+
+
+class AdaptiveRateLimiter(RateLimiter):
+    """
+    AIMD ceiling: the rate creeps up while responses are clean and is cut sharply when the upstream blocks,
+    so a run settles just under the rate the upstream tolerates
+    """
+
+    def __init__(self, rate=0.5, min_rate=0.05, max_rate=5.0, increase=0.05, decrease=0.5, block_pause=30.0):
+        """
+        rate: starting requests per second, kept within [min_rate, max_rate]
+        increase: requests/sec added per second's worth of clean responses (additive increase)
+        decrease: factor applied to the rate on a block (multiplicative decrease)
+        block_pause: seconds without requests after a block; blocks from requests already in flight count once
+        """
+        super().__init__(rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.block_pause = block_pause
+        self.peak_rate = rate
+        self.blocks = 0
+        self._holdoff_until = 0.0
+
+    def record(self, result):
+        if result.get('blocked'):
+            now = time.monotonic()
+            if now < self._holdoff_until:
+                return
+            self.blocks += 1
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self._next_slot = max(self._next_slot, now + self.block_pause)
+            self._holdoff_until = now + self.block_pause
+        elif 'error' not in result:
+            # increase / rate per response adds `increase` req/s for every second of clean traffic
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+            self.peak_rate = max(self.peak_rate, self.rate)
+
+    def report(self):
+        """One-line summary for the end of a run"""
+        return f"Rate: {self.rate:.2f} req/s (peak {self.peak_rate:.2f}, {self.blocks} blocks)"
+
+
+class BatchResolver:
+    def __init__(self, lookup, concurrency=8, rate_limit=None):
+        """
+        lookup: blocking callable (city, street, house, entrance) -> result dict
+        concurrency: number of lookups kept in flight
+        rate_limit: global requests-per-second ceiling (None = unlimited), or a RateLimiter such as
+                    AdaptiveRateLimiter that is fed every result
+        """
+        self.lookup = lookup
+        self.concurrency = max(1, concurrency)
+        self.rate_limit = rate_limit
+
+    async def resolve_async(self, addresses, on_result=None, skip=None, collect=True):
+        """
+        Resolve an iterable of (city, street, house, entrance) tuples, results in input order
+        skip: optional predicate on the input index - matching inputs are not looked up
+        collect: set False to only stream results to on_result (returns None, memory stays flat)
+        """
+        loop = asyncio.get_running_loop()
+        limiter = self.rate_limit if isinstance(self.rate_limit, RateLimiter) else RateLimiter(self.rate_limit)
+        pending = ((index, address) for index, address in enumerate(addresses) if not (skip and skip(index)))
+        results = {}
+
+        def lookup(address):
+            try:
+                return self.lookup(*address)
+            except Exception as e:
+                return {'valid': False, 'error': str(e)}
+
+        async def worker(executor):
+            # Workers pull from a shared iterator so the input is never materialized
+            for index, address in pending:
+                await limiter.acquire()
+                result = await loop.run_in_executor(executor, lookup, address)
+                limiter.record(result)
+                if collect:
+                    results[index] = result
+                if on_result:
+                    on_result(index, address, result)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            await asyncio.gather(*(worker(executor) for _ in range(self.concurrency)))
+
+        if collect:
+            return [results[i] for i in sorted(results)]
+
+    def resolve(self, addresses, on_result=None, skip=None, collect=True):
+        """Blocking wrapper around resolve_async"""
+        return asyncio.run(self.resolve_async(addresses, on_result, skip, collect))
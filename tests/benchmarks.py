@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the encoding, parsing and validation hot paths
+Runs offline over synthetic Hebrew address corpora and compares throughput against a saved baseline
+"""
+
+import argparse
+import json
+import math
+import platform
+import sys
+import time
+import tracemalloc
+
+from address_corpus import generate_addresses, generate_responses
+from mikud_utils import build_url, encode_param, parse_response, parse_responses, validate_address
+
+
+def _benchmarks(addresses, responses):
+    """name -> (function running one pass over the corpus, calls per pass)"""
+    cities = [address[0] for address in addresses]
+    streets = [address[1] for address in addresses]
+    return {
+        'encode_param': (lambda: [encode_param(city) for city in cities], len(cities)),
+        'encode_param_street': (lambda: [encode_param(street, preserve_spaces=True) for street in streets], len(streets)),
+        'build_url': (lambda: [build_url(*address) for address in addresses], len(addresses)),
+        'parse_response': (lambda: [parse_response(text) for text in responses], len(responses)),
+        'parse_responses': (lambda: parse_responses(responses), len(responses)),
+        'validate_address': (lambda: [validate_address(*address) for address in addresses], len(addresses)),
+    }
+
+
+def _peak_bytes_per_call(run, calls):
+    """Peak memory allocated while running one pass, divided by the calls it made"""
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return (peak - before) / calls
+
+
+def run_benchmarks(size=50000, repeat=5, seed=0, only=None, min_time=0.25):
+    """
+    Return {name: {'ops_per_sec', 'peak_alloc_bytes_per_call'}} using the best of `repeat` samples
+    Each sample repeats the pass until it lasts at least min_time seconds, to keep timer noise down
+    """
+    addresses = list(generate_addresses(size, seed))
+    responses = list(generate_responses(size, seed))
+    results = {}
+    for name, (run, calls) in _benchmarks(addresses, responses).items():
+        if only and name not in only:
+            continue
+        # The first pass also warms caches (lru_cache, translate table) like a long bulk job would
+        passes = max(1, math.ceil(min_time / _timed(run, 1)))
+        best = min(_timed(run, passes) for _ in range(repeat))
+        results[name] = {
+            'ops_per_sec': calls * passes / best,
+            'peak_alloc_bytes_per_call': _peak_bytes_per_call(run, calls),
+        }
+    return results
+
+
+def _timed(run, passes):
+    start = time.perf_counter()
+    for _ in range(passes):
+        run()
+    return time.perf_counter() - start
+
+
+def compare_to_baseline(results, baseline, threshold):
+    """Return the names whose throughput dropped more than `threshold` below the baseline"""
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get('results', {}).get(name)
+        if expected and result['ops_per_sec'] < expected['ops_per_sec'] * (1 - threshold):
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Microbenchmarks for encoding, parsing and validation')
+    parser.add_argument('--size', type=int, default=50000, help='Corpus size (default: 50000)')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed passes per benchmark, best is kept (default: 5)')
+    parser.add_argument('--min-time', type=float, default=0.25,
+                        help='Minimum seconds per timed sample (default: 0.25)')
+    parser.add_argument('--seed', type=int, default=0, help='Corpus seed (default: 0)')
+    parser.add_argument('--only', nargs='*', help='Run only these benchmarks')
+    parser.add_argument('--baseline', default='bench_baseline.json', help='Baseline file (default: bench_baseline.json)')
+    parser.add_argument('--save-baseline', action='store_true', help='Write the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Allowed throughput drop vs baseline before failing (default: 0.2 = 20%%)')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"Microbenchmarks ({args.size} synthetic addresses, best of {args.repeat})")
+    print("=" * 60)
+
+    results = run_benchmarks(args.size, args.repeat, args.seed, args.only, args.min_time)
+
+    try:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    except (OSError, ValueError):
+        baseline = None
+
+    print(f"  {'Benchmark':<22}{'ops/sec':>14}{'bytes/call':>12}{'vs baseline':>13}")
+    for name, result in results.items():
+        expected = (baseline or {}).get('results', {}).get(name)
+        change = f"{result['ops_per_sec'] / expected['ops_per_sec'] - 1:+.1%}" if expected else '-'
+        print(f"  {name:<22}{result['ops_per_sec']:>14,.0f}{result['peak_alloc_bytes_per_call']:>12.0f}{change:>13}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'size': args.size,
+                'results': results,
+            }, f, indent=2)
+        print(f"\n✅ Baseline saved to {args.baseline}")
+        return 0
+
+    if baseline is None:
+        print(f"\nNo baseline at {args.baseline} - run with --save-baseline to create one")
+        return 0
+
+    regressions = compare_to_baseline(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n❌ Throughput regressed more than {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    print(f"\n✅ No benchmark regressed more than {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Chrome WebDriver setup shared by the website-facing scripts
+Selenium and webdriver_manager are imported only when a browser is actually started
+"""
+
+import json
+import os
+import time
+
+# Resolved chromedriver path, reused so webdriver_manager does not redo its version check on every start
+DRIVER_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.cache', 'mikud', 'chromedriver.json')
+DRIVER_CACHE_MAX_AGE = 7 * 24 * 60 * 60
+
+
+def extension_patterns(*extensions):
+    """
+    Network.setBlockedURLs wildcards for URLs whose path ends in one of the extensions
+    Anchored to the end of the URL or the start of the query, so '.css' does not also catch '.cssx' or '?x.css='
+    """
+    return [pattern for extension in extensions for pattern in (f"*.{extension}", f"*.{extension}?*")]
+
+
+# URL patterns per resource type the lean profile can drop
+RESOURCE_PATTERNS = {
+    'image': extension_patterns('png', 'jpg', 'jpeg', 'gif', 'svg', 'webp', 'ico', 'bmp'),
+    'font': extension_patterns('woff', 'woff2', 'ttf', 'otf', 'eot'),
+    'media': extension_patterns('mp4', 'webm', 'mp3', 'ogg', 'wav'),
+    'stylesheet': extension_patterns('css'),
+}
+
+# Not needed to fill the form or get an answer - and often the slowest requests on the page
+DEFAULT_LEAN_TYPES = ('image', 'font', 'media')
+
+# Third-party analytics, tag managers, ads and chat widgets
+THIRD_PARTY_HOSTS = [
+    '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*', '*googlesyndication.com*',
+    '*googleadservices.com*', '*facebook.net*', '*facebook.com/tr*', '*hotjar.com*', '*clarity.ms*',
+    '*newrelic.com*', '*nr-data.net*', '*youtube.com*', '*ytimg.com*', '*twitter.com*', '*linkedin.com*',
+]
+
+
+def lean_blocklist(types=DEFAULT_LEAN_TYPES, hosts=THIRD_PARTY_HOSTS):
+    """URL patterns for a lean page profile: the given resource types plus third-party hosts"""
+    unknown = [kind for kind in types if kind not in RESOURCE_PATTERNS]
+    if unknown:
+        raise ValueError(f"Unknown resource type(s) {', '.join(unknown)} (expected {', '.join(RESOURCE_PATTERNS)})")
+    return [pattern for kind in types for pattern in RESOURCE_PATTERNS[kind]] + list(hosts)
+
+
+def _cached_driver_path():
+    """Return the cached chromedriver path if it is fresh and still on disk"""
+    try:
+        with open(DRIVER_CACHE_FILE, encoding='utf-8') as f:
+            cached = json.load(f)
+        if time.time() - cached['resolved_at'] < DRIVER_CACHE_MAX_AGE and os.path.exists(cached['path']):
+            return cached['path']
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+def chromedriver_path(refresh=False):
+    """Resolve the chromedriver binary, installing it via webdriver_manager only when the cache is stale"""
+    path = None if refresh else _cached_driver_path()
+    if path:
+        return path
+
+    from webdriver_manager.chrome import ChromeDriverManager
+    path = ChromeDriverManager().install()
+    os.makedirs(os.path.dirname(DRIVER_CACHE_FILE), exist_ok=True)
+    with open(DRIVER_CACHE_FILE, 'w', encoding='utf-8') as f:
+        json.dump({'path': path, 'resolved_at': time.time()}, f)
+    return path
+
+
+def create_driver(headless=True, capture_network=False, blocked_urls=None):
+    """
+    Start a Chrome WebDriver configured to look like a regular browser
+    capture_network: enable the performance log that network_capture.NetworkCapture reads
+    blocked_urls: URL patterns Chrome refuses to load (see lean_blocklist) - applies to every later navigation
+    """
+    from selenium import webdriver
+    from selenium.common.exceptions import SessionNotCreatedException
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.chrome.options import Options
+
+    chrome_options = Options()
+    if headless:
+        chrome_options.add_argument('--headless')
+    chrome_options.add_argument('--no-sandbox')
+    chrome_options.add_argument('--disable-dev-shm-usage')
+    chrome_options.add_argument('--disable-blink-features=AutomationControlled')
+    chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
+    chrome_options.add_experimental_option('useAutomationExtension', False)
+    if capture_network:
+        from network_capture import PERFORMANCE_LOGGING
+        chrome_options.set_capability('goog:loggingPrefs', PERFORMANCE_LOGGING)
+
+    try:
+        driver = webdriver.Chrome(service=Service(chromedriver_path()), options=chrome_options)
+    except SessionNotCreatedException:
+        # Chrome was probably upgraded past the cached driver - resolve a matching one
+        driver = webdriver.Chrome(service=Service(chromedriver_path(refresh=True)), options=chrome_options)
+    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+    if blocked_urls:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': list(blocked_urls)})
+    return driver
+
+
+def driver_alive(driver):
+    """Check whether a driver session still responds (False after a browser crash)"""
+    try:
+        driver.current_url
+        return True
+    except Exception:
+        return False
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Streaming bulk address resolution
+Reads a CSV or JSONL address file row by row, validates it like the extension, drops in-file duplicates,
+resolves the rest concurrently and writes every row back out in input order with zip, status and latency
+"""
+
+import argparse
+import csv
+import json
+import sys
+import time
+
+from batch_resolver import AdaptiveRateLimiter, BatchResolver
+from mikud_utils import validate_address
+from response_cache import exact_key
+
+# Address field -> input column name (override with --columns)
+DEFAULT_COLUMNS = {'city': 'city', 'street': 'street', 'house': 'house', 'entrance': 'entrance'}
+
+OUTPUT_COLUMNS = ['zip', 'status', 'latency_ms', 'error']
+
+STATUSES = ('ok', 'not_found', 'blocked', 'error', 'invalid', 'duplicate')
+
+
+def detect_format(path, explicit=None):
+    """'csv' or 'jsonl' from --format or the file extension (CSV by default)"""
+    if explicit:
+        return explicit
+    return 'jsonl' if path.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def read_rows(f, fmt):
+    """Return (fieldnames or None, row iterator) without reading the file into memory"""
+    if fmt == 'jsonl':
+        return None, (json.loads(line) for line in f if line.strip())
+    reader = csv.DictReader(f)
+    return reader.fieldnames, iter(reader)
+
+
+def parse_columns(spec):
+    """'city=עיר,house=מספר' -> {'city': 'עיר', 'house': 'מספר', ...defaults}"""
+    columns = dict(DEFAULT_COLUMNS)
+    for pair in filter(None, (spec or '').split(',')):
+        field, _, column = pair.partition('=')
+        if field not in DEFAULT_COLUMNS or not column:
+            raise ValueError(f"Bad column mapping: {pair!r} (expected one of {', '.join(DEFAULT_COLUMNS)}=<column>)")
+        columns[field] = column
+    return columns
+
+
+def address_of(row, columns):
+    """(city, street, house, entrance) strings from an input row; missing values become ''"""
+    values = []
+    for field in ('city', 'street', 'house', 'entrance'):
+        value = row.get(columns[field])
+        values.append('' if value is None else str(value))
+    return tuple(values)
+
+
+def status_of(result):
+    if result.get('valid'):
+        return 'ok'
+    if result.get('blocked'):
+        return 'blocked'
+    if 'error' in result:
+        return 'error'
+    return 'not_found'
+
+
+def resolve_rows(rows, lookup, columns=None, concurrency=8, rate_limit=None, on_row=None):
+    """
+    Resolve an iterable of row dicts and call on_row(row) for each, in input order, with
+    zip / status / latency_ms / error added. Invalid rows and repeats of an earlier address are not looked up
+    lookup: blocking (city, street, house, entrance) -> ZipClient-style result dict
+    rate_limit: requests per second or a RateLimiter (see BatchResolver)
+    Returns {status: count}
+    """
+    columns = columns or DEFAULT_COLUMNS
+    counts = dict.fromkeys(STATUSES, 0)
+    first_zip = {}   # address key -> zip of its first occurrence (filled in once that row is written)
+    prefilled = {}   # index -> (row, key, duplicate) for rows decided without a lookup
+    in_flight = {}   # index -> (row, key) for rows being looked up
+    ready = {}       # index -> (row, key, duplicate) waiting for the rows before it
+    state = {'next': 0}
+
+    def emit(index, row, key, duplicate):
+        ready[index] = (row, key, duplicate)
+        while state['next'] in ready:
+            row, key, duplicate = ready.pop(state['next'])
+            if duplicate:
+                row['zip'] = first_zip.get(key) or ''
+            elif key is not None:
+                first_zip[key] = row['zip']
+            counts[row['status']] += 1
+            if on_row:
+                on_row(row)
+            state['next'] += 1
+
+    def annotate(row, status, zip_code='', latency_ms='', error=''):
+        row.update(zip=zip_code, status=status, latency_ms=latency_ms, error=error)
+        return row
+
+    def addresses():
+        for index, row in enumerate(rows):
+            address = address_of(row, columns)
+            check = validate_address(*address)
+            if not check['valid']:
+                prefilled[index] = (annotate(row, 'invalid', error='; '.join(check['errors'])), None, False)
+            else:
+                # Rows repeat only if they send the same text - another spelling may answer differently
+                key = exact_key(*address)
+                if key in first_zip:
+                    prefilled[index] = (annotate(row, 'duplicate', latency_ms=0), key, True)
+                else:
+                    first_zip[key] = None
+                    in_flight[index] = (row, key)
+            yield address
+
+    def skip(index):
+        if index in prefilled:
+            emit(index, *prefilled.pop(index))
+            return True
+        return False
+
+    def timed_lookup(*address):
+        start = time.perf_counter()
+        result = lookup(*address)
+        return {**result, 'latency_ms': round((time.perf_counter() - start) * 1000, 1)}
+
+    def on_result(index, address, result):
+        row, key = in_flight.pop(index)
+        annotate(row, status_of(result), result.get('zipCode') or '', result.get('latency_ms', ''),
+                 result.get('error', ''))
+        emit(index, row, key, False)
+
+    BatchResolver(timed_lookup, concurrency=concurrency, rate_limit=rate_limit).resolve(
+        addresses(), on_result=on_result, skip=skip, collect=False)
+    return counts
+
+
+class Progress:
+    """Live rows/sec line on stderr, redrawn at most every `interval` seconds"""
+
+    def __init__(self, stream=sys.stderr, interval=0.5):
+        self.stream = stream
+        self.interval = interval
+        self.rows = 0
+        self.start = time.perf_counter()
+        self._drawn_at = 0.0
+
+    def update(self, counts=None):
+        self.rows += 1
+        now = time.perf_counter()
+        if now - self._drawn_at >= self.interval:
+            self._drawn_at = now
+            self.draw(counts)
+
+    def draw(self, counts=None, end=''):
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        detail = ' '.join(f"{status}={count}" for status, count in (counts or {}).items() if count)
+        self.stream.write(f"\r  {self.rows:,} rows ({self.rows / elapsed:,.1f} rows/s) {detail}\033[K{end}")
+        self.stream.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resolve zip codes for a CSV or JSONL address file')
+    parser.add_argument('input', help="CSV (with a header row) or JSONL file, '-' for stdin")
+    parser.add_argument('-o', '--output', default='-', help="Output file (default: stdout)")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help='Input format (default: from the extension)')
+    parser.add_argument('--columns', help='Column names, e.g. city=עיר,street=רחוב,house=בית,entrance=כניסה')
+    parser.add_argument('--concurrency', type=int, default=8, help='Lookups in flight (default: 8)')
+    parser.add_argument('--rate', type=float, help='Fixed requests per second (default: adaptive)')
+    parser.add_argument('--max-rate', type=float, default=4.0, help='Ceiling for the adaptive rate (default: 4)')
+    parser.add_argument('--cache', default='zip_cache.sqlite3', help="Response cache path, 'none' to disable")
+    parser.add_argument('--index', help='Offline zip index built by zip_index.py, consulted before the cache')
+    parser.add_argument('--api-base-url', help='SearchZip endpoint (default: $MIKUD_API_BASE_URL or production)')
+    parser.add_argument('--deadline', type=float, help='End-to-end seconds per lookup, retries included')
+    parser.add_argument('--hedge', action='store_true',
+                        help='Send a second request when the first has no answer after the observed p95')
+    parser.add_argument('--hedge-max-extra', type=float, default=0.1,
+                        help='Cap on hedged requests as a fraction of all requests (default: 0.1)')
+    args = parser.parse_args()
+
+    from deadlines import HedgePolicy
+    from response_cache import ResponseCache
+    from zip_client import ZipClient
+    from zip_index import ZipIndex
+
+    try:
+        columns = parse_columns(args.columns)
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+
+    fmt = detect_format(args.input, args.format)
+    source = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8-sig', newline='')
+    fieldnames, rows = read_rows(source, fmt)
+    if fieldnames is not None:
+        missing = [columns[field] for field in ('city', 'street', 'house') if columns[field] not in fieldnames]
+        if missing:
+            print(f"❌ Missing column(s) {', '.join(missing)} - found {', '.join(fieldnames)} (see --columns)",
+                  file=sys.stderr)
+            return 1
+
+    # Excel needs the BOM to open a Hebrew CSV as UTF-8
+    out_encoding = 'utf-8-sig' if fmt == 'csv' and args.output != '-' else 'utf-8'
+    sink = sys.stdout if args.output == '-' else open(args.output, 'w', encoding=out_encoding, newline='')
+    if fmt == 'csv':
+        writer = csv.DictWriter(sink, fieldnames=fieldnames + [c for c in OUTPUT_COLUMNS if c not in fieldnames])
+        writer.writeheader()
+        write = writer.writerow
+    else:
+        def write(row):
+            sink.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+    cache = None if args.cache == 'none' else ResponseCache(args.cache)
+    index = ZipIndex(args.index) if args.index else None
+    client = ZipClient(base_url=args.api_base_url, max_connections_per_host=args.concurrency, cache=cache,
+                       index=index, deadline=args.deadline,
+                       hedge=HedgePolicy(max_extra=args.hedge_max_extra) if args.hedge else None)
+    rate_limit = args.rate if args.rate else AdaptiveRateLimiter(rate=0.5, max_rate=args.max_rate)
+    progress = Progress()
+    counts = {}
+
+    def on_row(row):
+        write(row)
+        counts[row['status']] = counts.get(row['status'], 0) + 1
+        progress.update(counts)
+
+    try:
+        resolve_rows(rows, client.lookup, columns, args.concurrency, rate_limit, on_row)
+    finally:
+        progress.draw(counts, end='\n')
+        client.close()
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+
+    if index is not None:
+        print(index.report(), file=sys.stderr)
+    if cache is not None:
+        print(cache.report(), file=sys.stderr)
+    if client.flights is not None:
+        print(client.flights.report(), file=sys.stderr)
+    if client.hedge is not None:
+        print(client.hedge.report(), file=sys.stderr)
+    if isinstance(rate_limit, AdaptiveRateLimiter):
+        print(rate_limit.report(), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
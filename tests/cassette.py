@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Record/replay cassette for API vs website comparisons
+Record mode saves every SearchZip request/response pair and every website result while a live run happens.
+Replay mode answers them from the file with no network, browser or sleeps, and lists anything it was not
+asked to record - a changed request URL shows up as a miss
+"""
+
+import datetime
+import http.client
+import json
+import os
+
+from normalize import address_key
+
+VERSION = 1
+MODES = ('record', 'replay')
+# Where a cassette's answers came from: the live API and site, or stub_server.py standing in for both
+SOURCES = ('live', 'stub')
+
+
+def request_key(url):
+    """Cassette key for a SearchZip URL - the query string, so any base URL (live, stub) replays the same"""
+    return url.partition('?')[2]
+
+
+class Cassette:
+    def __init__(self, path, mode='replay', source='live'):
+        """
+        mode: 'record' adds to the file (creating it), 'replay' serves from it
+        source: what a recording is made from (replay reads it from the file)
+        Raises FileNotFoundError when replaying a cassette that does not exist
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r} (expected {', '.join(MODES)})")
+        if source not in SOURCES:
+            raise ValueError(f"Unknown cassette source {source!r} (expected {', '.join(SOURCES)})")
+        self.path = path
+        self.mode = mode
+        self.source = source
+        self.recorded_at = None
+        self.api = {}       # request key -> responses in the order they were received (retries included)
+        self.website = {}   # address key -> website result
+        self.misses = []    # What a replay was asked for and did not have, in order, without repeats
+        self._cursor = {}
+        if mode == 'replay' or os.path.exists(path):
+            self.load()
+
+    @property
+    def replaying(self):
+        return self.mode == 'replay'
+
+    def load(self):
+        with open(self.path, encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != VERSION:
+            raise ValueError(f"{self.path} is not a version {VERSION} cassette")
+        self.api = data['api']
+        self.website = data['website']
+        self.recorded_at = data.get('recorded_at')
+        if self.replaying:
+            self.source = data.get('source', 'live')
+
+    def save(self):
+        """
+        Write the cassette (replaced atomically); sorted keys keep re-recordings diffable
+        recorded_at only moves when the answers change, so re-recording identical responses leaves the file as is
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        data = {'version': VERSION, 'source': self.source, 'api': self.api, 'website': self.website}
+        if self.recorded_at is None or data != self._saved_answers():
+            self.recorded_at = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+        data['recorded_at'] = self.recorded_at
+        tmp_path = f"{self.path}.tmp{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, sort_keys=True, indent=1)
+            f.write('\n')
+        os.replace(tmp_path, self.path)
+
+    def _saved_answers(self):
+        """What the file on disk holds, without its timestamp (None if there is no readable file)"""
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        data.pop('recorded_at', None)
+        data.setdefault('source', 'live')
+        return data
+
+    def _miss(self, description):
+        if description not in self.misses:
+            self.misses.append(description)
+
+    def record_response(self, url, status, body, content_type=''):
+        key = request_key(url)
+        if key not in self._cursor:
+            # The first response this session replaces whatever an earlier recording had for the URL
+            self.api[key] = []
+            self._cursor[key] = 0
+        self.api[key].append({'status': status, 'body': body, 'content_type': content_type})
+
+    def replay_response(self, url):
+        """Next recorded response for the URL ({'status', 'body', 'content_type'}), or None (counted as a miss)"""
+        key = request_key(url)
+        responses = self.api.get(key)
+        if not responses:
+            self._miss(f"API {key}")
+            return None
+        position = self._cursor.get(key, 0)
+        self._cursor[key] = position + 1
+        # Past the recorded sequence, the last answer repeats
+        return responses[min(position, len(responses) - 1)]
+
+    def record_website(self, city, street, house, entrance, result):
+        self.website[address_key(city, street, house, entrance or '')] = result
+
+    def replay_website(self, city, street, house, entrance=''):
+        """The recorded website result, or an error result when the cassette does not have the address"""
+        result = self.website.get(address_key(city, street, house, entrance or ''))
+        if result is None:
+            description = ', '.join(part for part in (city, street, house, entrance) if part)
+            self._miss(f"website {description}")
+            return {'error': f"Not in cassette {self.path}: {description}", 'source': 'website'}
+        return dict(result)
+
+    def attach(self, client):
+        """
+        Route a ZipClient's requests through the cassette
+        Replay mounts an adapter that never opens a connection and turns off backoff sleeps; record adds a
+        response hook, so the client's own adapter (and its timing) stays in place
+        """
+        if self.replaying:
+            adapter = replay_adapter(self)
+            client.session.mount('https://', adapter)
+            client.session.mount('http://', adapter)
+            client.backoff_base = 0
+        else:
+            client.session.hooks['response'].append(self._record_hook)
+
+    def _record_hook(self, response, **kwargs):
+        self.record_response(response.request.url, response.status_code, response.text,
+                             response.headers.get('Content-Type', ''))
+        return response
+
+    def report(self):
+        """Summary line, followed by one line per miss"""
+        lines = [f"Cassette: {len(self.api)} API requests, {len(self.website)} website results in {self.path}"]
+        if self.source == 'stub':
+            lines.append("   Recorded from stub_server.py: checks request URLs and response parsing, not the live site")
+        if self.misses:
+            lines.append(f"❌ {len(self.misses)} requests not in the cassette (re-record with --record):")
+            lines.extend(f"   - {miss}" for miss in self.misses)
+        return '\n'.join(lines)
+
+
+def replay_adapter(cassette):
+    """requests adapter answering from a cassette (requests is imported only when one is built)"""
+    import requests
+    from requests.adapters import BaseAdapter
+
+    class CassetteMiss(requests.ConnectionError):
+        """A replayed request the cassette has no answer for"""
+
+    class ReplayAdapter(BaseAdapter):
+        def __init__(self, cassette):
+            super().__init__()
+            self.cassette = cassette
+
+        def send(self, request, **kwargs):
+            recorded = self.cassette.replay_response(request.url)
+            if recorded is None:
+                raise CassetteMiss(f"Not in cassette {self.cassette.path}: {request_key(request.url)}",
+                                   request=request)
+            response = requests.Response()
+            response.status_code = recorded['status']
+            response.reason = http.client.responses.get(recorded['status'], '')
+            response.headers['Content-Type'] = recorded['content_type']
+            response._content = recorded['body'].encode('utf-8')
+            response.encoding = 'utf-8'
+            response.url = request.url
+            response.request = request
+            response.elapsed = datetime.timedelta(0)
+            return response
+
+        def close(self):
+            pass
+
+    return ReplayAdapter(cassette)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+End-to-end lookup deadlines and request hedging
+A Deadline is one time budget shared by every step of a lookup (retries, backoff, page waits), and a
+HedgePolicy decides when a slow request gets a second, identical one racing it
+"""
+
+import threading
+import time
+from collections import deque
+
+
+class DeadlineExceeded(TimeoutError):
+    """The lookup's time budget ran out"""
+
+
+class Deadline:
+    def __init__(self, seconds=None, label='Lookup'):
+        """seconds: total budget from now (None = no deadline)"""
+        self.seconds = seconds
+        self.label = label
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+
+    def remaining(self):
+        """Seconds left (inf without a deadline, never negative)"""
+        if self.expires_at is None:
+            return float('inf')
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def check(self):
+        """Raise DeadlineExceeded once the budget is spent"""
+        if self.expired():
+            raise DeadlineExceeded(f"{self.label} deadline of {self.seconds:g}s exceeded (timed out)")
+
+    def cap(self, timeout):
+        """timeout (seconds, or a (connect, read) tuple) shortened to what is left of the budget"""
+        self.check()
+        remaining = self.remaining()
+        if isinstance(timeout, tuple):
+            return tuple(min(value, remaining) for value in timeout)
+        return min(timeout, remaining)
+
+
+# Shared "no deadline" budget for callers that were not given one
+NO_DEADLINE = Deadline()
+
+
+class HedgePolicy:
+    """
+    When to send a hedged (duplicate) request and how many are allowed
+    The hedge delay is a fixed value or the observed quantile of recent request latencies; hedges are capped at
+    max_extra of the primary requests, so a slow upstream never sees more than that much extra load
+    """
+
+    def __init__(self, delay=None, quantile=0.95, window=200, min_samples=20, max_extra=0.1):
+        """
+        delay: seconds without an answer before hedging (None = the observed `quantile` latency)
+        window: recent latencies the quantile is taken over; min_samples: no hedging until this many are seen
+        max_extra: hedged requests allowed per primary request (0.1 = at most 10% extra requests)
+        """
+        self.delay = delay
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.max_extra = max_extra
+        self.primaries = 0
+        self.hedges = 0
+        self.wins = 0  # Hedges that answered before their primary
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        """Latency of a completed request (primary or hedge)"""
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def hedge_delay(self):
+        """Seconds to wait before hedging, or None while there are too few samples"""
+        if self.delay is not None:
+            return self.delay
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(self.quantile * len(ordered)))]
+
+    def start_primary(self):
+        with self._lock:
+            self.primaries += 1
+
+    def try_hedge(self):
+        """Take one hedge from the budget - False once hedges would exceed max_extra of the primaries"""
+        with self._lock:
+            if self.hedges + 1 > self.max_extra * self.primaries:
+                return False
+            self.hedges += 1
+            return True
+
+    def won(self):
+        with self._lock:
+            self.wins += 1
+
+    def report(self):
+        """One-line summary for the end of a run"""
+        delay = self.hedge_delay()
+        delay_text = f"{delay * 1000:.0f} ms" if delay is not None else 'not enough samples'
+        extra = self.hedges / self.primaries if self.primaries else 0.0
+        return (f"Hedging: {self.hedges} hedged of {self.primaries} requests ({extra:.1%} extra load, "
+                f"{self.wins} answered first; delay {delay_text})")
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Differential fuzzing of the Python mirror (mikud_utils.py) against the real extension JS
+Streams batches of generated inputs to one long-lived Node worker (js_worker.js) over a JSON-lines pipe
+and compares its answers with the Python functions, so millions of cases cost one process spawn
+"""
+
+import argparse
+import json
+import os
+import queue
+import random
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+from address_corpus import generate_addresses, generate_responses
+from mikud_utils import JS_WHITESPACE, build_url, parse_response, validate_address
+from normalize import address_key
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'js_worker.js')
+
+# Building blocks for fuzzed strings - weighted towards what real addresses and responses contain
+HEBREW = ''.join(chr(c) for c in range(0x05D0, 0x05EB))
+NIQQUD = ''.join(chr(c) for c in range(0x05B0, 0x05C8))
+ASCII = 'abcXYZ0123456789'
+PUNCTUATION = "'\"-.,/()!~*_%&=?#+;:׳״"
+# Look-alike quotes and dashes, bidi marks and the prefixes the normalizer rewrites
+NORMALIZER_EDGES = ['\u2018', '\u2019', '\u201c', '\u05be', '\u2013', '\u200f', '\u200b', '\u05f4', "''", 'רחוב ', "רח' ", "שד' ", 'קרית ',
+                    'כניסה ', '0', 'תל-אביב', 'ת"א']
+EXOTIC = ['\U0001F600', '\ud800', '\udc00', '‏', 'é']  # astral, lone surrogates, RLM, Latin-1
+LENGTH_EDGES = [0, 1, 2, 3, 19, 20, 21, 99, 100, 101]
+
+
+def node_available(node='node'):
+    return shutil.which(node) is not None
+
+
+class NodeWorker:
+    """One Node process running js_worker.js; requests and responses are JSON lines"""
+
+    def __init__(self, node='node', script=WORKER_SCRIPT):
+        self.process = subprocess.Popen(
+            [node, script], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            encoding='utf-8', bufsize=1 << 16,
+        )
+
+    def send(self, request_id, module, method, cases):
+        # ensure_ascii keeps lone surrogates encodable; JSON.parse turns the escapes back into them
+        self.process.stdin.write(json.dumps({'id': request_id, 'module': module, 'method': method, 'cases': cases}) + '\n')
+
+    def flush(self):
+        self.process.stdin.flush()
+
+    def receive(self):
+        line = self.process.stdout.readline()
+        if not line:
+            raise RuntimeError(f"Node worker exited: {self.process.stderr.read().strip()}")
+        response = json.loads(line)
+        if 'fatal' in response:
+            raise RuntimeError(response['fatal'])
+        return response
+
+    def call(self, module, method, cases):
+        """Run one batch synchronously and return its results"""
+        self.send(0, module, method, cases)
+        self.flush()
+        return self.receive()['results']
+
+    def close(self):
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.process.stdout.close()
+        self.process.stderr.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def fuzz_text(rng, max_length=12):
+    """Random string mixing Hebrew, niqqud, ASCII, punctuation, JS whitespace and the occasional exotic character"""
+    chars = []
+    for _ in range(rng.randint(0, max_length)):
+        draw = rng.random()
+        if draw < 0.45:
+            chars.append(rng.choice(HEBREW))
+        elif draw < 0.65:
+            chars.append(rng.choice(ASCII))
+        elif draw < 0.78:
+            chars.append(' ')
+        elif draw < 0.88:
+            chars.append(rng.choice(PUNCTUATION))
+        elif draw < 0.94:
+            chars.append(rng.choice(JS_WHITESPACE))
+        elif draw < 0.98:
+            chars.append(rng.choice(NIQQUD))
+        else:
+            chars.append(rng.choice(EXOTIC))
+    text = ''.join(chars)
+    # Adjacent surrogate halves are one astral character to JS - give Python the same string
+    return text.encode('utf-16-le', 'surrogatepass').decode('utf-16-le', 'surrogatepass')
+
+
+def url_cases(rng, count):
+    """(city, street, house, entrance) - half realistic, half fuzzed"""
+    realistic = generate_addresses(count, rng.random())
+    cases = []
+    for address in realistic:
+        if rng.random() < 0.5:
+            cases.append(list(address))
+        else:
+            cases.append([fuzz_text(rng), fuzz_text(rng), fuzz_text(rng, 4), fuzz_text(rng, 3)])
+    return cases
+
+
+def response_cases(rng, count):
+    """Response bodies: the SearchZip shapes plus digit runs glued to words, whitespace and junk"""
+    realistic = generate_responses(count, rng.random())
+    cases = []
+    for text in realistic:
+        if rng.random() < 0.5:
+            cases.append([text])
+            continue
+        pieces = []
+        for _ in range(rng.randint(1, 5)):
+            draw = rng.random()
+            if draw < 0.3:
+                pieces.append('RES' + ''.join(rng.choice('0123456789') for _ in range(rng.randint(0, 9))))
+            elif draw < 0.6:
+                pieces.append(''.join(rng.choice('0123456789') for _ in range(rng.randint(3, 9))))
+            else:
+                pieces.append(fuzz_text(rng, 6))
+        cases.append([''.join(pieces)])
+    return cases
+
+
+def validation_cases(rng, count):
+    """Field values around the length limits (in UTF-16 units), blanks and the odd non-string"""
+    def field():
+        draw = rng.random()
+        if draw < 0.05:
+            return rng.choice([None, 0, 7, True])
+        if draw < 0.6:
+            char = rng.choice(HEBREW + ASCII + ' ' + JS_WHITESPACE + '\U0001F600')
+            return char * rng.choice(LENGTH_EDGES)
+        return fuzz_text(rng, 25)
+    return [[field(), field(), field(), field()] for _ in range(count)]
+
+
+def normalize_cases(rng, count):
+    """Addresses with look-alike punctuation, invisible marks and abbreviation prefixes spliced in"""
+    def field(max_length):
+        pieces = [fuzz_text(rng, max_length)]
+        for _ in range(rng.randint(0, 3)):
+            pieces.insert(rng.randint(0, len(pieces)), rng.choice(NORMALIZER_EDGES))
+        return ''.join(pieces)
+    return [[field(8), field(8), field(3), field(3)] for _ in range(count)]
+
+
+# name -> (JS module, JS method, Python function, case generator)
+TARGETS = {
+    'build_url': ('api', 'buildUrl', build_url, url_cases),
+    'parse_response': ('api', 'parseResponse', parse_response, response_cases),
+    'validate_address': ('validation', 'validateAddress', validate_address, validation_cases),
+    'address_key': ('normalize', 'addressKey', address_key, normalize_cases),
+}
+
+
+def _python_result(function, args):
+    try:
+        return {'ok': function(*args)}
+    except Exception as e:
+        return {'error': f"{type(e).__name__}: {e}"}
+
+
+def _same(python, js):
+    """Results agree when both raised, or both returned equal JSON values"""
+    if 'error' in python or 'error' in js:
+        return ('error' in python) == ('error' in js)
+    if python['ok'] == js['ok']:
+        return True
+    # Surrogate halves that end up adjacent are one astral character to JS - compare as UTF-16 (ASCII JSON)
+    return json.dumps(python['ok'], sort_keys=True) == json.dumps(js['ok'], sort_keys=True)
+
+
+def run_differential(cases=100000, batch_size=1000, seed=0, only=None, max_examples=5, node='node'):
+    """
+    Compare the Python mirror with the JS on `cases` generated inputs split across TARGETS
+    A writer thread streams batches to Node while the caller's thread runs the Python side and compares
+    Returns {'targets': {name: {'cases', 'mismatches', 'examples'}}, 'elapsed_sec', 'cases_per_sec'}
+    """
+    names = [name for name in TARGETS if not only or name in only]
+    per_target = -(-cases // len(names))
+    report = {name: {'cases': 0, 'mismatches': 0, 'examples': []} for name in names}
+    in_flight = queue.Queue(maxsize=8)  # Bounds how far the writer runs ahead of the comparison
+    writer_error = []
+
+    def batches():
+        rng = random.Random(seed)
+        sent = dict.fromkeys(names, 0)
+        request_id = 0
+        while any(sent[name] < per_target for name in names):
+            for name in names:
+                size = min(batch_size, per_target - sent[name])
+                if size <= 0:
+                    continue
+                request_id += 1
+                sent[name] += size
+                yield request_id, name, TARGETS[name][3](rng, size)
+
+    start = time.perf_counter()
+    with NodeWorker(node) as worker:
+        def write():
+            try:
+                for request_id, name, batch in batches():
+                    module, method = TARGETS[name][:2]
+                    in_flight.put((request_id, name, batch))
+                    worker.send(request_id, module, method, batch)
+                    worker.flush()  # A batch left in our buffer would leave the reader waiting on it
+            except Exception as e:
+                writer_error.append(e)
+            finally:
+                in_flight.put(None)
+
+        writer = threading.Thread(target=write, daemon=True)
+        writer.start()
+        while True:
+            item = in_flight.get()
+            if item is None:
+                break
+            request_id, name, batch = item
+            response = worker.receive()
+            assert response['id'] == request_id, "Node worker answered out of order"
+            function = TARGETS[name][2]
+            stats = report[name]
+            for args, js in zip(batch, response['results']):
+                python = _python_result(function, args)
+                stats['cases'] += 1
+                if not _same(python, js):
+                    stats['mismatches'] += 1
+                    if len(stats['examples']) < max_examples:
+                        stats['examples'].append({'args': args, 'python': python, 'js': js})
+        writer.join()
+    if writer_error:
+        raise writer_error[0]
+
+    elapsed = time.perf_counter() - start
+    total = sum(stats['cases'] for stats in report.values())
+    return {'targets': report, 'elapsed_sec': round(elapsed, 3), 'cases_per_sec': round(total / elapsed, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Differential fuzzing of mikud_utils.py against utils/*.js')
+    parser.add_argument('--cases', type=int, default=1000000, help='Total generated cases (default: 1000000)')
+    parser.add_argument('--batch-size', type=int, default=2000, help='Cases per pipe message (default: 2000)')
+    parser.add_argument('--seed', type=int, default=0, help='Generator seed (default: 0)')
+    parser.add_argument('--only', nargs='*', choices=list(TARGETS), help='Fuzz only these functions')
+    parser.add_argument('--max-examples', type=int, default=5, help='Mismatches kept per function (default: 5)')
+    parser.add_argument('--node', default='node', help='Node executable (default: node)')
+    parser.add_argument('--report', help='Write the full report (with mismatching inputs) to this JSON file')
+    args = parser.parse_args()
+
+    if not node_available(args.node):
+        print(f"❌ Node not found ({args.node}) - install Node.js to run the differential fuzzer")
+        return 1
+
+    print("=" * 60)
+    print(f"Differential fuzzing: {args.cases:,} cases, seed {args.seed}")
+    print("=" * 60)
+    result = run_differential(args.cases, args.batch_size, args.seed, args.only, args.max_examples, args.node)
+
+    print(f"  {'Function':<20}{'Cases':>12}{'Mismatches':>12}")
+    for name, stats in result['targets'].items():
+        print(f"  {name:<20}{stats['cases']:>12,}{stats['mismatches']:>12,}")
+    print(f"\n  {result['cases_per_sec']:,.0f} cases/sec over {result['elapsed_sec']:.1f}s")
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        print(f"  Report saved to {args.report}")
+
+    mismatched = {name: stats for name, stats in result['targets'].items() if stats['mismatches']}
+    for name, stats in mismatched.items():
+        print(f"\n❌ {name}: {stats['mismatches']} mismatches, e.g.")
+        for example in stats['examples']:
+            print(f"   args={example['args']!r}")
+            print(f"     python={example['python']!r}")
+            print(f"     js    ={example['js']!r}")
+    if mismatched:
+        return 1
+    print("\n✅ Python mirror matches the extension JS on every case")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Pool of headless WebDriver workers for parallel website-vs-API comparisons
+Each worker process keeps one ZipCodeTester and recycles its browser after K uses or a crash
+"""
+
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.util import Finalize
+
+from batch_resolver import RateLimiter
+from browser import DEFAULT_LEAN_TYPES
+from page_waits import merge_timings
+from phase_timing import PhaseTimer
+
+# Per-process worker state, set up by _init_worker
+_tester = None
+_uses = 0
+_config = {}
+_limiter = None
+
+
+class PoolRateLimiter(RateLimiter):
+    """RateLimiter whose next free slot is in shared memory, so the ceiling holds across the pool's processes"""
+
+    def __init__(self, rate=None):
+        super().__init__(rate)
+        self._shared_slot = multiprocessing.Value('d', 0.0)
+
+    def _reserve(self):
+        if not self.rate:
+            return 0.0
+        with self._shared_slot.get_lock():
+            # CLOCK_MONOTONIC is system-wide, so every worker on this machine reads the same clock
+            now = time.monotonic()
+            slot = max(now, self._shared_slot.value)
+            self._shared_slot.value = slot + 1.0 / self.rate
+        return slot - now
+
+
+def _init_worker(headless, max_uses, limiter, cache_path, timings, capture_network, lean, block_types, api_deadline,
+                 website_deadline, hedge, tester_factory):
+    """Create the worker's tester once per process"""
+    global _tester, _uses, _limiter
+    if tester_factory is None:
+        from test_api_vs_website import ZipCodeTester as tester_factory
+
+    _config.update(max_uses=max_uses)
+    _limiter = limiter
+    _tester = tester_factory(headless=headless, cache_path=cache_path, timer=PhaseTimer(enabled=timings),
+                             capture_network=capture_network, lean=lean, block_types=block_types,
+                             api_deadline=api_deadline, website_deadline=website_deadline, hedge=hedge,
+                             screenshot_path=f"error_screenshot_{os.getpid()}.png")
+    _uses = 0
+    # Pool workers exit without running atexit hooks; Finalize makes sure Chrome is shut down
+    Finalize(_tester, _tester.close, exitpriority=10)
+
+
+def _cache_counts():
+    cache = _tester.client.cache
+    return (cache.hits, cache.misses) if cache is not None else (0, 0)
+
+
+def _compare_case(test_case):
+    """Run one comparison in a worker - returns (comparison, stats)"""
+    global _uses
+    recycled = False
+    if _uses >= _config['max_uses']:
+        _tester.restart_driver()
+        _uses = 0
+        recycled = True
+
+    _limiter.wait()  # Be gentle with the site - one ceiling for the whole pool, not a sleep per worker
+    hits, misses = _cache_counts()
+    comparison = _tester.compare_results(
+        test_case['city'],
+        test_case['street'],
+        test_case['house'],
+        test_case.get('entrance', '')
+    )
+    _uses += 1
+
+    # search_via_website swallows exceptions, so check the session directly after failures
+    if 'error' in comparison['website'] and not _tester.driver_alive():
+        print("[Pool] Browser session lost, restarting driver")
+        _tester.restart_driver()
+        _uses = 0
+        recycled = True
+
+    new_hits, new_misses = _cache_counts()
+    stats = {
+        'cache_hits': new_hits - hits,
+        'cache_misses': new_misses - misses,
+        'recycled': recycled,
+        'steps': _tester.waits.drain(),
+        'phases': _tester.timer.drain()
+    }
+    return comparison, stats
+
+
+def iter_comparisons(indexed_cases, workers=2, max_uses=25, rate=0.5, headless=True, cache_path='zip_cache.sqlite3',
+                     timings=False, capture_network=False, lean=False, block_types=DEFAULT_LEAN_TYPES,
+                     api_deadline=None, website_deadline=None, hedge=False, tester_factory=None):
+    """
+    Run compare_results for (index, test_case) pairs across worker processes
+    Yields (index, comparison, stats) in input order, keeping at most 2 cases per worker queued
+    rate: comparisons started per second across all workers (None = as fast as the browsers go)
+    timings: collect per-phase histograms in the workers (returned in stats['phases'])
+    capture_network: read website zips from the site's XHR/fetch responses (see network_capture.py)
+    lean: block block_types and third-party hosts and reuse the loaded form between searches
+    api_deadline / website_deadline: end-to-end seconds per lookup on each path; hedge: hedge API requests
+    tester_factory: picklable callable building the worker's tester (defaults to ZipCodeTester)
+    """
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(headless, max_uses, PoolRateLimiter(rate), cache_path, timings, capture_network,
+                                       lean, block_types, api_deadline, website_deadline, hedge,
+                                       tester_factory)) as executor:
+        window = deque()
+        for index, test_case in indexed_cases:
+            window.append((index, executor.submit(_compare_case, test_case)))
+            if len(window) >= workers * 2:
+                index, future = window.popleft()
+                yield (index, *future.result())
+        while window:
+            index, future = window.popleft()
+            yield (index, *future.result())
+
+
+def run_comparisons(test_cases, sink=None, **pool_options):
+    """
+    Run every test case on the pool, streaming each comparison to the sink as it completes
+    Cases the sink already holds are skipped; without a sink results are collected in memory
+    Returns (results or None when streaming, summary stats)
+    """
+    summary = {'cache_hits': 0, 'cache_misses': 0, 'recycled': 0, 'steps': {}, 'phases': PhaseTimer()}
+    results = [] if sink is None else None
+
+    indexed_cases = (
+        (index, test_case) for index, test_case in enumerate(test_cases)
+        if sink is None or not sink.is_done(index)
+    )
+    for index, comparison, stats in iter_comparisons(indexed_cases, **pool_options):
+        if sink is not None:
+            sink.write(index, comparison)
+        else:
+            results.append(comparison)
+        summary['cache_hits'] += stats['cache_hits']
+        summary['cache_misses'] += stats['cache_misses']
+        summary['recycled'] += stats['recycled']
+        merge_timings(summary['steps'], stats['steps'])
+        summary['phases'].merge(stats['phases'])
+
+    summary['phases'] = summary['phases'].snapshot()
+    return results, summary
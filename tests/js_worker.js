@@ -0,0 +1,36 @@
+// Long-lived Node worker for differential testing (driven by differential.py)
+// Loads the real extension modules from utils/ and answers JSON-lines batches on stdin:
+//   request:  {"id": 1, "module": "api", "method": "buildUrl", "cases": [[arg, ...], ...]}
+//   response: {"id": 1, "results": [{"ok": value} | {"error": "URIError: URI malformed"}, ...]}
+
+const path = require('path');
+const readline = require('readline');
+
+const MODULES = {
+  api: require(path.join(__dirname, '..', 'utils', 'api.js')),
+  validation: require(path.join(__dirname, '..', 'utils', 'validation.js')),
+  normalize: require(path.join(__dirname, '..', 'utils', 'normalize.js'))
+};
+
+const input = readline.createInterface({ input: process.stdin, crlfDelay: Infinity });
+
+input.on('line', (line) => {
+  if (!line) return;
+  const request = JSON.parse(line);
+  const target = MODULES[request.module];
+  let response;
+  if (!target || typeof target[request.method] !== 'function') {
+    response = { id: request.id, fatal: `Unknown method ${request.module}.${request.method}` };
+  } else {
+    const method = target[request.method];
+    const results = request.cases.map((args) => {
+      try {
+        return { ok: method.apply(target, args) };
+      } catch (error) {
+        return { error: `${error.name}: ${error.message}` };
+      }
+    });
+    response = { id: request.id, results };
+  }
+  process.stdout.write(JSON.stringify(response) + '\n');
+});
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Load-generation harness for the API lookup path
+Drives ZipClient.lookup with N concurrent workers for a fixed duration and reports throughput, tail latency,
+errors and cache hit ratio - against the local stub_server.py by default, or a recorded trace replayed through it
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from address_corpus import generate_addresses
+from mikud_utils import API_BASE_URL
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an ascending list (q in 0..100)"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * q // 100))  # ceil without floats
+    return sorted_values[min(len(sorted_values), rank) - 1]
+
+
+def classify(result):
+    """Outcome of one ZipClient.lookup result: ok, not_found, captcha, http_<code>, timeout, connection or error"""
+    if result.get('valid'):
+        return 'ok'
+    if result.get('blocked') and 'raw' in result:
+        return 'captcha'
+    error = result.get('error')
+    if error is None:
+        return 'not_found'
+    status = error.split(' ', 1)[0]
+    if status.isdigit() and len(status) == 3:
+        return f"http_{status}"  # requests.HTTPError: "429 Client Error: ..."
+    lowered = error.lower()
+    if 'timed out' in lowered or 'timeout' in lowered:
+        return 'timeout'
+    if 'connection' in lowered:
+        return 'connection'
+    return 'error'
+
+
+class LoadStats:
+    """Thread-safe latency samples and outcome counts"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.outcomes = {}
+
+    def record(self, latency, outcome):
+        with self.lock:
+            self.latencies.append(latency)
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+    def summary(self, elapsed, cache=None, hedge=None):
+        """Summary dict: throughput, latency percentiles (ms), outcome breakdown, cache hit ratio and hedging"""
+        with self.lock:
+            latencies = sorted(self.latencies)
+            outcomes = dict(sorted(self.outcomes.items()))
+        completed = len(latencies)
+        failed = sum(count for outcome, count in outcomes.items() if outcome not in ('ok', 'not_found'))
+        latency_ms = {f"p{q}": round(percentile(latencies, q) * 1000, 2) if latencies else None for q in PERCENTILES}
+        latency_ms['max'] = round(latencies[-1] * 1000, 2) if latencies else None
+        latency_ms['mean'] = round(sum(latencies) / completed * 1000, 2) if latencies else None
+        return {
+            'requests': completed,
+            'elapsed_sec': round(elapsed, 3),
+            'throughput_rps': round(completed / elapsed, 2) if elapsed else 0.0,
+            'latency_ms': latency_ms,
+            'outcomes': outcomes,
+            'error_rate': round(failed / completed, 4) if completed else 0.0,
+            'cache': None if cache is None else {
+                'hits': cache.hits,
+                'lookups': cache.hits + cache.misses,
+                'hit_ratio': round(cache.hit_ratio, 4),
+            },
+            'hedging': None if hedge is None else {
+                'requests': hedge.primaries,
+                'hedges': hedge.hedges,
+                'wins': hedge.wins,
+                'extra_ratio': round(hedge.hedges / hedge.primaries, 4) if hedge.primaries else 0.0,
+            },
+        }
+
+
+def address_mix(base_addresses, repeat_ratio=0.0, seed=0):
+    """
+    Endless stream of addresses: cycles through base_addresses in a shuffled order
+    repeat_ratio: fraction of draws that re-use an address already sent, to exercise the cache
+    """
+    rng = random.Random(seed)
+    pool = list(base_addresses)
+    sent = []  # Each address once, in the order first sent - bounded by the pool
+    unsent = set(pool)
+    while True:
+        rng.shuffle(pool)
+        for address in pool:
+            # Once every address has gone out, the whole pool counts as already sent
+            repeats = sent if unsent else pool
+            if repeats and rng.random() < repeat_ratio:
+                yield rng.choice(repeats)
+            else:
+                if address in unsent:
+                    unsent.remove(address)
+                    sent.append(address)
+                yield address
+
+
+def run_load(lookup, addresses, concurrency=8, duration=10.0, max_requests=None, on_progress=None):
+    """
+    Call lookup(city, street, house, entrance) from `concurrency` threads until `duration` seconds
+    or `max_requests` lookups have passed. addresses: iterator shared by the workers
+    on_progress(stats, elapsed): called about once a second from the main thread
+    Returns (LoadStats, elapsed seconds)
+    """
+    stats = LoadStats()
+    source_lock = threading.Lock()
+    issued = [0]
+    start = time.perf_counter()
+    deadline = start + duration
+
+    def next_address():
+        with source_lock:
+            if time.perf_counter() >= deadline or (max_requests and issued[0] >= max_requests):
+                return None
+            issued[0] += 1
+            return next(addresses, None)
+
+    def worker():
+        while True:
+            address = next_address()
+            if address is None:
+                return
+            began = time.perf_counter()
+            try:
+                result = lookup(*address)
+            except Exception as e:
+                result = {'valid': False, 'error': str(e)}
+            stats.record(time.perf_counter() - began, classify(result))
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, concurrency))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(timeout=1.0)
+            if on_progress:
+                on_progress(stats, time.perf_counter() - start)
+    return stats, time.perf_counter() - start
+
+
+def format_table(summary, previous=None):
+    """Render a summary (and the change vs a previous run's summary) as a text table"""
+    rows = [('Requests', summary['requests'], None),
+            ('Throughput (req/s)', summary['throughput_rps'], 'throughput_rps')]
+    for name in [f"p{q}" for q in PERCENTILES] + ['max']:
+        rows.append((f"Latency {name} (ms)", summary['latency_ms'][name], ('latency_ms', name)))
+    rows.append(('Error rate', f"{summary['error_rate']:.2%}", None))
+    if summary['cache']:
+        rows.append(('Cache hit ratio', f"{summary['cache']['hit_ratio']:.1%}", None))
+    if summary.get('hedging'):
+        rows.append(('Hedged requests', f"{summary['hedging']['extra_ratio']:.1%}", None))
+
+    lines = [f"  {'Metric':<22}{'Value':>14}" + (f"{'vs previous':>14}" if previous else '')]
+    for label, value, path in rows:
+        line = f"  {label:<22}{value if value is not None else '-':>14}"
+        if previous:
+            change = '-'
+            if path:
+                before = previous[path[0]][path[1]] if isinstance(path, tuple) else previous[path]
+                if before and value is not None:
+                    change = f"{value / before - 1:+.1%}"
+            line += f"{change:>14}"
+        lines.append(line)
+
+    lines.append('  Outcomes: ' + ', '.join(f"{outcome}={count}" for outcome, count in summary['outcomes'].items()))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the API lookup path')
+    parser.add_argument('--target', default='stub',
+                        help="'stub' to start stub_server.py in-process (default), or a SearchZip base URL")
+    parser.add_argument('--allow-production', action='store_true', help='Allow --target at the live endpoint')
+    parser.add_argument('--trace', help='Recorded results (JSON/JSONL, e.g. probe_results.jsonl) to replay: '
+                                        'seeds the stub, supplies the address mix and, with latency_ms fields, the latency')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent lookups (default: 8)')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds to run (default: 10)')
+    parser.add_argument('--requests', type=int, help='Stop after this many lookups')
+    parser.add_argument('--addresses', type=int, default=1000, help='Distinct synthetic addresses without --trace')
+    parser.add_argument('--repeat-ratio', type=float, default=0.0,
+                        help='Fraction of lookups re-using an earlier address (exercises the cache)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the address mix and stub faults')
+    parser.add_argument('--cache', default='', help="Response cache path ('' = fresh temporary cache, 'none' = off)")
+    parser.add_argument('--latency', help='Stub latency spec (see stub_server.py --help)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Stub HTTP 500 rate')
+    parser.add_argument('--captcha-rate', type=float, default=0.0, help='Stub CAPTCHA page rate')
+    parser.add_argument('--throttle-rps', type=float, help='Stub 429 threshold')
+    parser.add_argument('--deadline', type=float, help='End-to-end seconds per lookup (default: none)')
+    parser.add_argument('--hedge', action='store_true',
+                        help='Send a second request when the first has no answer after the observed p95')
+    parser.add_argument('--hedge-max-extra', type=float, default=0.1,
+                        help='Cap on hedged requests as a fraction of all requests (default: 0.1)')
+    parser.add_argument('--json', help='Write the run configuration and summary to this file')
+    parser.add_argument('--compare', help='Previous --json output to compare against')
+    args = parser.parse_args()
+
+    from deadlines import HedgePolicy
+    from response_cache import ResponseCache
+    from stub_server import StubConfig, load_records, seed_from_records, start_in_thread
+    from zip_client import ZipClient
+
+    records = load_records(args.trace) if args.trace else []
+    if records:
+        base_addresses = [(r['city'], r['street'], str(r['house']), r.get('entrance', '')) for r in records]
+    else:
+        base_addresses = list(generate_addresses(args.addresses, args.seed))
+
+    server = None
+    if args.target == 'stub':
+        latency = args.latency
+        trace_latencies = [str(r['latency_ms']) for r in records if r.get('latency_ms') is not None]
+        if latency is None and trace_latencies:
+            latency = 'empirical:' + ','.join(trace_latencies)
+        server, base_url = start_in_thread(StubConfig(
+            seed=seed_from_records(records), synthetic=not records, latency=latency, error_rate=args.error_rate,
+            captcha_rate=args.captcha_rate, throttle_rps=args.throttle_rps, random_seed=args.seed,
+        ))
+    else:
+        base_url = args.target
+        if base_url.rstrip('/') == API_BASE_URL and not args.allow_production:
+            print("❌ Refusing to load-test the live SearchZip endpoint without --allow-production")
+            return 1
+
+    cache_dir = None
+    if args.cache == 'none':
+        cache = None
+    elif args.cache:
+        cache = ResponseCache(args.cache)
+    else:
+        cache_dir = tempfile.TemporaryDirectory()
+        cache = ResponseCache(os.path.join(cache_dir.name, 'load_cache.sqlite3'))
+
+    # No retries: the harness measures what one lookup costs, and retried errors would hide in the latency
+    client = ZipClient(base_url=base_url, max_connections_per_host=args.concurrency,
+                       read_timeout=10, max_retries=0, cache=cache, deadline=args.deadline,
+                       hedge=HedgePolicy(max_extra=args.hedge_max_extra) if args.hedge else None)
+
+    print("=" * 60)
+    print(f"Load test: {args.concurrency} workers, {args.duration:g}s, {len(base_addresses)} addresses")
+    print(f"Target: {base_url}")
+    print("=" * 60)
+
+    def progress(stats, elapsed):
+        print(f"\r  {len(stats.latencies)} lookups, {len(stats.latencies) / elapsed:,.1f} req/s", end='', flush=True)
+
+    try:
+        stats, elapsed = run_load(client.lookup, address_mix(base_addresses, args.repeat_ratio, args.seed),
+                                  args.concurrency, args.duration, args.requests, progress)
+        print()
+        summary = stats.summary(elapsed, cache, client.hedge)
+    finally:
+        client.close()
+        if server is not None:
+            server.shutdown()
+        if cache_dir is not None:
+            cache_dir.cleanup()
+
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)['summary']
+    print(format_table(summary, previous))
+
+    if args.json:
+        config = {name: value for name, value in vars(args).items() if name not in ('json', 'compare')}
+        config['target'] = base_url if args.target != 'stub' else 'stub'
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'config': config, 'summary': summary}, f, indent=2, ensure_ascii=False)
+        print(f"\n✅ Summary saved to {args.json}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
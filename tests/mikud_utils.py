@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Python mirror of the extension's API and validation utilities (utils/api.js, utils/validation.js)
+Shared by the unit tests, integration tests and probing scripts
+"""
+
+import re
+from functools import lru_cache
+from urllib.parse import quote
+
+API_BASE_URL = "https://services.israelpost.co.il/zip_data.nsf/SearchZip"
+
+# Error the extension shows for a block page
+BLOCKED_ERROR = 'השרת חסם את הבקשה (CAPTCHA)'
+
+# Characters String.prototype.trim() removes (JS WhiteSpace + LineTerminator), which differ from str.strip()
+JS_WHITESPACE = ('\t\n\v\f\r \u00a0\u1680\u2000\u2001\u2002\u2003\u2004\u2005\u2006'
+                 '\u2007\u2008\u2009\u200a\u2028\u2029\u202f\u205f\u3000\ufeff')
+
+# Characters encodeURIComponent leaves alone, besides ASCII letters and digits
+URI_COMPONENT_SAFE = "-_.!~*'()"
+
+# Compiled once - JS \d and \b are ASCII-only, so match them with re.ASCII
+RES_PATTERN = re.compile(r'RES\d{5,}', re.ASCII)
+ZIP_PATTERN = re.compile(r'\b\d{5,7}\b', re.ASCII)
+ZIP_ONLY_PATTERN = re.compile(r'\d{5,7}', re.ASCII)
+
+
+def js_trim(text):
+    """Trim whitespace exactly like String.prototype.trim()"""
+    return text.strip(JS_WHITESPACE)
+
+
+@lru_cache(maxsize=65536)
+def encode_uri_component(text):
+    """Encode like JS encodeURIComponent (memoized - cities and house numbers repeat heavily in bulk jobs)"""
+    return quote(text, safe=URI_COMPONENT_SAFE)
+
+
+class _StreetEncodingTable(dict):
+    """str.translate table for the Street parameter, filled in one character at a time on first use"""
+
+    def __missing__(self, codepoint):
+        if codepoint > 0xFFFF:
+            # JS splits astral characters into surrogate halves and encodeURIComponent throws on them
+            raise ValueError('URI malformed')
+        char = chr(codepoint)
+        encoded = char if (char == ' ' or (char.isascii() and char.isalnum())) else encode_uri_component(char)
+        self[codepoint] = encoded
+        return encoded
+
+
+STREET_TABLE = _StreetEncodingTable()
+
+
+def encode_param(param, preserve_spaces=False):
+    """Encode a query parameter - matches the extension's encodeParam()"""
+    if preserve_spaces:
+        # For Street: keep spaces and ASCII letters/digits, encode everything else (incl. Hebrew) per character
+        return param.translate(STREET_TABLE)
+    # For other params: encode normally (matches JS encodeURIComponent)
+    return encode_uri_component(param)
+
+
+def build_url(city, street, house, entrance='', base_url=API_BASE_URL):
+    """Build the SearchZip URL - matches the extension's buildUrl()"""
+    encoded_city = encode_uri_component(js_trim(city))
+    encoded_street = js_trim(street).translate(STREET_TABLE)  # Critical: preserve spaces
+    encoded_house = encode_uri_component(js_trim(house))
+    encoded_entrance = encode_uri_component(js_trim(entrance or ''))
+
+    # API requires specific parameter order: House and Entrance before Street
+    return f"{base_url}?OpenAgent&Location={encoded_city}&POB=&House={encoded_house}&Entrance={encoded_entrance}&Street={encoded_street}"
+
+
+def parse_response(response_text):
+    """Extract zip codes from an API response - matches the extension's parseResponse()"""
+    if not response_text or not isinstance(response_text, str):
+        return []
+
+    trimmed = js_trim(response_text)
+
+    # Check for RES format: "RES73327233" -> "3327233" (skip "RES" and first digit)
+    # Extension uses substring(4) which skips first 4 chars: "RES" + first digit
+    res_match = RES_PATTERN.search(trimmed)
+    if res_match:
+        zip_code = res_match.group(0)[4:]  # Skip "RES" (3) + first digit (1) = 4 chars
+        if ZIP_ONLY_PATTERN.fullmatch(zip_code):
+            return [{'zipCode': zip_code, 'raw': trimmed}]
+
+    # Try regex extraction
+    matches = ZIP_PATTERN.findall(trimmed)
+    if matches:
+        return [{'zipCode': zip, 'raw': trimmed} for zip in matches]
+
+    # Check if entire response is a zip code
+    if ZIP_ONLY_PATTERN.fullmatch(trimmed):
+        return [{'zipCode': trimmed, 'raw': trimmed}]
+
+    return []
+
+
+def is_blocked_response(response_text):
+    """Detect a CAPTCHA / bot-block page - matches the checks in the extension's searchZipCode()"""
+    lower_text = response_text.lower()
+    return ('captcha' in lower_text or
+            'shieldsquare' in lower_text or
+            ('bot' in lower_text and 'blocked' in lower_text) or
+            'access denied' in lower_text)
+
+
+def parse_responses(response_texts):
+    """Parse a batch of API responses - same output as calling parse_response on each"""
+    parse = parse_response
+    return [parse(text) for text in response_texts]
+
+
+def js_length(text):
+    """String length as JS counts it (UTF-16 code units)"""
+    return len(text) if text.isascii() else len(text.encode('utf-16-le', 'surrogatepass')) // 2
+
+
+def validate_city(city):
+    """Validate city name - matches Validation.validateCity()"""
+    if not city or not isinstance(city, str):
+        return False
+    return 2 <= js_length(js_trim(city)) <= 100
+
+
+def validate_street(street):
+    """Validate street name (required) - matches Validation.validateStreet()"""
+    if not street or not isinstance(street, str):
+        return False
+    return 2 <= js_length(js_trim(street)) <= 100
+
+
+def validate_house_number(house_number):
+    """Validate house number (required) - matches Validation.validateHouseNumber()"""
+    if not house_number or not isinstance(house_number, str):
+        return False
+    return 1 <= js_length(js_trim(house_number)) <= 20
+
+
+def validate_entrance(entrance):
+    """Validate entrance (optional) - matches Validation.validateEntrance()"""
+    if not entrance or not isinstance(entrance, str):
+        return True  # Optional
+    return js_length(js_trim(entrance)) <= 20
+
+
+def validate_address(city, street='', house_number='', entrance=''):
+    """Validate a complete address - matches Validation.validateAddress()"""
+    errors = []
+    if not validate_city(city):
+        errors.append('שם העיר אינו תקין')
+    if not validate_street(street):
+        errors.append('שם הרחוב אינו תקין (חובה)')
+    if not validate_house_number(house_number):
+        errors.append('מספר הבית אינו תקין (חובה)')
+    if entrance and not validate_entrance(entrance):
+        errors.append('מספר הכניסה אינו תקין')
+    return {'valid': not errors, 'errors': errors}
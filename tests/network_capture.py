@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Read the website's zip code from its own XHR/fetch response via the Chrome DevTools Protocol
+Chrome's performance log reports every network event; once a matching response has finished loading its body is
+fetched with Network.getResponseBody, so the answer never depends on how the page renders it
+"""
+
+import base64
+import json
+import re
+import time
+
+from mikud_utils import RES_PATTERN, ZIP_ONLY_PATTERN, js_trim, parse_response
+
+# Resource types the search form's own requests show up as
+CAPTURED_TYPES = ('XHR', 'Fetch')
+
+# JSON keys that hold the zip code in a structured response
+ZIP_KEY_PATTERN = re.compile(r'zip|mikud|postal', re.IGNORECASE)
+
+
+# goog:loggingPrefs capability that turns on Chrome's performance log (network events) for a new session
+PERFORMANCE_LOGGING = {'performance': 'ALL'}
+
+
+def parse_log_entries(entries):
+    """Yield (method, params) for the DevTools events in driver.get_log('performance') entries"""
+    for entry in entries:
+        try:
+            message = json.loads(entry['message'])['message']
+        except (KeyError, TypeError, ValueError):
+            continue
+        yield message.get('method'), message.get('params', {})
+
+
+def _zip_in_json(value):
+    """First zip code under a zip-like key (depth first), or one in a SearchZip-style string"""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if ZIP_KEY_PATTERN.search(key) and isinstance(item, (str, int)) and not isinstance(item, bool):
+                text = js_trim(str(item))
+                if ZIP_ONLY_PATTERN.fullmatch(text):
+                    return text
+        for item in value.values():
+            found = _zip_in_json(item)
+            if found:
+                return found
+    elif isinstance(value, list):
+        for item in value:
+            found = _zip_in_json(item)
+            if found:
+                return found
+    elif isinstance(value, str) and RES_PATTERN.search(value):
+        parsed = parse_response(value)
+        return parsed[0]['zipCode'] if parsed else None
+    return None
+
+
+def zip_from_body(body):
+    """
+    Zip code from a captured response body, or None
+    JSON is searched by key; plain text must be a SearchZip "RES..." answer or a bare zip - never an
+    arbitrary 5-7 digit number found somewhere in the text
+    """
+    if not body:
+        return None
+    try:
+        data = json.loads(body)
+    except ValueError:
+        data = None
+    if isinstance(data, (dict, list)):
+        return _zip_in_json(data)
+    if isinstance(data, str):
+        body = data  # A JSON-encoded string is judged like plain text; bare numbers fall through as they are
+    trimmed = js_trim(body)
+    if RES_PATTERN.search(trimmed) or ZIP_ONLY_PATTERN.fullmatch(trimmed):
+        parsed = parse_response(trimmed)
+        return parsed[0]['zipCode'] if parsed else None
+    return None
+
+
+class ResponseTracker:
+    """Follows XHR/fetch requests through the event stream and reports the ones that finished loading"""
+
+    def __init__(self, url_pattern=None):
+        """url_pattern: optional regex the request URL must match (default: any XHR/fetch request)"""
+        self.url_pattern = re.compile(url_pattern) if url_pattern else None
+        self.pending = {}  # requestId -> URL, from requestWillBeSent/responseReceived until it finishes or fails
+
+    def _wanted(self, params, url):
+        return params.get('type') in CAPTURED_TYPES and (self.url_pattern is None or self.url_pattern.search(url))
+
+    def feed(self, method, params):
+        """Return (requestId, url) when a tracked response has finished loading, else None"""
+        if method == 'Network.requestWillBeSent':
+            url = params.get('request', {}).get('url', '')
+            if self._wanted(params, url):
+                self.pending[params['requestId']] = url
+        elif method == 'Network.responseReceived':
+            url = params.get('response', {}).get('url', '')
+            if self._wanted(params, url):
+                self.pending[params['requestId']] = url
+        elif method == 'Network.loadingFinished':
+            url = self.pending.pop(params.get('requestId'), None)
+            if url is not None:
+                return params['requestId'], url
+        elif method == 'Network.loadingFailed':
+            self.pending.pop(params.get('requestId'), None)
+        return None
+
+    def reset(self):
+        self.pending = {}
+
+
+class NetworkCapture:
+    def __init__(self, driver, url_pattern=None, poll_interval=0.05, idle_time=1.0):
+        """
+        driver: a Chrome WebDriver with PERFORMANCE_LOGGING (see browser.create_driver(capture_network=True))
+        url_pattern: optional regex restricting which responses are read
+        idle_time: give up once no tracked request is in flight and the network has been quiet this long
+        """
+        self.driver = driver
+        self.tracker = ResponseTracker(url_pattern)
+        self.poll_interval = poll_interval
+        self.idle_time = idle_time
+        self.driver.execute_cdp_cmd('Network.enable', {})
+
+    def clear(self):
+        """Drop the events logged so far (navigation, autocomplete) - call right before submitting"""
+        self.driver.get_log('performance')
+        self.tracker.reset()
+
+    def response_body(self, request_id):
+        """Body of a finished response as text, or None once Chrome has evicted it"""
+        try:
+            result = self.driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': request_id})
+        except Exception:
+            return None
+        body = result.get('body', '')
+        if result.get('base64Encoded'):
+            body = base64.b64decode(body).decode('utf-8', errors='replace')
+        return body
+
+    def wait_for_zip(self, timeout=10):
+        """
+        Wait for a captured response carrying a zip code
+        Returns {'zipCode', 'url'}, or None at the timeout or once no tracked request is in flight
+        and the network has been quiet for idle_time (the page answered some other way)
+        """
+        deadline = time.monotonic() + timeout
+        last_activity = time.monotonic()
+        while time.monotonic() < deadline:
+            for method, params in parse_log_entries(self.driver.get_log('performance')):
+                if method and method.startswith('Network.'):
+                    last_activity = time.monotonic()
+                finished = self.tracker.feed(method, params)
+                if finished is None:
+                    continue
+                request_id, url = finished
+                zip_code = zip_from_body(self.response_body(request_id))
+                if zip_code:
+                    return {'zipCode': zip_code, 'url': url}
+            if not self.tracker.pending and time.monotonic() - last_activity >= self.idle_time:
+                return None
+            time.sleep(self.poll_interval)
+        return None
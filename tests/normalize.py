@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Hebrew address normalization - Python mirror of utils/normalize.js
+Maps surface variants of one address (geresh vs apostrophe, niqqud, bidi marks, extra spaces, "רח'" prefixes,
+city aliases) to one canonical key. Keys are for dedup and caching only - lookups still send what the user typed
+"""
+
+import re
+
+from mikud_utils import JS_WHITESPACE
+
+# Invisible formatting characters: zero-width, bidi marks/embeddings/isolates, BOM, soft hyphen
+INVISIBLE = ''.join(map(chr, [0xad, *range(0x200b, 0x2010), *range(0x202a, 0x202f), *range(0x2066, 0x206a), 0xfeff]))
+
+# Niqqud and cantillation marks (maqaf, paseq and sof pasuq are punctuation and handled below)
+MARKS = ''.join(map(chr, [*range(0x0591, 0x05be), 0x05bf, 0x05c1, 0x05c2, 0x05c4, 0x05c5, 0x05c7]))
+
+# Geresh and apostrophe look-alikes -> '
+APOSTROPHES = ''.join(map(chr, [0x05f3, 0x2018, 0x2019, 0x201b, 0x2032, 0x60, 0xb4]))
+
+# Gershayim and curly double quotes -> " (a doubled apostrophe is replaced after translation)
+QUOTES = ''.join(map(chr, [0x05f4, 0x201c, 0x201d, 0x201f, 0x2033]))
+
+# Maqaf and dash look-alikes -> -
+DASHES = ''.join(map(chr, [0x05be, *range(0x2010, 0x2016), 0x2212]))
+
+# One str.translate pass does every single-character rewrite of normalize.js's clean(), in the same precedence
+CLEAN_TABLE = {
+    **{ord(char): ' ' for char in JS_WHITESPACE},
+    **{ord(char): "'" for char in APOSTROPHES},
+    **{ord(char): '"' for char in QUOTES},
+    **{ord(char): '-' for char in DASHES},
+    **{ord(char): None for char in INVISIBLE + MARKS},
+    **{ord(char): char.lower() for char in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'},
+}
+
+# Most fields need no translation at all, and a search is cheaper than translating character by character
+NEEDS_TRANSLATION_PATTERN = re.compile('[' + re.escape(''.join(map(chr, CLEAN_TABLE)).replace(' ', '')) + ']')
+
+HYPHEN_SPACING_PATTERN = re.compile(' ?- ?')
+
+LEADING_ZEROS_PATTERN = re.compile(r'^0+(?=\d)', re.ASCII)
+
+# Generic "street" prefixes, possibly repeated ("רח' רחוב הגפן")
+STREET_PREFIX_PATTERN = re.compile(r"^(?:(?:רחוב|רח'|רח\.) )+(?=[^ ])")
+
+# Alternative spellings and common abbreviations -> canonical city name (keys are already cleaned)
+CITY_ALIASES = {
+    'תל אביב-יפו': 'תל אביב',
+    'תל אביב יפו': 'תל אביב',
+    'תל-אביב': 'תל אביב',
+    'תל-אביב-יפו': 'תל אביב',
+    'ת"א': 'תל אביב',
+    'ת"א-יפו': 'תל אביב',
+    'י-ם': 'ירושלים',
+    'פתח תקוה': 'פתח תקווה',
+    'פ"ת': 'פתח תקווה',
+    'ב"ש': 'באר שבע',
+    'ראשל"צ': 'ראשון לציון',
+    'מודיעין': 'מודיעין-מכבים-רעות',
+}
+
+KEY_SEPARATOR = '\x1f'
+
+
+def clean(text):
+    """Canonical punctuation and spacing shared by every field (non-strings become '')"""
+    if not text or not isinstance(text, str):
+        return ''
+    if NEEDS_TRANSLATION_PATTERN.search(text):
+        text = text.translate(CLEAN_TABLE)
+    if "''" in text:
+        text = text.replace("''", '"')
+    if '  ' in text or text[:1] == ' ' or text[-1:] == ' ':
+        text = ' '.join(filter(None, text.split(' ')))
+    if '-' in text:
+        text = HYPHEN_SPACING_PATTERN.sub('-', text)
+    return text
+
+
+def normalize_city(city):
+    cleaned = clean(city)
+    if cleaned.startswith('קרית '):
+        cleaned = 'קריית ' + cleaned[5:]
+    return CITY_ALIASES.get(cleaned, cleaned)
+
+
+def normalize_street(street):
+    cleaned = clean(street)
+    if cleaned.startswith('רח'):
+        cleaned = STREET_PREFIX_PATTERN.sub('', cleaned)
+    if cleaned.startswith(("שד' ", 'שד. ')):
+        cleaned = 'שדרות ' + cleaned[4:]
+    return cleaned
+
+
+def normalize_house(house):
+    # "7 א" and "07" are the same house as "7א" and "7"
+    cleaned = clean(house).replace(' ', '')
+    return LEADING_ZEROS_PATTERN.sub('', cleaned) if cleaned.startswith('0') else cleaned
+
+
+def normalize_entrance(entrance):
+    # "כניסה א'" -> "א"
+    cleaned = clean(entrance)
+    if cleaned.startswith('כניסה'):
+        cleaned = cleaned[6:] if cleaned.startswith('כניסה ') else cleaned[5:]
+    if cleaned.endswith("'"):
+        cleaned = cleaned[:-1]
+    return cleaned.replace(' ', '')
+
+
+def address_key(city, street, house, entrance=''):
+    """Canonical key for an address, in API parameter order (Location, House, Entrance, Street)"""
+    return KEY_SEPARATOR.join([
+        normalize_city(city),
+        normalize_house(house),
+        normalize_entrance(entrance),
+        normalize_street(street),
+    ])
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Explicit wait conditions for the website form
+Replaces fixed sleeps with condition polling and records how long each step took
+"""
+
+import time
+from contextlib import contextmanager
+
+from deadlines import NO_DEADLINE
+from phase_timing import NULL_TIMER
+
+# Fixed sleeps the old search_via_website spent per address: navigation, city/street/house and the search -
+# plus LEGACY_ENTRANCE_SLEEP_SECONDS when an entrance was filled in
+LEGACY_SLEEP_SECONDS = 2 + 3 * 0.5 + 3
+LEGACY_ENTRANCE_SLEEP_SECONDS = 0.5
+
+# Autocomplete suggestion lists used by the form's comboboxes
+AUTOCOMPLETE_SCRIPT = """
+return document.querySelectorAll(
+  '[role="listbox"] [role="option"], ul.ui-autocomplete li, .autocomplete-suggestions > *, datalist option'
+).length;
+"""
+
+# Attribute on result nodes that still show the previous search's answer
+STALE_ATTRIBUTE = 'data-mikud-stale'
+
+# Tags the current result nodes (arguments: XPath selectors) just before a submit. A MutationObserver drops the tag
+# from any node the site then re-renders, so an answer equal to the previous one still counts as new
+MARK_STALE_SCRIPT = """
+const selectors = arguments[0];
+const attribute = '%s';
+if (window.__mikudResultObserver) window.__mikudResultObserver.disconnect();
+for (const selector of selectors) {
+  const nodes = document.evaluate(selector, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+  for (let i = 0; i < nodes.snapshotLength; i++) nodes.snapshotItem(i).setAttribute(attribute, '1');
+}
+window.__mikudResultObserver = new MutationObserver(records => {
+  for (const record of records) {
+    for (let node = record.target; node; node = node.parentNode) {
+      if (node.nodeType === 1 && node.hasAttribute(attribute)) node.removeAttribute(attribute);
+    }
+  }
+});
+window.__mikudResultObserver.observe(document.body, {childList: true, subtree: true, characterData: true});
+""" % STALE_ATTRIBUTE
+
+# Counts fetch/XHR requests in flight (a resource-timing entry only appears once a request has finished) and
+# empties the resource-timing buffer, which stops recording at 250 entries on a long-lived page. Run per submit
+TRACK_NETWORK_SCRIPT = """
+performance.clearResourceTimings();
+if (!window.__mikudNet) {
+  const net = window.__mikudNet = {started: 0, inFlight: 0};
+  const begin = () => { net.started++; net.inFlight++; };
+  const end = () => { net.inFlight = Math.max(0, net.inFlight - 1); };
+  const fetch = window.fetch;
+  if (fetch) {
+    window.fetch = function () { begin(); return fetch.apply(this, arguments).finally(end); };
+  }
+  const send = XMLHttpRequest.prototype.send;
+  XMLHttpRequest.prototype.send = function () {
+    begin();
+    this.addEventListener('loadend', end);
+    return send.apply(this, arguments);
+  };
+}
+"""
+
+# [requests started or finished, fetch/XHR requests still in flight] - idle once the first stops changing
+# and the second is 0
+NETWORK_STATE_SCRIPT = """
+const net = window.__mikudNet || {started: 0, inFlight: 0};
+return [net.started + performance.getEntriesByType('resource').length, net.inFlight];
+"""
+
+
+class WaitEngine:
+    def __init__(self, form_timeout=10, autocomplete_timeout=2, result_timeout=10,
+                 poll_interval=0.1, settle_time=0.3, timer=None):
+        """
+        Each condition has its own timeout (seconds)
+        settle_time: how long a list or the network must stay unchanged to count as settled/idle
+        timer: optional PhaseTimer that also receives every step as a 'website' phase
+        """
+        self.form_timeout = form_timeout
+        self.autocomplete_timeout = autocomplete_timeout
+        self.result_timeout = result_timeout
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self.timer = timer or NULL_TIMER
+        self.timings = {}
+        self.deadline = NO_DEADLINE  # Budget of the search in progress - every wait is cut to what is left
+
+    @contextmanager
+    def step(self, name):
+        """Time a named step of the website flow (raises DeadlineExceeded if the search is out of time)"""
+        self.deadline.check()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings.setdefault(name, []).append(elapsed)
+            self.timer.observe('website', name, elapsed)
+
+    def drain(self):
+        """Return the recorded step timings and start over"""
+        timings, self.timings = self.timings, {}
+        return timings
+
+    def form_interactive(self, driver, locator):
+        """Wait for the document to finish loading and the given field to accept input"""
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+
+        wait = WebDriverWait(driver, self.deadline.cap(self.form_timeout), poll_frequency=self.poll_interval)
+        wait.until(lambda d: d.execute_script('return document.readyState') == 'complete')
+        return wait.until(EC.element_to_be_clickable(locator))
+
+    def _wait_stable(self, driver, script, timeout, settled=None):
+        """
+        Poll a counter script until its value stays unchanged for settle_time (True) or timeout (False)
+        settled(value): extra condition the unchanged value must meet
+        """
+        deadline = time.monotonic() + self.deadline.cap(timeout)
+        last_value = driver.execute_script(script)
+        stable_since = time.monotonic()
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            value = driver.execute_script(script)
+            if value != last_value:
+                last_value = value
+                stable_since = time.monotonic()
+            elif time.monotonic() - stable_since >= self.settle_time and (settled is None or settled(value)):
+                return True
+        return False
+
+    def autocomplete_settled(self, driver):
+        """Wait until the autocomplete suggestion list stops changing"""
+        return self._wait_stable(driver, AUTOCOMPLETE_SCRIPT, self.autocomplete_timeout)
+
+    def track_network(self, driver):
+        """Start counting the page's in-flight requests for network_idle/result_ready - call before each submit"""
+        driver.execute_script(TRACK_NETWORK_SCRIPT)
+
+    def network_idle(self, driver, timeout=None):
+        """Wait until no request is in flight and none has started for settle_time"""
+        return self._wait_stable(driver, NETWORK_STATE_SCRIPT, timeout or self.result_timeout,
+                                 settled=lambda state: not state[1])
+
+    def result_ready(self, driver, find_result):
+        """
+        Wait for find_result(driver) to return a value, or for the network to go idle
+        Returns the found value (None when only network idle was reached)
+        """
+        deadline = time.monotonic() + self.deadline.cap(self.result_timeout)
+        state = driver.execute_script(NETWORK_STATE_SCRIPT)
+        idle_since = time.monotonic()
+        while time.monotonic() < deadline:
+            found = find_result(driver)
+            if found:
+                return found
+            time.sleep(self.poll_interval)
+            current = driver.execute_script(NETWORK_STATE_SCRIPT)
+            if current != state:
+                state = current
+                idle_since = time.monotonic()
+            elif not state[1] and time.monotonic() - idle_since >= self.settle_time * 3:
+                # Network is quiet and nothing showed up - let the caller fall back
+                return find_result(driver)
+        self.deadline.check()
+        from selenium.common.exceptions import TimeoutException
+        raise TimeoutException(f"No result after {self.result_timeout}s")
+
+
+def mark_stale_results(driver, selectors):
+    """Tag the result nodes on the page as the previous answer before a submit (see MARK_STALE_SCRIPT)"""
+    driver.execute_script(MARK_STALE_SCRIPT, list(selectors))
+
+
+def merge_timings(total, timings):
+    """Merge step timings (name -> list of seconds) into a running total"""
+    for name, values in timings.items():
+        total.setdefault(name, []).extend(values)
+    return total
+
+
+def format_breakdown(timings, addresses):
+    """Per-step time breakdown table compared with the old fixed sleeps"""
+    lines = [f"  {'Step':<16}{'Calls':>7}{'Avg (s)':>10}{'Total (s)':>11}"]
+    per_address = 0.0
+    for name, values in timings.items():
+        total = sum(values)
+        per_address += total / addresses if addresses else 0.0
+        lines.append(f"  {name:<16}{len(values):>7}{total / len(values):>10.2f}{total:>11.2f}")
+    # Only searches that filled an entrance paid the old entrance sleep
+    entrances = len(timings.get('fill_entrance', []))
+    legacy = LEGACY_SLEEP_SECONDS + (LEGACY_ENTRANCE_SLEEP_SECONDS * entrances / addresses if addresses else 0.0)
+    lines.append(f"  Wall time per address: {per_address:.2f}s "
+                 f"(old fixed sleeps alone: {legacy:.2f}s)")
+    return '\n'.join(lines)
+
+
+def page_ready_summary(timings):
+    """
+    Time until the form could be filled: a full load (navigate + form_ready) against a reused form (form_reuse)
+    Returns counts, averages in seconds and the total saved by the reuses
+    """
+    loads = sum(timings.get('navigate', [])) + sum(timings.get('form_ready', []))
+    load_count = len(timings.get('navigate', []))
+    reuses = timings.get('form_reuse', [])
+    load_avg = loads / load_count if load_count else 0.0
+    reuse_avg = sum(reuses) / len(reuses) if reuses else 0.0
+    return {
+        'full_loads': load_count,
+        'full_load_avg': load_avg,
+        'reuses': len(reuses),
+        'reuse_avg': reuse_avg,
+        'saved': (load_avg - reuse_avg) * len(reuses) if load_count else 0.0,
+    }
+
+
+def format_page_ready(timings):
+    """One-line page-ready comparison for the run summary"""
+    summary = page_ready_summary(timings)
+    line = f"  Page ready: {summary['full_loads']} full loads ({summary['full_load_avg']:.2f}s avg)"
+    if summary['reuses']:
+        line += (f", {summary['reuses']} reused forms ({summary['reuse_avg']:.2f}s avg, "
+                 f"{summary['saved']:.1f}s saved)")
+    return line
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Per-phase timing histograms for the API and website lookup paths
+Phases are grouped by path ('api', 'website') and exported as Prometheus text format or JSON at the end of a run
+"""
+
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+
+# Upper bounds in seconds - from a warm DNS cache hit up to a slow page load
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRIC_NAME = 'mikud_phase_seconds'
+
+# Shared no-op context manager handed out when timing is disabled
+_NO_PHASE = nullcontext()
+
+
+class Histogram:
+    """Fixed-bucket histogram; counts[i] holds observations <= buckets[i], the last slot is +Inf"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (None when empty, inf past the last bucket)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def to_dict(self):
+        return {'count': self.count, 'sum': self.sum, 'counts': list(self.counts)}
+
+    def merge(self, data):
+        """Add a to_dict() snapshot (same buckets) into this histogram"""
+        for i, count in enumerate(data['counts']):
+            self.counts[i] += count
+        self.sum += data['sum']
+        self.count += data['count']
+
+
+class _Phase:
+    __slots__ = ('timer', 'key', 'start')
+
+    def __init__(self, timer, key):
+        self.timer = timer
+        self.key = key
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer._observe(self.key, time.perf_counter() - self.start)
+        return False
+
+
+class PhaseTimer:
+    def __init__(self, enabled=True, buckets=DEFAULT_BUCKETS):
+        """
+        enabled: when False, phase() returns a shared no-op context manager and observe() returns at once
+        buckets: histogram upper bounds in seconds
+        """
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self.histograms = {}  # (path, phase) -> Histogram
+        self._lock = threading.Lock()
+
+    def phase(self, path, name):
+        """Context manager timing one phase, e.g. `with timer.phase('api', 'parse'):`"""
+        if not self.enabled:
+            return _NO_PHASE
+        return _Phase(self, (path, name))
+
+    def observe(self, path, name, seconds):
+        """Record a duration measured elsewhere"""
+        if self.enabled:
+            self._observe((path, name), seconds)
+
+    def _observe(self, key, seconds):
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def snapshot(self):
+        """Plain-data copy {path: {phase: histogram dict}} - picklable and JSON-safe"""
+        with self._lock:
+            data = {}
+            for (path, name), histogram in sorted(self.histograms.items()):
+                data.setdefault(path, {})[name] = histogram.to_dict()
+            return data
+
+    def drain(self):
+        """Return snapshot() and start over (used to ship a worker process's timings to the parent)"""
+        data = self.snapshot()
+        with self._lock:
+            self.histograms = {}
+        return data
+
+    def merge(self, data):
+        """Add a snapshot() from another timer with the same buckets"""
+        for path, phases in data.items():
+            for name, histogram_data in phases.items():
+                with self._lock:
+                    histogram = self.histograms.get((path, name))
+                    if histogram is None:
+                        histogram = self.histograms[(path, name)] = Histogram(self.buckets)
+                    histogram.merge(histogram_data)
+
+    def to_prometheus(self, metric=METRIC_NAME):
+        """Render every histogram in the Prometheus text exposition format"""
+        lines = [f"# HELP {metric} Time spent in each phase of a zip code lookup",
+                 f"# TYPE {metric} histogram"]
+        with self._lock:
+            items = sorted(self.histograms.items())
+        for (path, name), histogram in items:
+            labels = f'path="{path}",phase="{name}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f'{metric}_sum{{{labels}}} {histogram.sum:.6f}')
+            lines.append(f'{metric}_count{{{labels}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def to_json(self):
+        """
+        Buckets, raw histograms and bucket-resolution p50/p95/p99 per phase
+        A quantile past the last bucket is reported as null (inf is not valid JSON)
+        """
+        with self._lock:
+            items = sorted(self.histograms.items())
+        phases = {}
+        for (path, name), histogram in items:
+            phases.setdefault(path, {})[name] = {
+                **histogram.to_dict(),
+                'mean': histogram.sum / histogram.count if histogram.count else None,
+                **{f"p{round(q * 100)}": _finite(histogram.quantile(q)) for q in (0.5, 0.95, 0.99)},
+            }
+        return {'buckets': list(self.buckets), 'phases': phases}
+
+    def export(self, prefix):
+        """Write <prefix>.prom and <prefix>.json - returns the two paths"""
+        prom_path, json_path = f"{prefix}.prom", f"{prefix}.json"
+        with open(prom_path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_json(), f, indent=2)
+        return prom_path, json_path
+
+    def format_table(self):
+        """Human-readable per-phase summary"""
+        data = self.to_json()['phases']
+        lines = [f"  {'Phase':<26}{'Count':>7}{'Mean (ms)':>11}{'p95 (ms)':>10}"]
+        for path, phases in data.items():
+            for name, stats in phases.items():
+                p95 = stats['p95']
+                p95_text = f"{p95 * 1000:g}" if p95 is not None else f">{self.buckets[-1] * 1000:g}"
+                lines.append(f"  {path + '.' + name:<26}{stats['count']:>7}{stats['mean'] * 1000:>11.1f}{p95_text:>10}")
+        return '\n'.join(lines)
+
+
+def _finite(value):
+    return None if value == float('inf') else value
+
+
+# Shared disabled timer for callers that were not given one
+NULL_TIMER = PhaseTimer(enabled=False)
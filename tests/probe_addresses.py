@@ -4,37 +4,46 @@ Script to gently probe the website and find valid test addresses
 This script will try common Israeli city/street combinations to find working addresses
 """
 
+import argparse
 import time
 import json
 import random
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
-import requests
-from urllib.parse import quote
+from batch_resolver import AdaptiveRateLimiter, BatchResolver
+from browser import create_driver
+from phase_timing import NULL_TIMER, PhaseTimer
+from range_discovery import LookupFailed, discover_street_ranges
+from response_cache import ResponseCache
+from result_sink import JsonlSink, discard, input_fingerprint, iter_records, write_json_array
+from work_queue import run_worker
+from zip_client import ZipClient, resolve_base_url
+from zip_index import ZipIndex
 
 class AddressProber:
-    def __init__(self, headless=True):
-        """Initialize the prober with Selenium WebDriver"""
-        chrome_options = Options()
-        if headless:
-            chrome_options.add_argument('--headless')
-        chrome_options.add_argument('--no-sandbox')
-        chrome_options.add_argument('--disable-dev-shm-usage')
-        chrome_options.add_argument('--disable-blink-features=AutomationControlled')
-        chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        chrome_options.add_experimental_option('useAutomationExtension', False)
+    def __init__(self, headless=True, cache_path='zip_cache.sqlite3', api_base_url=None, max_rate=4.0, timer=None,
+                 index_path=None):
+        """
+        Initialize the prober (cache_path=None disables the response cache, api_base_url overrides the endpoint)
+        max_rate: ceiling for the adaptive request rate, in requests per second
+        timer: optional PhaseTimer collecting per-phase API histograms
+        index_path: optional zip_index.py index - addresses it knows are never sent upstream
+        """
+        # The browser is started on first use of self.driver - API-only probes never pay for it
+        self.headless = headless
+        self._driver = None
         
-        service = Service(ChromeDriverManager().install())
-        self.driver = webdriver.Chrome(service=service, options=chrome_options)
-        self.driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
-        
-        self.api_base_url = "https://services.israelpost.co.il/zip_data.nsf/SearchZip"
+        # Single override for the endpoint - point it at stub_server.py to work offline
+        self.api_base_url = resolve_base_url(api_base_url)
         self.website_url = "https://doar.israelpost.co.il/locatezip"
+        # Shared keep-alive pool - each lookup reuses an open TLS connection
+        # Resolved addresses are served from the on-disk cache on later runs
+        cache = ResponseCache(cache_path) if cache_path else None
+        # Addresses resolved by earlier runs and compiled with `zip_index.py build` skip the network entirely
+        index = ZipIndex(index_path) if index_path else None
+        self.timer = timer or NULL_TIMER
+        self.client = ZipClient(base_url=self.api_base_url, connect_timeout=3.05, read_timeout=5,
+                                cache=cache, timer=self.timer, index=index)
+        # Starts gentle and speeds up while responses are clean; CAPTCHA/429 answers cut the rate and pause
+        self.rate_controller = AdaptiveRateLimiter(rate=0.5, max_rate=max_rate)
         
         # Common Israeli cities
         self.cities = [
@@ -51,141 +60,220 @@ class AddressProber:
         
         self.valid_addresses = []
     
+    @property
+    def driver(self):
+        """Selenium WebDriver, started on first access"""
+        if self._driver is None:
+            self._driver = create_driver(self.headless)
+        return self._driver
+
     def test_address_via_api(self, city, street, house, entrance=""):
         """Test if an address returns a valid zip code via API - matches extension encoding"""
-        try:
-            # Custom encoding: encode special chars and Hebrew, but preserve spaces for Street
-            # This matches the extension's buildUrl() function
-            def encode_param(param, preserve_spaces=False):
-                if preserve_spaces:
-                    # For Street: encode everything except spaces (matches JS encodeParam with preserveSpaces=true)
-                    result = []
-                    for char in param:
-                        if char == ' ':
-                            result.append(' ')  # Keep space as literal space
-                        elif char.isalnum():
-                            result.append(char)  # Keep alphanumeric
-                        else:
-                            result.append(quote(char))  # Encode special chars and Hebrew
-                    return ''.join(result)
-                else:
-                    # For other params: encode normally (matches JS encodeURIComponent)
-                    return quote(param)
-            
-            # Build URL with proper encoding - Street uses literal spaces
-            encoded_city = encode_param(city)
-            encoded_street = encode_param(street, preserve_spaces=True)  # Critical: preserve spaces
-            encoded_house = encode_param(house)
-            encoded_entrance = encode_param(entrance)
-            
-            # API requires specific parameter order: House and Entrance before Street
-            url = f"{self.api_base_url}?OpenAgent&Location={encoded_city}&POB=&House={encoded_house}&Entrance={encoded_entrance}&Street={encoded_street}"
-            
-            response = requests.get(url, timeout=5)
-            response.raise_for_status()
-            
-            result_text = response.text.strip()
-            
-            # Check if we got a valid RES response
-            if result_text.startswith('RES') and len(result_text) > 4:
-                zip_code = result_text[4:]  # Extract zip code
-                if zip_code.isdigit() and len(zip_code) >= 5:
-                    return {'valid': True, 'zipCode': zip_code, 'raw': result_text}
-            
-            # Try regex extraction as fallback
-            import re
-            zip_match = re.search(r'\b\d{5,7}\b', result_text)
-            if zip_match:
-                return {'valid': True, 'zipCode': zip_match.group(), 'raw': result_text}
-            
-            return {'valid': False, 'raw': result_text}
-            
-        except Exception as e:
-            return {'valid': False, 'error': str(e)}
+        with self.timer.phase('api', 'total'):
+            return self.client.lookup(city, street, house, entrance)
     
-    def probe_random_addresses(self, num_tests=20, delay=2):
-        """Probe random address combinations"""
+    def _record_result(self, index, address, result, sink=None):
+        """Print a lookup result, then stream it to the sink or keep it if it returned a zip code"""
+        city, street, house, entrance = address
+        print(f"Tested: {city}, {street}, {house}" + (f", {entrance}" if entrance else ""))
+        address_info = {
+            'city': city,
+            'street': street,
+            'house': house,
+            'entrance': entrance,
+            'zipCode': result.get('zipCode')
+        }
+        if result.get('valid'):
+            print(f"  ✅ Valid! Zip code: {result['zipCode']}")
+        elif result.get('blocked'):
+            print(f"  ⚠️  Blocked by the server - rate now {self.rate_controller.rate:.2f} req/s")
+        else:
+            print(f"  ❌ Invalid or no result")
+
+        if sink is not None:
+            record = {**address_info, 'valid': bool(result.get('valid'))}
+            if 'error' in result:
+                record['error'] = result['error']
+            if result.get('blocked'):
+                record['blocked'] = True  # Keeps the checkpoint moving; a resumed run probes it again
+            sink.write(index, record)
+        elif result.get('valid'):
+            self.valid_addresses.append(address_info)
+
+    def resolve_batch(self, addresses, concurrency=4, rate_limit=None, sink=None, block_retries=3,
+                      block_pause=30.0):
+        """
+        Resolve (city, street, house, entrance) tuples concurrently under a global rate limit
+        rate_limit: fixed requests per second, or None for the adaptive controller
+        With a sink, results are streamed to its JSONL file and inputs it already holds are skipped
+        block_retries: rounds in which blocked addresses are looked up again once the limiter's pause is over
+                       (block_pause seconds for a fixed rate); only the last round's blocks are recorded as blocked
+        Returns the results in input order without a sink, else None
+        """
+        limiter = self.rate_controller if rate_limit is None else rate_limit
+        resolver = BatchResolver(self.test_address_via_api, concurrency=concurrency, rate_limit=limiter)
+        results = {} if sink is None else None
+        blocked = []
+        retries_left = [block_retries]
+
+        def on_result(index, address, result):
+            if result.get('blocked') and retries_left[0]:
+                blocked.append((index, address))  # Looked up again after the pause
+                return
+            if results is not None:
+                results[index] = result
+            self._record_result(index, address, result, sink)
+
+        resolver.resolve(addresses, on_result=on_result, skip=sink.is_done if sink is not None else None,
+                         collect=False)
+        while blocked:
+            retries_left[0] -= 1
+            retry, blocked[:] = list(blocked), []
+            print(f"\n⚠️  Retrying {len(retry)} blocked addresses after the pause "
+                  f"({block_retries - retries_left[0]}/{block_retries})\n")
+            if not isinstance(limiter, AdaptiveRateLimiter):
+                time.sleep(block_pause)  # The adaptive controller pauses on its own
+            indices = [index for index, _ in retry]
+            resolver.resolve([address for _, address in retry], collect=False,
+                             on_result=lambda i, address, result: on_result(indices[i], address, result))
+        if results is not None:
+            return [results[index] for index in sorted(results)]
+
+    def probe_random_addresses(self, num_tests=20, delay=None, concurrency=4):
+        """Probe random address combinations (delay: fixed seconds per request, None = adaptive rate)"""
         print(f"Probing {num_tests} random address combinations...")
         print("This may take a while. Please be patient and respectful of the server.\n")
-        
-        for i in range(num_tests):
-            city = random.choice(self.cities)
-            street = random.choice(self.streets)
-            house = str(random.randint(1, 200))
-            entrance = random.choice(['', 'א', 'ב', '1', '2'])
-            
-            print(f"[{i+1}/{num_tests}] Testing: {city}, {street}, {house}" + (f", {entrance}" if entrance else ""))
-            
-            result = self.test_address_via_api(city, street, house, entrance)
-            
-            if result.get('valid'):
-                address_info = {
-                    'city': city,
-                    'street': street,
-                    'house': house,
-                    'entrance': entrance,
-                    'zipCode': result['zipCode']
-                }
-                self.valid_addresses.append(address_info)
-                print(f"  ✅ Valid! Zip code: {result['zipCode']}")
-            else:
-                print(f"  ❌ Invalid or no result")
-            
-            # Be gentle - wait between requests
-            time.sleep(delay)
-        
+
+        addresses = [
+            (
+                random.choice(self.cities),
+                random.choice(self.streets),
+                str(random.randint(1, 200)),
+                random.choice(['', 'א', 'ב', '1', '2'])
+            )
+            for _ in range(num_tests)
+        ]
+
+        # Be gentle - a delay is a global ceiling of one request per `delay` seconds
+        self.resolve_batch(addresses, concurrency=concurrency, rate_limit=1.0 / delay if delay else None)
+
         return self.valid_addresses
-    
-    def probe_specific_combinations(self, combinations):
-        """Probe specific city/street combinations"""
+
+    def probe_specific_combinations(self, combinations, concurrency=4, rate_limit=None, sink=None):
+        """Probe specific city/street combinations (streamed to sink when given)"""
         print(f"Probing {len(combinations)} specific combinations...\n")
-        
-        for combo in combinations:
-            city = combo.get('city', '')
-            street = combo.get('street', '')
-            house = combo.get('house', '1')
-            entrance = combo.get('entrance', '')
-            
-            print(f"Testing: {city}, {street}, {house}" + (f", {entrance}" if entrance else ""))
-            
-            result = self.test_address_via_api(city, street, house, entrance)
-            
-            if result.get('valid'):
-                address_info = {
-                    'city': city,
-                    'street': street,
-                    'house': house,
-                    'entrance': entrance,
-                    'zipCode': result['zipCode']
-                }
-                self.valid_addresses.append(address_info)
-                print(f"  ✅ Valid! Zip code: {result['zipCode']}")
-            else:
-                print(f"  ❌ Invalid or no result")
-            
-            time.sleep(2)  # Be gentle
-        
+
+        addresses = (
+            (
+                combo.get('city', ''),
+                combo.get('street', ''),
+                combo.get('house', '1'),
+                combo.get('entrance', '')
+            )
+            for combo in combinations
+        )
+
+        self.resolve_batch(addresses, concurrency=concurrency, rate_limit=rate_limit, sink=sink)  # Be gentle
+
         return self.valid_addresses
-    
-    def save_results(self, filename='valid_addresses.json'):
-        """Save found valid addresses to a file"""
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(self.valid_addresses, f, ensure_ascii=False, indent=2)
-        print(f"\n✅ Saved {len(self.valid_addresses)} valid addresses to {filename}")
+
+    def probe_street_ranges(self, city, street, low=1, high=200, split_sides=True, delay=None, store=None,
+                            attempts=3):
+        """
+        Find the house-number intervals sharing a zip code on one street by bisection
+        Needs a handful of lookups per street instead of one per house number
+        delay: fixed seconds between lookups, None = adaptive rate
+        store: optional StreetRangeStore the discovered intervals are merged into
+        attempts: tries per house before a failing lookup (error, block, timeout) abandons the street - a failure
+                  is never read as "no zip", which would merge or split intervals wrongly
+        Returns the intervals, or [] when the street was abandoned
+        """
+        print(f"Discovering zip ranges: {city}, {street} (houses {low}-{high})")
+        calls = []
+
+        def lookup_zip(house):
+            for attempt in range(attempts):
+                if delay is None:
+                    self.rate_controller.wait()  # Also waits out the pause after a block
+                elif calls:
+                    time.sleep(delay)  # Be gentle
+                calls.append(house)
+                result = self.test_address_via_api(city, street, str(house))
+                self.rate_controller.record(result)
+                if 'error' not in result:
+                    return result.get('zipCode')
+                print(f"  ⚠️  House {house} (attempt {attempt + 1}/{attempts}): {result['error']}")
+            raise LookupFailed(f"House {house}: {result['error']}")
+
+        try:
+            intervals = discover_street_ranges(lookup_zip, low, high, split_sides)
+        except LookupFailed as e:
+            print(f"  ❌ Abandoned {city}, {street} after {len(calls)} lookups - {e}")
+            return []
+        ranges = [{'city': city, 'street': street, **interval} for interval in intervals]
+        for interval in ranges:
+            print(f"  {interval['from_house']}-{interval['to_house']} ({interval['side']}): {interval['zip']}")
+            if store is not None:
+                store.add_range(city, street, interval['from_house'], interval['to_house'], interval['zip'],
+                                interval['side'])
+        print(f"  ✅ {len(ranges)} intervals from {len(calls)} lookups (instead of {high - low + 1})")
+        return ranges
+
+    def probe_queue(self, queue, concurrency=4):
+        """
+        Work through shards of a shared work_queue.WorkQueue until it is drained
+        Several processes on the queue's machine can run this against the same queue file; the request rate stored in
+        the queue is shared by all of them. Returns the number of shards this prober finished
+        """
+        def on_shard(shard, records):
+            found = sum(record['valid'] for record in records)
+            print(f"Shard {shard.id}: {len(records)} addresses, {found} valid ({queue.worker_id})", flush=True)
+
+        return run_worker(queue, self.test_address_via_api, concurrency=concurrency, on_shard=on_shard)
+
+    def save_results(self, filename='valid_addresses.json', sink=None):
+        """Save found valid addresses to a file (streamed from the sink's JSONL when given)"""
+        if sink is not None:
+            count = write_json_array(iter_valid_addresses(sink.path), filename)
+        else:
+            with open(filename, 'w', encoding='utf-8') as f:
+                json.dump(self.valid_addresses, f, ensure_ascii=False, indent=2)
+            count = len(self.valid_addresses)
+        print(f"\n✅ Saved {count} valid addresses to {filename}")
+        return count
     
     def close(self):
-        """Close the browser"""
-        self.driver.quit()
+        """Close the browser (if it was started) and pooled connections"""
+        if self._driver is not None:
+            self._driver.quit()
+        self.client.close()
+
+def iter_valid_addresses(results_path):
+    """Stream the valid addresses out of a probe results JSONL file"""
+    for record in iter_records(results_path):
+        if record['valid']:
+            yield {key: record[key] for key in ('city', 'street', 'house', 'entrance', 'zipCode')}
 
 def main():
     """Main probing function"""
-    prober = AddressProber(headless=True)
+    parser = argparse.ArgumentParser(description='Probe the API for valid test addresses')
+    parser.add_argument('--timings', metavar='PREFIX',
+                        help='Collect per-phase timings and write PREFIX.prom (Prometheus) and PREFIX.json')
+    parser.add_argument('--index', metavar='PATH', help='Answer known addresses from this zip_index.py index')
+    parser.add_argument('--fresh', action='store_true',
+                        help='Discard probe_results.jsonl from a previous run instead of resuming it')
+    args = parser.parse_args()
+
+    prober = AddressProber(headless=True, timer=PhaseTimer() if args.timings else None, index_path=args.index)
     
     try:
         # Option 1: Probe random combinations
         # prober.probe_random_addresses(num_tests=30, delay=3)
         
-        # Option 2: Probe specific known combinations
+        # Option 2: Discover zip ranges along a street with a few bisection lookups
+        # prober.probe_street_ranges('חיפה', 'כנרת', low=1, high=200)
+        
+        # Option 3: Probe specific known combinations
         specific_combinations = [
             {'city': 'חיפה', 'street': 'כנרת', 'house': '7', 'entrance': 'א'},
             {'city': 'תל אביב', 'street': 'דיזנגוף', 'house': '50'},
@@ -193,16 +281,38 @@ def main():
             # Add more specific addresses you want to test
         ]
         
-        prober.probe_specific_combinations(specific_combinations)
+        # Results stream to probe_results.jsonl - rerunning after a crash resumes where it stopped.
+        # The checkpoint remembers which list it belongs to, so editing the list above starts over
+        if args.fresh:
+            discard('probe_results.jsonl')
+        sink = JsonlSink('probe_results.jsonl', fingerprint=input_fingerprint(specific_combinations))
+        if sink.restarted:
+            print("The address list changed since the last run - starting over\n")
+        if sink.resumed:
+            print(f"Resuming: {sink.resumed} addresses already probed\n")
+        try:
+            prober.probe_specific_combinations(specific_combinations, sink=sink)
+        finally:
+            sink.close()
         
         # Save results
-        if prober.valid_addresses:
-            prober.save_results()
-            print(f"\nFound {len(prober.valid_addresses)} valid addresses:")
-            for addr in prober.valid_addresses:
+        if prober.save_results(sink=sink):
+            print(f"\nFound valid addresses:")
+            for addr in iter_valid_addresses(sink.path):
                 print(f"  - {addr['city']}, {addr['street']} {addr['house']}: {addr['zipCode']}")
         else:
             print("\nNo valid addresses found. Try different combinations.")
+
+        if prober.client.index is not None:
+            print(prober.client.index.report())
+        if prober.client.cache is not None:
+            print(prober.client.cache.report())
+        if prober.client.flights is not None:
+            print(prober.client.flights.report())
+        print(prober.rate_controller.report())
+        if args.timings:
+            print(prober.timer.format_table())
+            print(f"Phase histograms saved to: {', '.join(prober.timer.export(args.timings))}")
         
     finally:
         prober.close()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Adaptive house-number range discovery
+Bisects a street's house numbers to find where the zip code changes, instead of probing every number
+"""
+
+
+class LookupFailed(Exception):
+    """A lookup that gave no answer (error, block, timeout) - raised so it is never read as 'no zip'"""
+
+
+def _bisect(houses, zip_at, lo, hi, intervals):
+    """Split houses[lo..hi] until each piece has the same zip at both ends"""
+    lo_zip, hi_zip = zip_at(houses[lo]), zip_at(houses[hi])
+    if lo_zip == hi_zip:
+        # Same zip at both ends - assume the run in between shares it
+        intervals.append([houses[lo], houses[hi], lo_zip])
+        return
+    if hi - lo == 1:
+        intervals.append([houses[lo], houses[lo], lo_zip])
+        intervals.append([houses[hi], houses[hi], hi_zip])
+        return
+    mid = (lo + hi) // 2
+    _bisect(houses, zip_at, lo, mid, intervals)
+    _bisect(houses, zip_at, mid, hi, intervals)
+
+
+def discover_ranges(lookup_zip, houses):
+    """
+    Find the zip intervals over an ascending sequence of house numbers
+    lookup_zip(house) -> zip code, or None for a clean "no zip found"; each house is looked up at most once.
+    A failed lookup must raise (LookupFailed) - bisection would otherwise treat two failures as the same zip and
+    drop the stretch between them
+    Returns [(from_house, to_house, zip)], with houses that have no zip left out
+    """
+    houses = list(houses)
+    if not houses:
+        return []
+
+    known = {}
+
+    def zip_at(house):
+        if house not in known:
+            known[house] = lookup_zip(house)
+        return known[house]
+
+    intervals = []
+    _bisect(houses, zip_at, 0, len(houses) - 1, intervals)
+
+    # Neighbouring pieces share their boundary house (and so its zip) - merge them into runs
+    merged = []
+    for start, end, zip_code in intervals:
+        if merged and merged[-1][2] == zip_code and merged[-1][1] >= start:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end, zip_code])
+    return [(start, end, zip_code) for start, end, zip_code in merged if zip_code]
+
+
+def discover_street_ranges(lookup_zip, low=1, high=200, split_sides=True):
+    """
+    Discover zip intervals for house numbers low..high on one street
+    split_sides: bisect odd and even numbers separately, since the two sides of a street often differ
+    Returns [{'from_house', 'to_house', 'zip', 'side'}] sorted by from_house
+    """
+    if split_sides:
+        sides = (('odd', range(low | 1, high + 1, 2)), ('even', range(low + (low & 1), high + 1, 2)))
+    else:
+        sides = (('both', range(low, high + 1)),)
+
+    ranges = []
+    for side, houses in sides:
+        for start, end, zip_code in discover_ranges(lookup_zip, houses):
+            ranges.append({'from_house': start, 'to_house': end, 'zip': zip_code, 'side': side})
+    return sorted(ranges, key=lambda r: (r['from_house'], r['side']))
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Interval-compressed zip store
+Keeps zip codes as sorted house-number intervals per street and side (odd/even), since consecutive houses
+share a zip. Houses with a letter or an entrance ("7א", "12/3", entrance ב) are kept as exact overrides
+"""
+
+import argparse
+import json
+import os
+import sys
+from bisect import bisect_left, bisect_right
+
+from normalize import normalize_city, normalize_entrance, normalize_house, normalize_street
+
+SIDES = ('odd', 'even')
+
+
+def house_number(house):
+    """Plain house number as an int, or None for "7א", "12/3" and other non-numeric houses"""
+    cleaned = normalize_house(str(house))
+    if cleaned.isascii() and cleaned.isdigit():
+        return int(cleaned)
+    return None
+
+
+def side_of(number):
+    return 'odd' if number % 2 else 'even'
+
+
+class _Side:
+    """Non-overlapping [start, end] intervals over one side's house numbers, as parallel sorted lists"""
+
+    __slots__ = ('starts', 'ends', 'zips')
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.zips = []
+
+    def find(self, number):
+        i = bisect_right(self.starts, number) - 1
+        if i >= 0 and self.ends[i] >= number:
+            return self.zips[i]
+        return None
+
+    def insert(self, start, end, zip_code):
+        """
+        Cover start..end with zip_code - the newest answer wins where it overlaps older intervals,
+        and it is merged with a touching or overlapping interval holding the same zip
+        """
+        # Candidates: intervals overlapping start..end or ending/starting one house (2 numbers) away
+        i = bisect_left(self.ends, start - 2)
+        j = bisect_right(self.starts, end + 2)
+        replacement = []
+        for old_start, old_end, old_zip in zip(self.starts[i:j], self.ends[i:j], self.zips[i:j]):
+            if old_zip == zip_code:
+                start, end = min(start, old_start), max(end, old_end)
+                continue
+            if old_start < start:
+                replacement.append((old_start, min(old_end, start - 2), old_zip))
+            if old_end > end:
+                replacement.append((max(old_start, end + 2), old_end, old_zip))
+        replacement.append((start, end, zip_code))
+        replacement.sort()
+        self.starts[i:j] = [interval[0] for interval in replacement]
+        self.ends[i:j] = [interval[1] for interval in replacement]
+        self.zips[i:j] = [interval[2] for interval in replacement]
+
+    def intervals(self):
+        return [list(interval) for interval in zip(self.starts, self.ends, self.zips)]
+
+    def houses(self):
+        """Number of house numbers covered (each interval steps by 2)"""
+        return sum((end - start) // 2 + 1 for start, end in zip(self.starts, self.ends))
+
+
+class _Street:
+    __slots__ = ('city', 'street', 'sides', 'overrides')
+
+    def __init__(self, city, street):
+        self.city = city      # As first seen - the store is keyed on the normalized form
+        self.street = street
+        self.sides = {side: _Side() for side in SIDES}
+        self.overrides = {}   # (normalized house, normalized entrance) -> zip
+
+
+class StreetRangeStore:
+    def __init__(self):
+        self.streets = {}  # (normalized city, normalized street) -> _Street
+
+    def _street(self, city, street, create=False):
+        key = (normalize_city(city), normalize_street(street))
+        entry = self.streets.get(key)
+        if entry is None and create:
+            entry = self.streets[key] = _Street(city, street)
+        return entry
+
+    def add_point(self, city, street, house, entrance, zip_code):
+        """Merge one resolved address - plain numbers join their side's intervals, the rest become overrides"""
+        entry = self._street(city, street, create=True)
+        number = house_number(house)
+        entrance = normalize_entrance(entrance or '')
+        if number is None or entrance:
+            entry.overrides[(normalize_house(str(house)), entrance)] = zip_code
+        else:
+            entry.sides[side_of(number)].insert(number, number, zip_code)
+
+    def add_range(self, city, street, from_house, to_house, zip_code, side='both'):
+        """Merge an interval (e.g. from range_discovery.discover_street_ranges); 'both' covers odd and even"""
+        entry = self._street(city, street, create=True)
+        for name in (SIDES if side == 'both' else (side,)):
+            remainder = 1 if name == 'odd' else 0
+            start = from_house if from_house % 2 == remainder else from_house + 1
+            end = to_house if to_house % 2 == remainder else to_house - 1
+            if start <= end:
+                entry.sides[name].insert(start, end, zip_code)
+
+    def add_record(self, record):
+        """Merge a probe or bulk result record; returns False for records without a zip"""
+        zip_code = record.get('zipCode') or record.get('zip')
+        if not zip_code or record.get('error'):
+            return False
+        self.add_point(record['city'], record['street'], record['house'], record.get('entrance'), zip_code)
+        return True
+
+    def lookup(self, city, street, house, entrance=''):
+        """
+        Zip for an address, or None when no interval or override covers it
+        An address with an entrance is answered only by an override - entrances can carry their own zip
+        """
+        entry = self._street(city, street)
+        if entry is None:
+            return None
+        entrance = normalize_entrance(entrance or '')
+        override = entry.overrides.get((normalize_house(str(house)), entrance))
+        if override is not None or entrance:
+            return override
+        number = house_number(house)
+        if number is None:
+            return None
+        return entry.sides[side_of(number)].find(number)
+
+    def stats(self):
+        """Entry counts and the compression ratio against one record per (city, street, house, entrance)"""
+        intervals = sum(len(side.starts) for entry in self.streets.values() for side in entry.sides.values())
+        overrides = sum(len(entry.overrides) for entry in self.streets.values())
+        houses = sum(side.houses() for entry in self.streets.values() for side in entry.sides.values())
+        flat = houses + overrides
+        stored = intervals + overrides
+        return {
+            'streets': len(self.streets),
+            'intervals': intervals,
+            'overrides': overrides,
+            'flat_records': flat,
+            'stored_records': stored,
+            'ratio': flat / stored if stored else 0.0,
+        }
+
+    def report(self):
+        """One-line compression summary"""
+        stats = self.stats()
+        return (f"Ranges: {stats['flat_records']:,} addresses in {stats['stored_records']:,} entries "
+                f"({stats['intervals']:,} intervals + {stats['overrides']:,} overrides over {stats['streets']:,} "
+                f"streets, {stats['ratio']:.1f}x smaller than one record per address)")
+
+    def to_dict(self):
+        return {
+            'version': 1,
+            'streets': [
+                {
+                    'city': entry.city,
+                    'street': entry.street,
+                    **{name: side.intervals() for name, side in entry.sides.items()},
+                    'overrides': [[house, entrance, zip_code] for (house, entrance), zip_code in
+                                  sorted(entry.overrides.items())],
+                }
+                for _, entry in sorted(self.streets.items())
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        store = cls()
+        for street in data['streets']:
+            for name in SIDES:
+                for start, end, zip_code in street[name]:
+                    store.add_range(street['city'], street['street'], start, end, zip_code, name)
+            for house, entrance, zip_code in street['overrides']:
+                store.add_point(street['city'], street['street'], house, entrance, zip_code)
+        return store
+
+    def save(self, path):
+        """Write the store as JSON (replaced atomically)"""
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+def main():
+    from zip_index import iter_address_records
+
+    parser = argparse.ArgumentParser(description='Build or query the interval-compressed zip store')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    merge = commands.add_parser('merge', help='Merge result files into the store (created if missing)')
+    merge.add_argument('inputs', nargs='+', help='probe_results.jsonl, valid_addresses.json or bulk_resolve.py JSONL')
+    merge.add_argument('-s', '--store', default='zip_ranges.json', help='Store file (default: zip_ranges.json)')
+
+    lookup = commands.add_parser('lookup', help='Look up one address')
+    lookup.add_argument('city')
+    lookup.add_argument('street')
+    lookup.add_argument('house')
+    lookup.add_argument('entrance', nargs='?', default='')
+    lookup.add_argument('-s', '--store', default='zip_ranges.json', help='Store file (default: zip_ranges.json)')
+    args = parser.parse_args()
+
+    store = StreetRangeStore.load(args.store) if os.path.exists(args.store) else StreetRangeStore()
+    if args.command == 'merge':
+        added = sum(store.add_record(record) for path in args.inputs for record in iter_address_records(path))
+        store.save(args.store)
+        print(f"✅ Merged {added:,} resolved addresses into {args.store}")
+        print(store.report())
+        return 0
+
+    zip_code = store.lookup(args.city, args.street, args.house, args.entrance)
+    if zip_code is None:
+        print("❌ Not covered by the store")
+        return 1
+    print(f"✅ {zip_code}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Persistent SQLite cache for SearchZip responses
+Entries expire after a TTL ("no zip found" answers sooner) and the least recently used are evicted past a size cap.
+Resolved zips are shared by every spelling of an address; "no zip found" answers only by the exact text that was sent
+"""
+
+import sqlite3
+import threading
+import time
+
+from mikud_utils import js_trim
+from normalize import KEY_SEPARATOR, address_key
+
+DAY = 24 * 60 * 60
+# Puts between exact recounts of the table - other processes sharing the file move the size in between
+RECOUNT_EVERY = 256
+# Hits whose last_access updates are written together
+TOUCH_BATCH = 64
+
+
+def make_key(city, street, house, entrance=''):
+    """Normalized cache key in API parameter order: Location, House, Entrance, Street (see normalize.py)"""
+    return address_key(city, street, house, entrance or '')
+
+
+def exact_key(city, street, house, entrance=''):
+    """
+    Key for the exact text a lookup sends (fields trimmed like build_url), kept apart from make_key's keys
+    An alias spelling that misses upstream says nothing about the canonical one, so misses and in-flight
+    requests are keyed on this
+    """
+    return KEY_SEPARATOR.join(['=', js_trim(city), js_trim(house), js_trim(entrance or ''), js_trim(street)])
+
+
+class ResponseCache:
+    def __init__(self, path='zip_cache.sqlite3', ttl=90 * DAY, negative_ttl=DAY, max_entries=200000,
+                 recount_every=RECOUNT_EVERY):
+        """
+        ttl: seconds a resolved zip code stays valid
+        negative_ttl: seconds a "no zip found" answer stays valid
+        max_entries: size cap - least recently used entries are evicted beyond it
+        recount_every: puts between exact recounts of the shared table; in between the size is this process's
+                       estimate, so with several processes the cap can be overshot by up to this many puts each
+        """
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.recount_every = recount_every
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._touched = {}  # key -> last access not yet written
+
+        # Lookups run from worker threads, so share one connection behind a lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                raw TEXT,
+                zip_code TEXT,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)')
+        self._size = self._count()
+
+    def _fresh_row(self, key, now):
+        """(raw, zip_code, created_at) for a live entry, dropping it if expired (caller holds the lock)"""
+        row = self._conn.execute(
+            'SELECT raw, zip_code, created_at, expires_at FROM responses WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[3] <= now:
+            self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self._touched.pop(key, None)
+            self._size -= 1
+            return None
+        # Reads stay reads: access times are written in batches, and before any eviction relies on them
+        self._touched[key] = now
+        if len(self._touched) >= TOUCH_BATCH:
+            self._flush_touches()
+        return row[:3]
+
+    def _flush_touches(self):
+        """Write pending last_access updates in one statement (caller holds the lock)"""
+        if self._touched:
+            self._conn.executemany('UPDATE responses SET last_access = ? WHERE key = ?',
+                                   [(when, key) for key, when in self._touched.items()])
+            self._touched.clear()
+
+    def get(self, city, street, house, entrance=''):
+        """
+        Return {'raw', 'zipCode', 'created_at'} for a fresh entry, or None
+        A resolved zip stored under any spelling of the address is returned; a negative answer only for the
+        exact text it was stored with
+        """
+        now = time.time()
+        with self._lock:
+            row = self._fresh_row(make_key(city, street, house, entrance), now)
+            if row is None or not row[1]:
+                row = self._fresh_row(exact_key(city, street, house, entrance), now)
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return {'raw': row[0], 'zipCode': row[1], 'created_at': row[2]}
+
+    def put(self, city, street, house, entrance, raw, zip_code, ttl=None):
+        """Store a response; zip_code=None is cached as a negative answer for this exact spelling only"""
+        key = make_key(city, street, house, entrance) if zip_code else exact_key(city, street, house, entrance)
+        if ttl is None:
+            ttl = self.ttl if zip_code else self.negative_ttl
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (key, raw, zip_code, created_at, expires_at, last_access) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, raw, zip_code, now, now + ttl, now)
+            )
+            self._touched.pop(key, None)
+            # A replaced key is counted too - the estimate only errs high, which just recounts sooner
+            self._size += 1
+            self._puts += 1
+            if self._size > self.max_entries or self._puts % self.recount_every == 0:
+                self._trim()
+
+    def _count(self):
+        return self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def _trim(self):
+        """
+        Recount the shared table and evict the least recently used entries past the cap (caller holds the lock)
+        Runs every recount_every puts or when the estimate passes the cap, not on every write
+        """
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._flush_touches()
+            size = self._count()
+            if size > self.max_entries:
+                self._conn.execute(
+                    'DELETE FROM responses WHERE key IN '
+                    '(SELECT key FROM responses ORDER BY last_access LIMIT ?)', (size - self.max_entries,)
+                )
+                size = self.max_entries
+            self._conn.execute('COMMIT')
+        except BaseException:
+            self._conn.execute('ROLLBACK')
+            raise
+        self._size = size
+
+    def __len__(self):
+        with self._lock:
+            return self._count()
+
+    @property
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def report(self):
+        """One-line hit ratio summary for the end of a run"""
+        return (f"Cache: {self.hits} hits / {self.hits + self.misses} lookups "
+                f"({self.hit_ratio:.1%} hit ratio, {len(self)} entries in {self.path})")
+
+    def close(self):
+        with self._lock:
+            self._flush_touches()
+            self._conn.close()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Append-only JSONL result sink with resumable checkpoints
+Results are written as they complete, so a crashed run loses nothing and a restart skips finished inputs.
+Indices only mean something for the same inputs, so the checkpoint carries a fingerprint of them and a run over
+different inputs starts over
+"""
+
+import hashlib
+import json
+import os
+
+
+def input_fingerprint(inputs):
+    """Short stable hash of the input list a sink's indices refer to"""
+    digest = hashlib.sha256()
+    for item in inputs:
+        digest.update(json.dumps(item, ensure_ascii=False, sort_keys=True).encode('utf-8') + b'\n')
+    return digest.hexdigest()[:16]
+
+
+def discard(path):
+    """Remove a results file and its checkpoint (--fresh)"""
+    for name in (path, path + '.ckpt'):
+        if os.path.exists(name):
+            os.remove(name)
+
+
+class JsonlSink:
+    def __init__(self, path, checkpoint_every=100, fingerprint=None):
+        """
+        path: JSONL file; each record carries the 'index' of its input
+        checkpoint_every: records between checkpoint writes (the JSONL itself is always flushed)
+        fingerprint: input_fingerprint() of the inputs - results of a run over other inputs are discarded
+        A record with 'blocked': True is written like any other, but its input counts as unfinished on the next run
+        """
+        self.path = path
+        self.checkpoint_path = path + '.ckpt'
+        self.checkpoint_every = checkpoint_every
+        self.fingerprint = fingerprint
+        # Every input index below the watermark is finished; only indices above it are kept in memory
+        self.watermark = 0
+        self._done_above = set()
+        self._retry = set()  # Finished as blocked - probed again by the next run
+        self._since_checkpoint = 0
+        self.resumed = 0
+        self.restarted = False  # True when results for other inputs were discarded
+
+        offset = self._load_checkpoint()
+        self._scan(offset)
+        self._file = open(path, 'a', encoding='utf-8')
+        if fingerprint is not None:
+            self.checkpoint()  # Record the fingerprint before the first result
+
+    def _load_checkpoint(self):
+        """Read the watermark, the out-of-order indices above it and the file offset it was taken at"""
+        try:
+            with open(self.checkpoint_path, encoding='utf-8') as f:
+                checkpoint = json.load(f)
+            if self.fingerprint is not None and checkpoint.get('fingerprint') != self.fingerprint:
+                # Same file, different inputs: its indices would skip the wrong addresses
+                self.restarted = os.path.exists(self.path)
+                discard(self.path)
+                return 0
+            self.watermark = checkpoint['watermark']
+            self._done_above = set(checkpoint['done_above'])
+            self._retry = set(checkpoint.get('retry', []))
+            return checkpoint['offset']
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            # Missing or unreadable checkpoint: rescan from the start with nothing done
+            self.watermark, self._done_above, self._retry = 0, set(), set()
+            if self.fingerprint is not None and os.path.exists(self.path):
+                # Results without a readable checkpoint cannot be matched to these inputs
+                self.restarted = True
+                discard(self.path)
+            return 0
+
+    def _scan(self, offset):
+        """Pick up records written after the checkpoint and drop a half-written last line"""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < offset:
+            # Results file was removed or replaced - the checkpoint no longer describes it
+            self.watermark, self._done_above, self._retry, offset = 0, set(), set(), 0
+            if not os.path.exists(self.path):
+                return
+        with open(self.path, 'rb+') as f:
+            f.seek(offset)
+            position = offset
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # Crash mid-write: cut the partial record so it is redone
+                    f.truncate(position)
+                    break
+                position += len(line)
+                record = json.loads(line)
+                self._mark_done(record['index'], record.get('blocked', False))
+        self.resumed = self.watermark + len(self._done_above) - len(self._retry)
+
+    def _mark_done(self, index, blocked=False):
+        if blocked:
+            self._retry.add(index)
+        else:
+            self._retry.discard(index)
+        if index < self.watermark:
+            return
+        self._done_above.add(index)
+        while self.watermark in self._done_above:
+            self._done_above.remove(self.watermark)
+            self.watermark += 1
+
+    def is_done(self, index):
+        """Whether the input at this index already has a result (a blocked one does not count)"""
+        return (index < self.watermark or index in self._done_above) and index not in self._retry
+
+    def write(self, index, record):
+        """Append one result and flush it to disk"""
+        self._file.write(json.dumps({'index': index, **record}, ensure_ascii=False) + '\n')
+        self._file.flush()
+        self._mark_done(index, record.get('blocked', False))
+        self._since_checkpoint += 1
+        if self._since_checkpoint >= self.checkpoint_every:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Atomically record the finished inputs and the current end of the JSONL file"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'watermark': self.watermark,
+                'done_above': sorted(self._done_above),
+                'retry': sorted(self._retry),
+                'fingerprint': self.fingerprint,
+                'offset': self._file.tell()
+            }, f)
+        os.replace(tmp_path, self.checkpoint_path)
+        self._since_checkpoint = 0
+
+    def close(self):
+        self.checkpoint()
+        self._file.close()
+
+
+def iter_records(path):
+    """Stream records from a JSONL file, one at a time"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.endswith('\n'):
+                yield json.loads(line)
+
+
+def write_json_array(records, filename):
+    """Stream records into a JSON array formatted like json.dump(..., indent=2); returns the count"""
+    count = 0
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for record in records:
+            item = json.dumps(record, ensure_ascii=False, indent=2).replace('\n', '\n  ')
+            f.write((',\n  ' if count else '\n  ') + item)
+            count += 1
+        f.write('\n]' if count else ']')
+    return count
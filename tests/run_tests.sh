@@ -15,6 +15,7 @@ case $choice in
     1)
         echo "Running unit tests..."
         python3 test_extension_utils.py
+        python3 test_tooling.py
         ;;
     2)
         echo "Running API vs Website comparison..."
@@ -29,6 +30,7 @@ case $choice in
         echo ""
         echo "=== Unit Tests ==="
         python3 test_extension_utils.py
+        python3 test_tooling.py
         echo ""
         echo "=== Probing Addresses ==="
         python3 probe_addresses.py
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Single-flight call coalescing
+Concurrent callers asking for the same key share one in-flight call: the first runs it, the rest wait and
+receive its result - or its exception
+"""
+
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self.calls = 0     # Calls actually run
+        self.shared = 0    # Callers served by another caller's call - each one is a call saved
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def do(self, key, fn):
+        """
+        Run fn() unless a call for key is already in flight, in which case wait for that one
+        Returns (result, shared) - shared is True when the result came from another caller's call.
+        An exception from fn() is raised in every caller waiting on it
+        """
+        with self._lock:
+            call = self._in_flight.get(key)
+            if call is None:
+                call = self._in_flight[key] = _Call()
+                self.calls += 1
+                leader = True
+            else:
+                self.shared += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            # Forget the call before waking the waiters, so a later caller starts a fresh one
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._in_flight)
+
+    @property
+    def saved_ratio(self):
+        requested = self.calls + self.shared
+        return self.shared / requested if requested else 0.0
+
+    def report(self):
+        """One-line summary for the end of a run"""
+        return (f"Coalescing: {self.shared} of {self.calls + self.shared} upstream lookups shared an in-flight "
+                f"request ({self.saved_ratio:.1%} of upstream calls saved)")
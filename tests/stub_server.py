@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the SearchZip endpoint
+Reproduces the OpenAgent parameter contract and can inject latency, errors, CAPTCHA pages and 429 throttling
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+from response_cache import make_key
+
+SEARCH_PATH = '/zip_data.nsf/SearchZip'
+PARAMETER_ORDER = ['Location', 'POB', 'House', 'Entrance', 'Street']
+
+CAPTCHA_PAGE = """<html><head><title>ShieldSquare Captcha</title></head>
+<body><h1>Access denied</h1><p>Please complete the captcha to continue.</p></body></html>"""
+
+
+def load_records(path):
+    """Read address records from a JSON list or a JSONL file"""
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    if text.lstrip().startswith('['):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def seed_from_records(records):
+    """Build {key: zip} from address records ('zip' or 'zipCode')"""
+    seed = {}
+    for record in records:
+        zip_code = record.get('zip') or record.get('zipCode')
+        if zip_code:
+            key = make_key(record['city'], record['street'], str(record['house']), record.get('entrance', ''))
+            seed[key] = zip_code
+    return seed
+
+
+def load_seed(path):
+    """Load {key: zip} from a JSON list or JSONL of address records"""
+    return seed_from_records(load_records(path))
+
+
+def synthetic_zip(city, street, house):
+    """Deterministic 7-digit zip shared by runs of ~20 house numbers on the same side of a street"""
+    number = int(''.join(ch for ch in house if ch.isascii() and ch.isdigit()) or 0)
+    block = f"{city}|{street}|{number // 20}|{number % 2}"
+    return str(1000000 + int(hashlib.md5(block.encode('utf-8')).hexdigest(), 16) % 9000000)
+
+
+def parse_latency(spec):
+    """Turn a latency spec into a sampler returning seconds
+    fixed:MS | uniform:MIN_MS:MAX_MS | lognormal:MEDIAN_MS:SIGMA | empirical:MS,MS,...
+    """
+    if not spec:
+        return lambda rng: 0.0
+    kind, _, args = spec.partition(':')
+    if kind == 'fixed':
+        value = float(args) / 1000
+        return lambda rng: value
+    if kind == 'uniform':
+        low, high = (float(v) / 1000 for v in args.split(':'))
+        return lambda rng: rng.uniform(low, high)
+    if kind == 'lognormal':
+        median, sigma = (float(v) for v in args.split(':'))
+        mu = math.log(median / 1000)
+        return lambda rng: rng.lognormvariate(mu, sigma)
+    if kind == 'empirical':
+        samples = [float(v) / 1000 for v in args.split(',') if v]
+        return lambda rng: rng.choice(samples)
+    raise ValueError(f"Unknown latency spec: {spec}")
+
+
+class StubConfig:
+    def __init__(self, seed=None, synthetic=True, latency=None, error_rate=0.0, captcha_rate=0.0,
+                 throttle_rps=None, strict_spaces=False, random_seed=None):
+        """
+        seed: {make_key(...): zip} answers; synthetic=True answers unknown addresses with synthetic_zip()
+        latency: spec for parse_latency(); error_rate / captcha_rate: fraction of requests answered with 500 / a CAPTCHA page
+        throttle_rps: above this request rate answer 429; strict_spaces: reject %20 / + in Street like a strict upstream
+        """
+        self.seed = seed or {}
+        self.synthetic = synthetic
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.captcha_rate = captcha_rate
+        self.throttle_rps = throttle_rps
+        self.strict_spaces = strict_spaces
+        self.rng = random.Random(random_seed)
+        self.lock = threading.Lock()
+        self.counts = {'requests': 0, 'ok': 0, 'not_found': 0, 'bad_request': 0, 'error': 0, 'captcha': 0, 'throttled': 0}
+        self._tokens = throttle_rps or 0
+        self._refilled_at = time.monotonic()
+
+    def count(self, outcome):
+        with self.lock:
+            self.counts[outcome] += 1
+
+    def roll(self):
+        """Decide the fault for one request: (delay seconds, None | 'error' | 'captcha' | 'throttled')"""
+        with self.lock:
+            delay = self.latency(self.rng)
+            if self.throttle_rps:
+                now = time.monotonic()
+                self._tokens = min(self.throttle_rps, self._tokens + (now - self._refilled_at) * self.throttle_rps)
+                self._refilled_at = now
+                if self._tokens < 1:
+                    return 0.0, 'throttled'
+                self._tokens -= 1
+            draw = self.rng.random()
+            if draw < self.error_rate:
+                return delay, 'error'
+            if draw < self.error_rate + self.captcha_rate:
+                return delay, 'captcha'
+            return delay, None
+
+    def answer(self, city, street, house, entrance):
+        """Zip for an address, or None when it is unknown"""
+        zip_code = self.seed.get(make_key(city, street, house, entrance)) or self.seed.get(make_key(city, street, house))
+        if zip_code is None and self.synthetic and city.strip() and street.strip() and house.strip():
+            zip_code = synthetic_zip(' '.join(city.split()), ' '.join(street.split()), house.strip())
+        return zip_code
+
+
+class SearchZipHandler(BaseHTTPRequestHandler):
+    server_version = 'SearchZipStub/1.0'
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real endpoint
+    # Send headers and body in one segment - separate small writes stall on Nagle + delayed ACK (~40ms)
+    wbufsize = -1
+    disable_nagle_algorithm = True
+    config = None  # Set by make_server
+
+    def parse_request(self):
+        # The real endpoint takes literal spaces in Street, which split the request line - re-join them
+        line = str(self.raw_requestline, 'iso-8859-1').rstrip('\r\n')
+        words = line.split(' ')
+        self.literal_spaces = len(words) > 3 and words[-1].startswith('HTTP/')
+        if self.literal_spaces:
+            line = ' '.join([words[0], '%20'.join(words[1:-1]), words[-1]])
+            self.raw_requestline = (line + '\r\n').encode('iso-8859-1')
+        return super().parse_request()
+
+    def log_message(self, format, *args):
+        pass  # Keep load tests quiet
+
+    def _send(self, status, body, content_type='text/plain; charset=utf-8', headers=None):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        config = self.config
+        config.count('requests')
+        path, _, query = self.path.partition('?')
+        if path != SEARCH_PATH:
+            config.count('bad_request')
+            return self._send(404, 'Not found')
+
+        parts = query.split('&')
+        if not parts or parts[0] != 'OpenAgent':
+            config.count('bad_request')
+            return self._send(400, 'Missing OpenAgent')
+        names = [part.partition('=')[0] for part in parts[1:]]
+        if [name for name in names if name in PARAMETER_ORDER] != PARAMETER_ORDER:
+            # House and Entrance must come before Street, as the real endpoint requires
+            config.count('bad_request')
+            return self._send(400, f"Expected parameters in order {'&'.join(PARAMETER_ORDER)}")
+
+        raw = {name: value for name, _, value in (part.partition('=') for part in parts[1:])}
+        encoded_space = '+' in raw['Street'] or ('%20' in raw['Street'] and not self.literal_spaces)
+        if config.strict_spaces and encoded_space:
+            config.count('not_found')
+            return self._send(200, 'RES0')
+
+        delay, fault = config.roll()
+        if delay:
+            time.sleep(delay)
+        if fault == 'throttled':
+            config.count('throttled')
+            return self._send(429, 'Too Many Requests', headers={'Retry-After': '1'})
+        if fault == 'error':
+            config.count('error')
+            return self._send(500, 'Internal Server Error')
+        if fault == 'captcha':
+            config.count('captcha')
+            return self._send(200, CAPTCHA_PAGE, content_type='text/html; charset=utf-8')
+
+        values = {name: unquote(raw[name]) for name in PARAMETER_ORDER}
+        zip_code = config.answer(values['Location'], values['Street'], values['House'], values['Entrance'])
+        if zip_code is None:
+            config.count('not_found')
+            return self._send(200, 'RES0')
+        config.count('ok')
+        # RES<d><zip>: the extension skips one digit after RES (observed as the zip length, e.g. RES73327233)
+        return self._send(200, f"RES{len(zip_code)}{zip_code}")
+
+
+def make_server(config, host='127.0.0.1', port=0):
+    """Create a threaded stub server; port=0 picks a free port"""
+    handler = type('ConfiguredSearchZipHandler', (SearchZipHandler,), {'config': config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def base_url(server):
+    """SearchZip base URL to point AddressProber / ZipCodeTester at"""
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}{SEARCH_PATH}"
+
+
+def start_in_thread(config):
+    """Start a stub server in a background thread - returns (server, base URL); call server.shutdown() when done"""
+    server = make_server(config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, base_url(server)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the SearchZip endpoint')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--seed-file', help='JSON/JSONL address records with zip/zipCode (e.g. probe_results.jsonl)')
+    parser.add_argument('--no-synthetic', action='store_true', help='Answer only seeded addresses (others get RES0)')
+    parser.add_argument('--latency', help='fixed:MS | uniform:MIN:MAX | lognormal:MEDIAN_MS:SIGMA | empirical:MS,MS,...')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with HTTP 500')
+    parser.add_argument('--captcha-rate', type=float, default=0.0, help='Fraction answered with a ShieldSquare CAPTCHA page')
+    parser.add_argument('--throttle-rps', type=float, help='Answer 429 above this many requests per second')
+    parser.add_argument('--strict-spaces', action='store_true', help='Treat %%20 or + in Street as a miss')
+    parser.add_argument('--random-seed', type=int, help='Seed for latency and fault injection')
+    args = parser.parse_args()
+
+    config = StubConfig(
+        seed=load_seed(args.seed_file) if args.seed_file else None,
+        synthetic=not args.no_synthetic,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        captcha_rate=args.captcha_rate,
+        throttle_rps=args.throttle_rps,
+        strict_spaces=args.strict_spaces,
+        random_seed=args.random_seed,
+    )
+    server = make_server(config, args.host, args.port)
+    print(f"SearchZip stub listening on {base_url(server)}")
+    print(f"Point the scripts at it with: export MIKUD_API_BASE_URL={base_url(server)}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Served: {config.counts}")
+
+
+if __name__ == '__main__':
+    main()
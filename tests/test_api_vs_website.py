@@ -4,196 +4,275 @@ Test script to compare API results with official website results
 Uses Selenium to interact with the Israeli Post Office website
 """
 
-import time
+import argparse
 import json
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from webdriver_manager.chrome import ChromeDriverManager
-import requests
-from urllib.parse import quote
+import re
+import sys
+import time
+from browser import DEFAULT_LEAN_TYPES, create_driver, driver_alive, lean_blocklist
+from cassette import Cassette
+from deadlines import NO_DEADLINE, Deadline, DeadlineExceeded
+from driver_pool import run_comparisons
+from mikud_utils import build_url
+from network_capture import NetworkCapture
+from page_waits import STALE_ATTRIBUTE, WaitEngine, format_breakdown, format_page_ready, mark_stale_results
+from phase_timing import NULL_TIMER, PhaseTimer
+from result_sink import JsonlSink, discard, input_fingerprint, iter_records, write_json_array
+from response_cache import ResponseCache
+from zip_client import ZipClient, resolve_base_url
+
+CITY_INPUT_XPATH = "//input[contains(@placeholder, 'יישוב') or contains(@name, 'city') or contains(@id, 'city')]"
+
+# Selectors tried in order to find the zip code in the results
+RESULT_SELECTORS = [
+    "//div[contains(@class, 'result')]//strong",
+    "//div[contains(@class, 'zip')]",
+    "//span[contains(@class, 'mikud')]",
+    "//*[contains(text(), 'מיקוד')]/following-sibling::*",
+    "//*[contains(text(), 'מיקוד')]",
+]
 
 class ZipCodeTester:
-    def __init__(self, headless=False):
-        """Initialize the tester with Selenium WebDriver"""
-        chrome_options = Options()
-        if headless:
-            chrome_options.add_argument('--headless')
-        chrome_options.add_argument('--no-sandbox')
-        chrome_options.add_argument('--disable-dev-shm-usage')
-        chrome_options.add_argument('--disable-blink-features=AutomationControlled')
-        chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
-        chrome_options.add_experimental_option('useAutomationExtension', False)
-        
-        service = Service(ChromeDriverManager().install())
-        self.driver = webdriver.Chrome(service=service, options=chrome_options)
-        self.driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+    def __init__(self, headless=False, cache_path='zip_cache.sqlite3', api_base_url=None, timer=None,
+                 capture_network=False, lean=False, block_types=DEFAULT_LEAN_TYPES, api_deadline=None,
+                 website_deadline=None, hedge=None, cassette=None, screenshot_path='error_screenshot.png'):
+        """
+        Initialize the tester (cache_path=None disables the response cache, api_base_url overrides the endpoint)
+        timer: optional PhaseTimer collecting per-phase histograms for both paths
+        capture_network: read the zip from the site's own XHR/fetch response (DevTools) before scraping the page
+        lean: block block_types and third-party hosts (browser.lean_blocklist) and reuse the loaded form
+        api_deadline / website_deadline: end-to-end seconds for one lookup on each path (None = no deadline)
+        hedge: optional HedgePolicy for API requests (see ZipClient)
+        cassette: optional cassette.Cassette - records every API response and website result, or replays them
+                  without network or browser
+        screenshot_path: where a failed website search saves its screenshot (one file per pool worker)
+        """
+        # The browser is started on first use of self.driver, so API-only runs never launch Chrome
+        self.headless = headless
+        self.capture_network = capture_network
+        self.lean = lean
+        self.blocked_urls = lean_blocklist(block_types) if lean else None
+        self._driver = None
+        self._capture = None
+        self._on_form = False  # The form from the last search is still loaded and usable
+        self.screenshot_path = screenshot_path
+        self.website_deadline = website_deadline
+        self.timer = timer or NULL_TIMER
+        # Explicit wait conditions (each with its own timeout) instead of fixed sleeps
+        self.waits = WaitEngine(timer=self.timer)
         
-        self.api_base_url = "https://services.israelpost.co.il/zip_data.nsf/SearchZip"
+        # Single override for the endpoint - point it at stub_server.py to work offline
+        self.api_base_url = resolve_base_url(api_base_url)
         self.website_url = "https://doar.israelpost.co.il/locatezip"
+        # Shared keep-alive pool - each lookup reuses an open TLS connection
+        # Resolved addresses are served from the on-disk cache on later runs
+        cache = ResponseCache(cache_path) if cache_path else None
+        self.client = ZipClient(base_url=self.api_base_url, connect_timeout=3.05, read_timeout=10,
+                                cache=cache, timer=self.timer, deadline=api_deadline, hedge=hedge)
+        self.cassette = cassette
+        if cassette is not None:
+            cassette.attach(self.client)
         
+    @property
+    def driver(self):
+        """Selenium WebDriver, started on first access"""
+        if self._driver is None:
+            self._driver = self._create_driver()
+        return self._driver
+
+    def _create_driver(self):
+        self._capture = None
+        self._on_form = False
+        return create_driver(self.headless, capture_network=self.capture_network, blocked_urls=self.blocked_urls)
+
+    @property
+    def capture(self):
+        """DevTools network capture on the current browser, set up on first access"""
+        if self._capture is None:
+            self._capture = NetworkCapture(self.driver)
+        return self._capture
+
     def search_via_api(self, city, street, house, entrance=""):
         """Search zip code using the API - matches extension's encoding logic"""
-        try:
-            # Custom encoding: encode special chars and Hebrew, but preserve spaces for Street
-            # This matches the extension's buildUrl() function
-            def encode_param(param, preserve_spaces=False):
-                if preserve_spaces:
-                    # For Street: encode everything except spaces (matches JS encodeParam with preserveSpaces=true)
-                    result = []
-                    for char in param:
-                        if char == ' ':
-                            result.append(' ')  # Keep space as literal space
-                        elif char.isalnum():
-                            result.append(char)  # Keep alphanumeric
-                        else:
-                            result.append(quote(char))  # Encode special chars and Hebrew
-                    return ''.join(result)
-                else:
-                    # For other params: encode normally (matches JS encodeURIComponent)
-                    return quote(param)
-            
-            # Build URL with proper encoding - Street uses literal spaces
-            encoded_city = encode_param(city)
-            encoded_street = encode_param(street, preserve_spaces=True)  # Critical: preserve spaces
-            encoded_house = encode_param(house)
-            encoded_entrance = encode_param(entrance)
-            
-            # API requires specific parameter order: House and Entrance before Street
-            url = f"{self.api_base_url}?OpenAgent&Location={encoded_city}&POB=&House={encoded_house}&Entrance={encoded_entrance}&Street={encoded_street}"
-            
-            print(f"\n[API] Requesting: {url}")
-            print(f"[API] Note: Street parameter uses literal spaces (not %20)")
-            
-            # Use requests with proper handling
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            
-            result_text = response.text.strip()
-            print(f"[API] Raw response: {result_text}")
-            
-            # Parse RES format: "RES73327233" -> "3327233"
-            if result_text.startswith('RES'):
-                zip_code = result_text[4:]  # Skip "RES" and first digit
-                if zip_code.isdigit() and len(zip_code) >= 5:
-                    return {'zipCode': zip_code, 'raw': result_text, 'source': 'api'}
-            
-            # Try to extract zip code from response
-            import re
-            zip_match = re.search(r'\b\d{5,7}\b', result_text)
-            if zip_match:
-                return {'zipCode': zip_match.group(), 'raw': result_text, 'source': 'api'}
-            
-            return {'error': 'No zip code found in response', 'raw': result_text, 'source': 'api'}
-                
-        except Exception as e:
-            print(f"[API] Error: {e}")
-            return {'error': str(e), 'source': 'api'}
+        url = build_url(city, street, house, entrance, base_url=self.api_base_url)
+        print(f"\n[API] Requesting: {url}")
+        print(f"[API] Note: Street parameter uses literal spaces (not %20)")
+
+        with self.timer.phase('api', 'total'):
+            result = self.client.lookup(city, street, house, entrance)
+        if 'error' in result:
+            print(f"[API] Error: {result['error']}")
+            return {'error': result['error'], 'source': 'api'}
+
+        raw = result.get('raw')  # None when the answer came from the zip index
+        print(f"[API] Raw response: {raw if raw is not None else '(from index)'}")
+        if result['valid']:
+            return {'zipCode': result['zipCode'], 'raw': raw, 'source': 'api'}
+
+        return {'error': 'No zip code found in response', 'raw': raw, 'source': 'api'}
     
+    def _find_zip_in_results(self, driver):
+        """
+        Try the result selectors in order and return the first 5-7 digit zip code found
+        Nodes tagged by mark_stale_results() and not re-rendered since still hold the previous search's answer
+        """
+        from selenium.webdriver.common.by import By
+
+        # The zip code might be in various formats on the page
+        with self.timer.phase('website', 'xpath_cascade'):
+            for selector in RESULT_SELECTORS:
+                try:
+                    elements = driver.find_elements(By.XPATH, selector)
+                    for element in elements:
+                        if element.get_attribute(STALE_ATTRIBUTE) is not None:
+                            continue  # Not touched since this search was submitted
+                        # Look for 5-7 digit numbers
+                        zip_match = re.search(r'\b\d{5,7}\b', element.text.strip())
+                        if zip_match:
+                            return zip_match.group()
+                except Exception:
+                    continue
+            return None
+
+    def _fill_field(self, element, value):
+        """Type into a form field and wait for its autocomplete list to settle"""
+        element.clear()
+        element.send_keys(value)
+        self.waits.autocomplete_settled(self.driver)
+
     def search_via_website(self, city, street, house, entrance=""):
         """Search zip code using the official website via Selenium"""
+        if self.cassette is not None and self.cassette.replaying:
+            return self.cassette.replay_website(city, street, house, entrance)
+        if self.cassette is not None:
+            result = self._search_with_deadline(city, street, house, entrance)
+            self.cassette.record_website(city, street, house, entrance, result)
+            return result
+        return self._search_with_deadline(city, street, house, entrance)
+
+    def _search_with_deadline(self, city, street, house, entrance):
+        if self.website_deadline:
+            self.waits.deadline = Deadline(self.website_deadline, 'Website')
         try:
-            print(f"\n[Website] Navigating to: {self.website_url}")
-            self.driver.get(self.website_url)
-            time.sleep(2)  # Wait for page load
-            
-            # Wait for the form to be available
-            wait = WebDriverWait(self.driver, 10)
-            
-            # Find and fill city field
-            # The website uses Hebrew labels, so we need to find inputs by their structure
-            print("[Website] Looking for form fields...")
-            
-            # Try to find input fields - they might be in a form or have specific IDs/classes
-            # We'll use a more flexible approach
-            city_input = wait.until(EC.presence_of_element_located((By.XPATH, "//input[contains(@placeholder, 'יישוב') or contains(@name, 'city') or contains(@id, 'city')]")))
-            city_input.clear()
-            city_input.send_keys(city)
+            with self.timer.phase('website', 'total'):
+                return self._search_via_website(city, street, house, entrance)
+        finally:
+            self.waits.deadline = NO_DEADLINE
+
+    def _search_via_website(self, city, street, house, entrance):
+        from selenium.webdriver.common.by import By
+
+        waits = self.waits
+        try:
+            city_input = None
+            if self.lean and self._on_form:
+                # Search again from the form that is already loaded instead of reloading the page
+                try:
+                    with waits.step('form_reuse'):
+                        city_input = self.driver.find_element(By.XPATH, CITY_INPUT_XPATH)
+                    print("[Website] Reusing the loaded form")
+                except Exception:
+                    city_input = None
+            self._on_form = False
+
+            if city_input is None:
+                print(f"\n[Website] Navigating to: {self.website_url}")
+                with waits.step('navigate'):
+                    if self.website_deadline:
+                        self.driver.set_page_load_timeout(waits.deadline.cap(self.website_deadline))
+                    self.driver.get(self.website_url)
+
+                # Find and fill city field
+                # The website uses Hebrew labels, so we need to find inputs by their structure
+                print("[Website] Looking for form fields...")
+
+                # Wait for the form to be interactive instead of sleeping a fixed time
+                with waits.step('form_ready'):
+                    city_input = waits.form_interactive(self.driver, (By.XPATH, CITY_INPUT_XPATH))
+
+            with waits.step('fill_city'):
+                self._fill_field(city_input, city)
             print(f"[Website] Entered city: {city}")
-            time.sleep(0.5)
             
             # Find street field
-            street_input = self.driver.find_element(By.XPATH, "//input[contains(@placeholder, 'רחוב') or contains(@name, 'street') or contains(@id, 'street')]")
-            street_input.clear()
-            street_input.send_keys(street)
+            with waits.step('fill_street'):
+                street_input = self.driver.find_element(By.XPATH, "//input[contains(@placeholder, 'רחוב') or contains(@name, 'street') or contains(@id, 'street')]")
+                self._fill_field(street_input, street)
             print(f"[Website] Entered street: {street}")
-            time.sleep(0.5)
             
             # Find house number field
-            house_input = self.driver.find_element(By.XPATH, "//input[contains(@placeholder, 'מספר בית') or contains(@name, 'house') or contains(@id, 'house')]")
-            house_input.clear()
-            house_input.send_keys(house)
+            with waits.step('fill_house'):
+                house_input = self.driver.find_element(By.XPATH, "//input[contains(@placeholder, 'מספר בית') or contains(@name, 'house') or contains(@id, 'house')]")
+                self._fill_field(house_input, house)
             print(f"[Website] Entered house: {house}")
-            time.sleep(0.5)
             
             # Find entrance field if provided
             if entrance:
                 try:
-                    entrance_input = self.driver.find_element(By.XPATH, "//input[contains(@placeholder, 'כניסה') or contains(@name, 'entrance') or contains(@id, 'entrance')]")
-                    entrance_input.clear()
-                    entrance_input.send_keys(entrance)
+                    with waits.step('fill_entrance'):
+                        entrance_input = self.driver.find_element(By.XPATH, "//input[contains(@placeholder, 'כניסה') or contains(@name, 'entrance') or contains(@id, 'entrance')]")
+                        self._fill_field(entrance_input, entrance)
                     print(f"[Website] Entered entrance: {entrance}")
-                    time.sleep(0.5)
-                except:
+                except Exception:
                     print("[Website] Entrance field not found, skipping")
             
             # Find and click search button
-            search_button = self.driver.find_element(By.XPATH, "//button[contains(text(), 'חיפוש') or contains(text(), 'מיקוד')]")
-            search_button.click()
+            with waits.step('submit'):
+                search_button = self.driver.find_element(By.XPATH, "//button[contains(text(), 'חיפוש') or contains(text(), 'מיקוד')]")
+                if self.capture_network:
+                    self.capture.clear()  # Only the requests the search itself makes
+                # Per-submit marker: whatever result is on the page now belongs to an earlier search
+                mark_stale_results(self.driver, RESULT_SELECTORS)
+                waits.track_network(self.driver)
+                search_button.click()
             print("[Website] Clicked search button")
+
+            if self.capture_network:
+                # The site's own response carries the answer - no rendering, selectors or page-wide regex
+                with waits.step('network_response'):
+                    captured = self.capture.wait_for_zip(waits.deadline.cap(waits.result_timeout))
+                if captured:
+                    print(f"[Website] Found zip code in {captured['url']}: {captured['zipCode']}")
+                    self._on_form = True
+                    return {'zipCode': captured['zipCode'], 'source': 'website', 'via': 'network'}
+                print("[Website] No zip code in the captured responses, reading the page")
             
-            # Wait for results
-            time.sleep(3)
-            
-            # Try to extract zip code from results
-            # The zip code might be in various formats on the page
-            zip_code = None
-            
-            # Try different selectors to find the zip code
-            selectors = [
-                "//div[contains(@class, 'result')]//strong",
-                "//div[contains(@class, 'zip')]",
-                "//span[contains(@class, 'mikud')]",
-                "//*[contains(text(), 'מיקוד')]/following-sibling::*",
-                "//*[contains(text(), 'מיקוד')]",
-            ]
-            
-            for selector in selectors:
-                try:
-                    elements = self.driver.find_elements(By.XPATH, selector)
-                    for element in elements:
-                        text = element.text.strip()
-                        # Look for 5-7 digit numbers
-                        import re
-                        zip_match = re.search(r'\b\d{5,7}\b', text)
-                        if zip_match:
-                            zip_code = zip_match.group()
-                            print(f"[Website] Found zip code: {zip_code}")
-                            break
-                    if zip_code:
-                        break
-                except:
-                    continue
+            # Wait until a result node shows a zip code or the network goes idle
+            with waits.step('results'):
+                zip_code = waits.result_ready(self.driver, self._find_zip_in_results)
+            if zip_code:
+                print(f"[Website] Found zip code: {zip_code}")
             
             if not zip_code:
                 # Fallback: get page source and search for zip codes
-                page_source = self.driver.page_source
-                import re
-                zip_matches = re.findall(r'\b\d{5,7}\b', page_source)
+                with waits.step('page_source'):
+                    zip_matches = re.findall(r'\b\d{5,7}\b', self.driver.page_source)
                 if zip_matches:
                     zip_code = zip_matches[0]
                     print(f"[Website] Found zip code in page source: {zip_code}")
             
+            self._on_form = True
             return {'zipCode': zip_code, 'source': 'website'} if zip_code else {'error': 'Zip code not found', 'source': 'website'}
             
         except Exception as e:
-            print(f"[Website] Error: {e}")
-            # Take screenshot for debugging
-            self.driver.save_screenshot('error_screenshot.png')
-            return {'error': str(e), 'source': 'website'}
+            return self._website_error(e)
+
+    def _website_error(self, e):
+        """Error result for a failed website search - never raises, even when the browser is gone"""
+        if self.waits.deadline.expired() and not isinstance(e, DeadlineExceeded):
+            # A wait or page load cut short by the deadline - report it as the deadline
+            e = DeadlineExceeded(f"Website deadline of {self.website_deadline:g}s exceeded (timed out)")
+        if isinstance(e, DeadlineExceeded):
+            self.timer.observe('website', 'deadline_exceeded', self.website_deadline)
+        print(f"[Website] Error: {e}")
+        self._on_form = False
+        # Take screenshot for debugging - after a crash the session cannot, and the pool restarts it next
+        if self._driver is not None:
+            try:
+                self._driver.save_screenshot(self.screenshot_path)
+            except Exception as screenshot_error:
+                print(f"[Website] No screenshot, the browser did not respond: {screenshot_error}")
+        return {'error': str(e), 'source': 'website'}
     
     def compare_results(self, city, street, house, entrance=""):
         """Compare API and website results"""
@@ -231,9 +310,93 @@ class ZipCodeTester:
         
         return comparison
     
+    def restart_driver(self):
+        """Replace the browser with a fresh instance (after K uses or a crash)"""
+        if self._driver is not None:
+            try:
+                self._driver.quit()
+            except Exception:
+                pass  # The old browser may already be gone
+        self._driver = self._create_driver()
+
+    def driver_alive(self):
+        """Check whether the browser session still responds (True if it was never started)"""
+        return self._driver is None or driver_alive(self._driver)
+
     def close(self):
-        """Close the browser"""
-        self.driver.quit()
+        """Close the browser (if it was started) and pooled connections"""
+        if self._driver is not None:
+            self._driver.quit()
+        self.client.close()
+
+def record_from_stub(test_cases, path):
+    """
+    Record a cassette against an in-process stub_server.py - no network or browser
+    The API side is the stub's SearchZip responses; the website side is the stub's own answer for the address,
+    so a replay checks request building and response parsing, not the live site
+    """
+    from stub_server import StubConfig, start_in_thread
+
+    config = StubConfig()
+    server, base = start_in_thread(config)
+    cassette = Cassette(path, 'record', source='stub')
+    tester = ZipCodeTester(headless=True, cache_path=None, api_base_url=base, cassette=cassette)
+    try:
+        for test_case in test_cases:
+            city, street, house = test_case['city'], test_case['street'], test_case['house']
+            entrance = test_case.get('entrance', '')
+            tester.search_via_api(city, street, house, entrance)
+            zip_code = config.answer(city, street, house, entrance)
+            cassette.record_website(city, street, house, entrance,
+                                    {'zipCode': zip_code, 'source': 'website'} if zip_code
+                                    else {'error': 'No zip code found on website', 'source': 'website'})
+    finally:
+        tester.close()
+        server.shutdown()
+    cassette.save()
+    print(f"Recorded {len(test_cases)} cases from the stub into {path}")
+
+def run_with_cassette(test_cases, path, mode, delay=2, stub=False, **tester_options):
+    """
+    Compare every case in this process through a cassette and write test_results.json
+    Recording runs live (with the usual pause between cases); replaying needs neither network nor browser.
+    stub: record from record_from_stub() instead, then replay the new cassette
+    Returns 1 when a replay was asked for something the cassette does not have, else 0
+    """
+    try:
+        if stub:
+            record_from_stub(test_cases, path)
+            mode = 'replay'
+        cassette = Cassette(path, mode)
+    except (OSError, ValueError) as e:
+        print(f"❌ Cannot {mode} cassette: {e}")
+        return 1
+    tester = ZipCodeTester(headless=True, cache_path=None, cassette=cassette, **tester_options)
+    results = []
+    start = time.perf_counter()
+    try:
+        for i, test_case in enumerate(test_cases):
+            if i and not cassette.replaying:
+                time.sleep(delay)  # Be gentle with the live site
+            results.append(tester.compare_results(test_case['city'], test_case['street'], test_case['house'],
+                                                  test_case.get('entrance', '')))
+    finally:
+        tester.close()
+    elapsed = time.perf_counter() - start
+    if not cassette.replaying:
+        cassette.save()
+
+    with open('test_results.json', 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    matches = sum(result['match'] for result in results)
+    print(f"\n{'='*60}")
+    print(f"Test Summary ({'replayed' if cassette.replaying else 'recorded'} in {elapsed * 1000:.0f} ms):")
+    print(f"  Total tests: {len(results)}")
+    print(f"  Matches: {matches}")
+    print(f"  Results saved to: test_results.json")
+    print(f"  {cassette.report()}")
+    print(f"{'='*60}")
+    return 1 if cassette.misses else 0
 
 def main():
     """Main test function"""
@@ -246,38 +409,119 @@ def main():
         # Add more test cases with spaces in street names to verify encoding
     ]
     
-    tester = ZipCodeTester(headless=True)  # Set to False to see browser
-    
-    results = []
+    parser = argparse.ArgumentParser(description='Compare API results with the official website')
+    parser.add_argument('--workers', type=int, help='Browser worker processes (default: 2)')
+    parser.add_argument('--rate', type=float,
+                        help='Comparisons started per second across all workers (default: 0.5)')
+    parser.add_argument('--recycle-after', type=int,
+                        help='Restart a worker\'s browser after this many cases (default: 25)')
+    parser.add_argument('--fresh', action='store_true',
+                        help='Discard test_results.jsonl from a previous run instead of resuming it')
+    parser.add_argument('--timings', metavar='PREFIX',
+                        help='Collect per-phase timings and write PREFIX.prom (Prometheus) and PREFIX.json')
+    parser.add_argument('--network-capture', action='store_true',
+                        help="Read the website's zip from its XHR/fetch response via DevTools instead of the page")
+    parser.add_argument('--lean', action='store_true',
+                        help='Block non-essential resources and third-party hosts, and search again from the loaded form')
+    parser.add_argument('--block-types', default=','.join(DEFAULT_LEAN_TYPES),
+                        help=f"Resource types --lean blocks (default: {','.join(DEFAULT_LEAN_TYPES)}; "
+                             f"also: stylesheet)")
+    parser.add_argument('--api-deadline', type=float, help='End-to-end seconds per API lookup, retries included')
+    parser.add_argument('--website-deadline', type=float, help='End-to-end seconds per website search')
+    parser.add_argument('--hedge', action='store_true',
+                        help='Hedge API requests with no answer after the observed p95 (at most 10%% extra requests)')
+    cassette_mode = parser.add_mutually_exclusive_group()
+    cassette_mode.add_argument('--record', metavar='CASSETTE',
+                               help='Run live in one process and save every API response and website result')
+    cassette_mode.add_argument('--replay', metavar='CASSETTE',
+                               help='Answer everything from a recorded cassette - no network, browser or sleeps')
+    parser.add_argument('--stub', action='store_true',
+                        help='With --record: record from an in-process stub_server.py instead of the live API and site')
+    args = parser.parse_args()
+    block_types = tuple(name.strip() for name in args.block_types.split(',') if name.strip())
     try:
-        for test_case in test_cases:
-            result = tester.compare_results(
-                test_case['city'],
-                test_case['street'],
-                test_case['house'],
-                test_case.get('entrance', '')
-            )
-            results.append(result)
-            time.sleep(2)  # Be gentle with requests
-        
-        # Save results
-        with open('test_results.json', 'w', encoding='utf-8') as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
-        
-        print(f"\n{'='*60}")
-        print(f"Test Summary:")
-        print(f"  Total tests: {len(results)}")
-        print(f"  Matches: {sum(1 for r in results if r['match'])}")
-        print(f"  Mismatches: {sum(1 for r in results if not r['match'] and 'zipCode' in r.get('api', {}) and 'zipCode' in r.get('website', {}))}")
-        print(f"  Results saved to: test_results.json")
-        print(f"{'='*60}")
-        
+        lean_blocklist(block_types)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.stub and not args.record:
+        parser.error('--stub only applies to --record')
+    if args.record or args.replay:
+        # Cassette runs are one sequential process without the resumable sink or deadlines
+        ignored = [flag for flag, value in (('--workers', args.workers), ('--rate', args.rate),
+                                            ('--recycle-after', args.recycle_after),
+                                            ('--fresh', args.fresh), ('--timings', args.timings),
+                                            ('--api-deadline', args.api_deadline),
+                                            ('--website-deadline', args.website_deadline), ('--hedge', args.hedge))
+                   if value not in (None, False)]
+        if ignored:
+            parser.error(f"{', '.join(ignored)} cannot be combined with --record/--replay")
+        return run_with_cassette(test_cases, args.record or args.replay, 'record' if args.record else 'replay',
+                                 stub=args.stub, lean=args.lean, block_types=block_types,
+                                 capture_network=args.network_capture)
+    if args.workers is None:
+        args.workers = 2
+    if args.recycle_after is None:
+        args.recycle_after = 25
+    if args.rate is None:
+        args.rate = 0.5
+
+    if args.fresh:
+        discard('test_results.jsonl')
+
+    # Comparisons stream to test_results.jsonl as they finish - rerunning resumes after the last one,
+    # unless test_cases changed since (the checkpoint carries their fingerprint)
+    sink = JsonlSink('test_results.jsonl', fingerprint=input_fingerprint(test_cases))
+    if sink.restarted:
+        print("Test cases changed since the last run - starting over")
+    if sink.resumed:
+        print(f"Resuming: {sink.resumed} test cases already compared")
+    try:
+        # Set headless=False to see browser
+        _, stats = run_comparisons(test_cases, sink=sink, workers=args.workers, rate=args.rate,
+                                   max_uses=args.recycle_after, headless=True, timings=bool(args.timings),
+                                   capture_network=args.network_capture, lean=args.lean, block_types=block_types,
+                                   api_deadline=args.api_deadline, website_deadline=args.website_deadline,
+                                   hedge=args.hedge)
     finally:
-        tester.close()
+        sink.close()
 
-if __name__ == '__main__':
-    main()
+    # Save results in the original test_results.json format, streamed from the JSONL
+    counts = {'total': 0, 'matches': 0, 'mismatches': 0}
 
+    def export_records():
+        for record in iter_records(sink.path):
+            record.pop('index')
+            counts['total'] += 1
+            counts['matches'] += record['match']
+            counts['mismatches'] += (not record['match'] and 'zipCode' in record.get('api', {})
+                                     and 'zipCode' in record.get('website', {}))
+            yield record
 
+    write_json_array(export_records(), 'test_results.json')
 
+    lookups = stats['cache_hits'] + stats['cache_misses']
+    print(f"\n{'='*60}")
+    print(f"Test Summary:")
+    print(f"  Total tests: {counts['total']}")
+    print(f"  Matches: {counts['matches']}")
+    print(f"  Mismatches: {counts['mismatches']}")
+    print(f"  Results saved to: test_results.json")
+    print(f"  Workers: {args.workers} (browsers recycled {stats['recycled']} times)")
+    if stats['steps']:
+        print(f"  Website step breakdown:")
+        searches = len(stats['steps'].get('navigate', [])) + len(stats['steps'].get('form_reuse', []))
+        print(format_breakdown(stats['steps'], searches))
+        print(format_page_ready(stats['steps']))
+    if lookups:
+        print(f"  Cache: {stats['cache_hits']} hits / {lookups} lookups ({stats['cache_hits'] / lookups:.1%} hit ratio)")
+    if args.timings:
+        timer = PhaseTimer()
+        timer.merge(stats['phases'])
+        print(f"  Phase timings:")
+        print(timer.format_table())
+        print(f"  Histograms saved to: {', '.join(timer.export(args.timings))}")
+    print(f"{'='*60}")
 
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,30 +4,13 @@ Unit tests for extension utility functions
 Tests the logic of validation, API parsing, and URL building
 """
 
-import re
-import json
+from mikud_utils import (
+    build_url, encode_param, is_blocked_response, parse_response, parse_responses,
+    validate_address, validate_city, validate_entrance, validate_house_number, validate_street
+)
 
 def test_url_encoding():
     """Test that URL encoding preserves spaces for Street parameter"""
-    from urllib.parse import quote
-    
-    def encode_param(param, preserve_spaces=False):
-        """Simulate extension's encodeParam function - matches JS implementation"""
-        if preserve_spaces:
-            # For Street: encode everything except spaces (matches JS)
-            result = []
-            for char in param:
-                if char == ' ':
-                    result.append(' ')  # Keep space as literal space
-                elif char.isalnum():
-                    result.append(char)  # Keep alphanumeric
-                else:
-                    result.append(quote(char))  # Encode special chars and Hebrew
-            return ''.join(result)
-        else:
-            # For other params: encode normally (matches JS encodeURIComponent)
-            return quote(param)
-    
     # Test cases - include streets with spaces to verify space preservation
     test_cases = [
         {'city': 'תל אביב', 'street': 'דיזנגוף', 'house': '50', 'has_space': False},
@@ -58,33 +41,6 @@ def test_url_encoding():
 
 def test_zip_code_parsing():
     """Test zip code parsing logic (matches extension's parseResponse)"""
-    def parse_response(response_text):
-        """Simulate extension's parseResponse function"""
-        if not response_text or not isinstance(response_text, str):
-            return []
-        
-        trimmed = response_text.strip()
-        
-        # Check for RES format: "RES73327233" -> "3327233" (skip "RES" and first digit)
-        # Extension uses substring(4) which skips first 4 chars: "RES" + first digit
-        res_match = re.match(r'RES\d{5,}', trimmed)
-        if res_match:
-            zip_code = res_match.group(0)[4:]  # Skip "RES" (3) + first digit (1) = 4 chars
-            if re.match(r'^\d{5,7}$', zip_code):
-                return [{'zipCode': zip_code, 'raw': trimmed}]
-        
-        # Try regex extraction
-        zip_regex = re.compile(r'\b\d{5,7}\b')
-        matches = zip_regex.findall(trimmed)
-        if matches:
-            return [{'zipCode': zip, 'raw': trimmed} for zip in matches]
-        
-        # Check if entire response is a zip code
-        if re.match(r'^\d{5,7}$', trimmed):
-            return [{'zipCode': trimmed, 'raw': trimmed}]
-        
-        return []
-    
     test_cases = [
         ('RES73327233', [{'zipCode': '3327233', 'raw': 'RES73327233'}]),  # Skip RES + 7 = "3327233"
         ('RES1234567', [{'zipCode': '234567', 'raw': 'RES1234567'}]),  # Skip RES + 1 = "234567"
@@ -102,32 +58,66 @@ def test_zip_code_parsing():
     
     print("✅ Zip code parsing tests passed\n")
 
+def test_matches_extension_output():
+    """Test exact output parity with utils/api.js (expected values produced by running the JS)"""
+    base_url = "https://services.israelpost.co.il/zip_data.nsf/SearchZip"
+    url_cases = [
+        ((' תל אביב ', "המלך ג'ורג'", '1', ''),
+         "?OpenAgent&Location=%D7%AA%D7%9C%20%D7%90%D7%91%D7%99%D7%91&POB=&House=1&Entrance="
+         "&Street=%D7%94%D7%9E%D7%9C%D7%9A %D7%92'%D7%95%D7%A8%D7%92'"),
+        (('ראש העין', 'מגדל דוד', '44', 'א'),
+         "?OpenAgent&Location=%D7%A8%D7%90%D7%A9%20%D7%94%D7%A2%D7%99%D7%9F&POB=&House=44&Entrance=%D7%90"
+         "&Street=%D7%9E%D7%92%D7%93%D7%9C %D7%93%D7%95%D7%93"),
+        (('a/b', 'St. (1)!', '7*', '~_'),
+         "?OpenAgent&Location=a%2Fb&POB=&House=7*&Entrance=~_&Street=St. (1)!"),
+    ]
+
+    print("Testing output parity with utils/api.js...")
+    for args, expected_query in url_cases:
+        url = build_url(*args)
+        assert url == base_url + expected_query, f"buildUrl mismatch for {args}: {url}"
+        print(f"  ✅ buildUrl{args}")
+
+    try:
+        encode_param('רחוב \U0001F600', preserve_spaces=True)
+        assert False, "Astral characters in Street should fail like JS encodeURIComponent"
+    except ValueError:
+        print("  ✅ Astral characters in Street raise like the JS URIError")
+
+    parse_cases = [
+        ('\ufeffRES73327233\ufeff', [{'zipCode': '3327233', 'raw': 'RES73327233'}]),  # JS trim() strips BOM
+        ('zip \u0663\u0663\u0662\u0667\u0662\u0663\u0663 or 3327233',  # JS \d is ASCII-only
+         [{'zipCode': '3327233', 'raw': 'zip \u0663\u0663\u0662\u0667\u0662\u0663\u0663 or 3327233'}]),
+        ('RES1234', []),
+        ('abc_12345 12345', [{'zipCode': '12345', 'raw': 'abc_12345 12345'}]),
+    ]
+    for input_text, expected in parse_cases:
+        assert parse_response(input_text) == expected, f"parseResponse mismatch for {input_text!r}"
+    assert parse_responses([text for text, _ in parse_cases]) == [expected for _, expected in parse_cases]
+    print("  ✅ parseResponse and batch parse_responses match")
+
+    print("✅ Extension parity tests passed\n")
+
+def test_block_detection():
+    """Test CAPTCHA / block page detection (matches the checks in searchZipCode())"""
+    test_cases = [
+        ('<html><title>ShieldSquare Captcha</title></html>', True),
+        ('Please solve the CAPTCHA', True),
+        ('Access Denied', True),
+        ('Bot traffic is BLOCKED', True),
+        ('bot detected', False),  # "bot" alone is not enough
+        ('RES73327233', False),
+        ('לא נמצא', False),
+    ]
+
+    print("Testing block page detection...")
+    for text, expected in test_cases:
+        assert is_blocked_response(text) == expected, f"Failed for {text!r}"
+        print(f"  ✅ {text!r}: {expected}")
+    print("✅ Block detection tests passed\n")
+
 def test_validation_logic():
     """Test input validation logic (matches extension's Validation)"""
-    def validate_city(city):
-        if not city or not isinstance(city, str):
-            return False
-        trimmed = city.strip()
-        return 2 <= len(trimmed) <= 100
-    
-    def validate_street(street):
-        if not street or not isinstance(street, str):
-            return False
-        trimmed = street.strip()
-        return 2 <= len(trimmed) <= 100
-    
-    def validate_house_number(house_number):
-        if not house_number or not isinstance(house_number, str):
-            return False
-        trimmed = house_number.strip()
-        return 1 <= len(trimmed) <= 20
-    
-    def validate_entrance(entrance):
-        if not entrance or not isinstance(entrance, str):
-            return True  # Optional
-        trimmed = entrance.strip()
-        return len(trimmed) == 0 or len(trimmed) <= 20
-    
     test_cases = [
         # (city, street, house, entrance, expected_valid)
         ('תל אביב', 'דיזנגוף', '50', '', True),
@@ -147,17 +137,16 @@ def test_validation_logic():
             validate_entrance(entrance)
         )
         assert is_valid == expected_valid, f"Failed for {city}, {street}, {house}, {entrance}"
+        assert validate_address(city, street, house, entrance)['valid'] == expected_valid
         print(f"  ✅ {city}, {street}, {house}, {entrance}: {is_valid}")
+
+    # JS counts a lone surrogate as one UTF-16 unit instead of failing
+    assert validate_city('\ud800א') is True
     
     print("✅ Validation tests passed\n")
 
 def test_parameter_order():
     """Test that URL parameters are in correct order (House and Entrance before Street)"""
-    def build_url(city, street, house, entrance=''):
-        # Simulate extension's buildUrl with correct parameter order
-        base_url = "https://services.israelpost.co.il/zip_data.nsf/SearchZip"
-        return f"{base_url}?OpenAgent&Location={city}&POB=&House={house}&Entrance={entrance}&Street={street}"
-    
     url = build_url('תל אביב', 'דיזנגוף', '50', '')
     
     # Check parameter order: House and Entrance must come before Street
@@ -173,6 +162,53 @@ def test_parameter_order():
     print(f"  ✅ Parameter order is correct (House and Entrance before Street)")
     print("✅ Parameter order tests passed\n")
 
+def test_address_normalization():
+    """Variants in normalization_corpus.json share a key, near misses do not, and the JS agrees"""
+    import json
+    import os
+    from differential import NodeWorker, node_available
+    from normalize import address_key
+
+    print("Testing address normalization...")
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'normalization_corpus.json')
+    with open(path, encoding='utf-8') as f:
+        corpus = json.load(f)
+
+    for group in corpus['same']:
+        keys = {address_key(*address) for address in group}
+        assert len(keys) == 1, f"Variants should share one key: {group} -> {keys}"
+    print(f"  ✅ {len(corpus['same'])} variant groups collapse to one key each")
+
+    for first, second in corpus['different']:
+        assert address_key(*first) != address_key(*second), f"Near miss must stay distinct: {first} vs {second}"
+    print(f"  ✅ {len(corpus['different'])} near-miss pairs stay distinct")
+
+    if not node_available():
+        print("  ⚠️  Node not found - skipping the utils/normalize.js comparison\n")
+        return
+    addresses = [address for group in corpus['same'] for address in group]
+    addresses += [address for pair in corpus['different'] for address in pair]
+    with NodeWorker() as worker:
+        results = worker.call('normalize', 'addressKey', addresses)
+    for address, js in zip(addresses, results):
+        assert js == {'ok': address_key(*address)}, f"normalize.js differs on {address}: {js}"
+    print(f"  ✅ utils/normalize.js produces the same {len(addresses)} keys")
+    print("✅ Normalization tests passed\n")
+
+def test_differential_against_js():
+    """Run the real utils/*.js in Node on generated inputs and compare with the Python mirror"""
+    from differential import node_available, run_differential
+
+    print("Testing differential parity with the extension JS...")
+    if not node_available():
+        print("  ⚠️  Node not found - skipping (run differential.py where Node is installed)\n")
+        return
+    result = run_differential(cases=6000, batch_size=500, seed=1)
+    for name, stats in result['targets'].items():
+        assert stats['mismatches'] == 0, f"{name} differs from the JS, e.g. {stats['examples'][0]!r}"
+        print(f"  ✅ {name}: {stats['cases']} cases match")
+    print("✅ Differential tests passed\n")
+
 def main():
     """Run all unit tests"""
     print("=" * 60)
@@ -183,8 +219,12 @@ def main():
     try:
         test_url_encoding()
         test_zip_code_parsing()
+        test_matches_extension_output()
+        test_block_detection()
         test_validation_logic()
         test_parameter_order()
+        test_address_normalization()
+        test_differential_against_js()
         
         print("=" * 60)
         print("✅ All unit tests passed!")
@@ -0,0 +1,1592 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the Python tooling around the extension
+Tests batching, caching and other helpers offline, without browser or API access
+"""
+
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+# CI installs tests/requirements.txt and sets this, so a missing dependency fails there instead of skipping
+REQUIRE_DEPS = os.environ.get('MIKUD_REQUIRE_DEPS') == '1'
+
+
+def skip_without_requests(what):
+    """Note a check skipped because requests is missing - or fail when REQUIRE_DEPS is set"""
+    if REQUIRE_DEPS:
+        raise AssertionError(f"requests is not installed but MIKUD_REQUIRE_DEPS=1 - cannot run {what}")
+    print(f"  ⚠️  requests not installed - skipping {what}\n")
+
+
+def test_batch_resolver():
+    """Test that the batch resolver keeps order, concurrency and the rate ceiling"""
+    from batch_resolver import BatchResolver
+
+    lock = threading.Lock()
+    state = {'in_flight': 0, 'peak': 0}
+
+    def fake_lookup(city, street, house, entrance=''):
+        with lock:
+            state['in_flight'] += 1
+            state['peak'] = max(state['peak'], state['in_flight'])
+        time.sleep(0.02)
+        with lock:
+            state['in_flight'] -= 1
+        if house == '0':
+            raise ValueError('boom')
+        return {'valid': True, 'zipCode': f"{int(house):07d}", 'raw': f"RES0{int(house):07d}"}
+
+    addresses = [('חיפה', 'כנרת', str(i), '') for i in range(1, 21)]
+
+    print("Testing batch resolver...")
+    results = BatchResolver(fake_lookup, concurrency=5).resolve(iter(addresses))
+    assert [r['zipCode'] for r in results] == [f"{i:07d}" for i in range(1, 21)], "Results must keep input order"
+    assert 1 < state['peak'] <= 5, f"Expected bounded concurrency, peak was {state['peak']}"
+    print(f"  ✅ 20 lookups in order, peak concurrency {state['peak']}")
+
+    start = time.monotonic()
+    BatchResolver(fake_lookup, concurrency=5, rate_limit=50).resolve(addresses[:10])
+    elapsed = time.monotonic() - start
+    assert elapsed >= 9 / 50, f"Rate ceiling not enforced: {elapsed:.3f}s"
+    print(f"  ✅ Rate ceiling enforced ({elapsed:.2f}s for 10 lookups at 50/s)")
+
+    seen = []
+    returned = BatchResolver(fake_lookup, concurrency=3).resolve(
+        addresses[:6], on_result=lambda index, address, result: seen.append(index),
+        skip=lambda index: index % 2 == 0, collect=False
+    )
+    assert returned is None and sorted(seen) == [1, 3, 5], f"Skipped inputs were resolved: {seen}"
+    print("  ✅ Skipped inputs are not looked up and streaming mode keeps no results")
+
+    results = BatchResolver(fake_lookup).resolve([('חיפה', 'כנרת', '0', '')])
+    assert results == [{'valid': False, 'error': 'boom'}], f"Lookup errors should become results: {results}"
+    print("  ✅ Lookup exceptions are returned as invalid results")
+
+    print("✅ Batch resolver tests passed\n")
+
+
+def test_adaptive_rate_limiter():
+    """Test the AIMD controller: additive increase on clean results, cut and pause on blocks"""
+    from batch_resolver import AdaptiveRateLimiter, BatchResolver
+
+    print("Testing adaptive rate limiter...")
+    limiter = AdaptiveRateLimiter(rate=1.0, min_rate=0.1, max_rate=2.0, increase=0.1, decrease=0.5, block_pause=0.2)
+    for _ in range(10):
+        limiter.record({'valid': True, 'zipCode': '1234567'})
+    assert 1.5 < limiter.rate <= 2.0, f"Rate should grow on clean responses, got {limiter.rate}"
+    limiter.record({'valid': False, 'error': 'Read timed out.'})
+    rate_before_block = limiter.rate
+    print(f"  ✅ Clean responses raise the rate to {rate_before_block:.2f} req/s, errors leave it alone")
+
+    limiter.record({'valid': False, 'blocked': True, 'error': 'CAPTCHA'})
+    limiter.record({'valid': False, 'blocked': True, 'error': 'CAPTCHA'})  # Same burst - counted once
+    assert limiter.rate == rate_before_block * 0.5 and limiter.blocks == 1
+    start = time.monotonic()
+    limiter.wait()
+    assert time.monotonic() - start >= 0.15, "A block must pause requests"
+    for _ in range(100):
+        limiter.record({'valid': True})
+    assert limiter.rate == 2.0, "Rate must stay under max_rate"
+    print(f"  ✅ Blocks halve the rate once per burst and pause - {limiter.report()}")
+
+    def blocking_lookup(city, street, house, entrance=''):
+        if int(house) % 5 == 0:
+            return {'valid': False, 'blocked': True, 'error': 'CAPTCHA'}
+        return {'valid': True, 'zipCode': '1234567'}
+
+    limiter = AdaptiveRateLimiter(rate=200, max_rate=400, block_pause=0.05)
+    BatchResolver(blocking_lookup, concurrency=2, rate_limit=limiter).resolve(
+        [('חיפה', 'כנרת', str(i), '') for i in range(1, 10)])
+    assert limiter.blocks >= 1 and limiter.rate < limiter.peak_rate
+    print("  ✅ BatchResolver feeds every result to the controller")
+
+    try:
+        from probe_addresses import AddressProber
+    except ImportError:
+        skip_without_requests('the blocked-retry checks')
+        return
+    prober = AddressProber(cache_path=None, api_base_url='http://127.0.0.1:9/zip_data.nsf/SearchZip')
+    prober.rate_controller = AdaptiveRateLimiter(rate=200, max_rate=400, block_pause=0.05)
+    tries = {}
+
+    def blocked_twice(city, street, house, entrance=''):
+        tries[house] = tries.get(house, 0) + 1
+        if house in ('3', '7') and tries[house] <= 2:
+            return {'valid': False, 'blocked': True, 'error': 'CAPTCHA'}
+        if house == '9':
+            return {'valid': False, 'blocked': True, 'error': 'CAPTCHA'}  # Never lets up
+        return {'valid': True, 'zipCode': f"{int(house):07d}"}
+
+    prober.test_address_via_api = blocked_twice
+    try:
+        results = prober.resolve_batch([('חיפה', 'כנרת', str(i), '') for i in range(1, 10)], concurrency=2)
+    finally:
+        prober.close()
+    assert [result.get('valid') for result in results] == [True] * 8 + [False] and results[8]['blocked']
+    assert len(prober.valid_addresses) == 8 and (tries['3'], tries['9']) == (3, 4), f"Unexpected tries: {tries}"
+    print("  ✅ Blocked addresses are looked up again after the pause instead of being dropped")
+
+    print("✅ Adaptive rate limiter tests passed\n")
+
+
+def test_bulk_resolve():
+    """Test bulk resolution: validation, in-file dedup and input-order output"""
+    import io
+    from bulk_resolve import parse_columns, read_rows, resolve_rows
+
+    print("Testing bulk resolution...")
+    csv_text = (
+        "id,עיר,רחוב,בית\n"
+        "1,חיפה,כנרת,7\n"
+        "2,תל אביב,דיזנגוף,50\n"
+        "3,ח,כנרת,7\n"                # City too short
+        "4, חיפה ,כנרת  ,7\n"         # Same address as row 1 after whitespace normalization
+        "5,חיפה,כנרת,404\n"
+    )
+    fieldnames, rows = read_rows(io.StringIO(csv_text), 'csv')
+    assert fieldnames == ['id', 'עיר', 'רחוב', 'בית']
+    lookups = []
+
+    def fake_lookup(city, street, house, entrance=''):
+        lookups.append(house)
+        time.sleep(0.03 if house == '7' else 0.0)  # First row finishes last
+        if house == '404':
+            return {'valid': False, 'raw': 'RES0'}
+        return {'valid': True, 'zipCode': f"{int(house):07d}", 'raw': ''}
+
+    written = []
+    counts = resolve_rows(rows, fake_lookup, parse_columns('city=עיר,street=רחוב,house=בית'),
+                          concurrency=4, on_row=written.append)
+    assert [row['id'] for row in written] == ['1', '2', '3', '4', '5'], "Rows must come out in input order"
+    assert [row['status'] for row in written] == ['ok', 'ok', 'invalid', 'duplicate', 'not_found']
+    assert written[3]['zip'] == '0000007', "Duplicates take the zip of their first occurrence"
+    assert written[2]['error'] == 'שם העיר אינו תקין' and written[0]['latency_ms'] >= 30
+    assert sorted(lookups) == ['404', '50', '7'], f"Only distinct valid rows are looked up: {lookups}"
+    assert counts['duplicate'] == 1 and counts['invalid'] == 1
+    print("  ✅ Invalid and duplicate rows skip the lookup; output keeps input order")
+
+    _, rows = read_rows(io.StringIO('{"city": "חיפה", "street": "כנרת", "house": 7}\n\n'), 'jsonl')
+    written = []
+    resolve_rows(rows, fake_lookup, on_row=written.append)
+    assert written[0]['zip'] == '0000007' and written[0]['house'] == 7
+    print("  ✅ JSONL rows (numeric house numbers) are resolved and keep their own fields")
+
+    try:
+        parse_columns('zip=מיקוד')
+        assert False, "Unknown fields must be rejected"
+    except ValueError:
+        pass
+
+    print("✅ Bulk resolution tests passed\n")
+
+
+def test_single_flight():
+    """Test coalescing of concurrent identical calls, in SingleFlight and in ZipClient"""
+    from single_flight import SingleFlight
+
+    print("Testing single-flight coalescing...")
+    flights = SingleFlight()
+    release = threading.Event()
+    runs = []
+
+    def slow_call():
+        runs.append(1)
+        release.wait(5)
+        return {'valid': True, 'zipCode': '3327233'}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.do('key', slow_call))) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    while flights.shared < 5:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(runs) == 1 and flights.calls == 1, f"Expected one call, ran {len(runs)}"
+    assert sorted(shared for _, shared in results) == [False] + [True] * 5
+    assert all(result == {'valid': True, 'zipCode': '3327233'} for result, _ in results)
+    assert flights.in_flight() == 0 and abs(flights.saved_ratio - 5 / 6) < 1e-9
+    print("  ✅ Concurrent callers share one call and its result")
+
+    release.clear()
+
+    def failing_call():
+        release.wait(5)
+        raise ValueError('upstream down')
+
+    errors = []
+
+    def call():
+        try:
+            flights.do('key', failing_call)
+        except ValueError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    while flights.shared < 7:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert errors == ['upstream down'] * 3 and flights.calls == 2, f"Errors should be shared: {errors}"
+    assert flights.do('key', lambda: 'fresh') == ('fresh', False), "A finished call must not be reused"
+    print("  ✅ Errors reach every waiting caller and finished calls are forgotten")
+
+    try:
+        from zip_client import ZipClient
+    except ImportError:
+        skip_without_requests('the ZipClient check')
+        return
+    from stub_server import StubConfig, start_in_thread
+
+    def concurrent_lookups(client, addresses):
+        found = []
+        threads = [threading.Thread(target=lambda address=address: found.append(client.lookup(*address)))
+                   for address in addresses]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return found
+
+    # Each spelling is sent as typed, so concurrent lookups coalesce per spelling (' ' padding is trimmed)
+    variants = [('תל אביב', 'דיזנגוף', '50', ''), ('תל-אביב', 'רחוב דיזנגוף', '50', ''),
+                ('ת"א', 'דיזנגוף ', '050', '')] * 3
+    config = StubConfig(latency='fixed:300')
+    server, base = start_in_thread(config)
+    client = ZipClient(base_url=base, max_retries=0)
+    try:
+        found = concurrent_lookups(client, variants)
+        assert config.counts['requests'] == 3, f"Expected one request per spelling, got {config.counts['requests']}"
+        assert len({result['zipCode'] for result in found}) == 3 and len({id(result) for result in found}) == 9
+        assert client.flights.shared == 6 and 'of 9 upstream lookups' in client.flights.report()
+    finally:
+        client.close()
+        server.shutdown()
+
+    config = StubConfig(latency='fixed:300', error_rate=1.0)
+    server, base = start_in_thread(config)
+    client = ZipClient(base_url=base, max_retries=0)
+    try:
+        found = concurrent_lookups(client, variants[:1] * 3)
+        assert config.counts['requests'] == 1 and all('500' in result['error'] for result in found), found
+    finally:
+        client.close()
+        server.shutdown()
+    print("  ✅ ZipClient sends one request for concurrent lookups of the same address text")
+
+    from response_cache import ResponseCache
+
+    with tempfile.TemporaryDirectory() as tmp:
+        client = ZipClient(base_url='http://127.0.0.1:9/zip_data.nsf/SearchZip',
+                           cache=ResponseCache(os.path.join(tmp, 'cache.sqlite3')))
+        sent = []
+
+        def alias_misses(url, deadline=None):
+            sent.append(url)
+            return 'RES0' if len(sent) == 1 else 'RES76433222'
+
+        client.fetch = alias_misses
+        try:
+            assert client.lookup('ת"א', "רח' דיזנגוף", '50') == {'valid': False, 'raw': 'RES0'}
+            assert client.lookup('תל אביב', 'דיזנגוף', '50')['zipCode'] == '6433222', \
+                "An alias's miss must not answer the canonical spelling"
+            assert client.lookup('ת"א', "רח' דיזנגוף", '50')['zipCode'] == '6433222', \
+                "A resolved zip is shared by every spelling"
+            assert len(sent) == 2 and client.lookup('ת"א', "רח' דיזנגוף", '51') is not None
+        finally:
+            client.close()
+    print("  ✅ A miss is cached for its own spelling only; resolved zips are shared across spellings")
+
+    print("✅ Single-flight tests passed\n")
+
+
+def test_deadlines_and_hedging():
+    """Test lookup deadlines, the hedge policy and hedged ZipClient requests"""
+    from deadlines import Deadline, DeadlineExceeded, HedgePolicy, NO_DEADLINE
+
+    print("Testing deadlines and hedging...")
+    deadline = Deadline(0.05)
+    assert max(deadline.cap((3.05, 10))) <= 0.05
+    assert NO_DEADLINE.cap((3.05, 10)) == (3.05, 10) and NO_DEADLINE.remaining() == float('inf')
+    time.sleep(0.06)
+    assert deadline.expired() and deadline.remaining() == 0.0
+    try:
+        deadline.cap(5)
+        raise AssertionError("An expired deadline should raise")
+    except DeadlineExceeded as e:
+        assert 'timed out' in str(e)
+    print("  ✅ Deadlines cut timeouts to the remaining budget and raise once spent")
+
+    policy = HedgePolicy(min_samples=10, max_extra=0.1)
+    assert policy.hedge_delay() is None, "No hedging before enough samples"
+    for i in range(1, 101):
+        policy.record(i / 1000)
+    assert policy.hedge_delay() == 0.096, f"Unexpected p95: {policy.hedge_delay()}"
+    for _ in range(20):
+        policy.start_primary()
+    assert [policy.try_hedge() for _ in range(3)] == [True, True, False], "Hedges must stay within 10% extra"
+    assert '2 hedged of 20 requests (10.0% extra load' in policy.report()
+    print("  ✅ Hedge delay follows the observed p95 and extra load is capped")
+
+    try:
+        from zip_client import ZipClient
+    except ImportError:
+        skip_without_requests('the ZipClient checks')
+        return
+    from load_test import classify
+    from phase_timing import PhaseTimer
+    from stub_server import StubConfig, start_in_thread
+
+    server, base = start_in_thread(StubConfig(latency='fixed:500'))
+    client = ZipClient(base_url=base, max_retries=3, backoff_base=0.01, deadline=0.2, timer=PhaseTimer())
+    try:
+        start = time.perf_counter()
+        result = client.lookup('חיפה', 'כנרת', '7')
+        elapsed = time.perf_counter() - start
+        assert 'deadline of 0.2s exceeded' in result['error'] and classify(result) == 'timeout', result
+        assert elapsed < 0.4, f"Retries should stop at the deadline, took {elapsed:.2f}s"
+        assert client.timer.histograms[('api', 'deadline_exceeded')].count == 1
+    finally:
+        client.close()
+        server.shutdown()
+    print("  ✅ Retries stop at the lookup deadline and it shows up in the histograms")
+
+    server, base = start_in_thread(StubConfig())
+    client = ZipClient(base_url=base, max_retries=0, timer=PhaseTimer(),
+                       hedge=HedgePolicy(delay=0.05, max_extra=1.0))
+    get = client._get
+    calls = []
+
+    def first_call_stalls(url, timeout=None):
+        calls.append(url)
+        if len(calls) == 1:
+            time.sleep(0.5)  # A slow upstream response
+        return get(url, timeout)
+
+    client._get = first_call_stalls
+    try:
+        start = time.perf_counter()
+        result = client.lookup('חיפה', 'כנרת', '7')
+        elapsed = time.perf_counter() - start
+        assert result['valid'] and elapsed < 0.3, f"Hedge should answer first: {result} in {elapsed:.2f}s"
+        assert (client.hedge.hedges, client.hedge.wins) == (1, 1) and len(calls) == 2
+        assert client.timer.histograms[('api', 'hedged')].count == 1
+    finally:
+        client.close()
+        server.shutdown()
+    print("  ✅ A stalled request is hedged and the faster answer is used")
+
+    print("✅ Deadline and hedging tests passed\n")
+
+
+def test_cassette():
+    """Test cassette record/replay of API responses and website results"""
+    from cassette import Cassette, request_key
+
+    print("Testing record/replay cassette...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'cassettes', 'comparisons.json')
+        try:
+            Cassette(path, 'replay')
+            raise AssertionError("Replaying a missing cassette should fail")
+        except FileNotFoundError:
+            pass
+
+        recording = Cassette(path, 'record')
+        url = 'https://example.invalid/zip_data.nsf/SearchZip?OpenAgent&Location=חיפה&House=7'
+        recording.record_response(url, 503, 'busy')
+        recording.record_response(url, 200, 'RES03303000')
+        recording.record_website('חיפה', 'כנרת ', '7', '', {'zipCode': '3303000', 'source': 'website'})
+        recording.save()
+        with open(path, encoding='utf-8') as f:
+            first_save = f.read()
+        time.sleep(1.1)  # recorded_at has one-second resolution
+        again = Cassette(path, 'record')
+        again.record_response(url, 503, 'busy')
+        again.record_response(url, 200, 'RES03303000')
+        again.save()
+        with open(path, encoding='utf-8') as f:
+            assert f.read() == first_save, "Re-recording the same answers should leave the file unchanged"
+
+        replay = Cassette(path, 'replay')
+        stub_url = 'http://127.0.0.1:9/zip_data.nsf/SearchZip?' + request_key(url)
+        assert [replay.replay_response(stub_url)['status'] for _ in range(3)] == [503, 200, 200], \
+            "Responses replay in recorded order, the last one repeating"
+        assert replay.replay_website('חיפה', 'כנרת', '7')['zipCode'] == '3303000'
+        assert not replay.misses
+        missing = replay.replay_website('חיפה', 'הרצל', '1')
+        assert 'Not in cassette' in missing['error'] and replay.replay_response(url + '&Entrance=2') is None
+        assert replay.misses == ['website חיפה, הרצל, 1', f"API {request_key(url)}&Entrance=2"], replay.misses
+        assert '2 requests not in the cassette' in replay.report()
+    print("  ✅ Responses and website results round-trip through the file and misses are listed")
+
+    try:
+        from zip_client import ZipClient
+    except ImportError:
+        skip_without_requests('the ZipClient checks')
+        return
+    from stub_server import StubConfig, start_in_thread
+    from test_api_vs_website import ZipCodeTester
+
+    addresses = [('חיפה', 'כנרת', str(house)) for house in range(1, 21)]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'comparisons.json')
+        config = StubConfig(latency='fixed:50', error_rate=0.2)
+        server, base = start_in_thread(config)
+        recording = Cassette(path, 'record')
+        client = ZipClient(base_url=base, max_retries=5, backoff_base=0.01)
+        recording.attach(client)
+        try:
+            recorded = [client.lookup(*address) for address in addresses]
+        finally:
+            client.close()
+            server.shutdown()
+        for city, street, house in addresses:
+            recording.record_website(city, street, house, '', {'zipCode': '3303000', 'source': 'website'})
+        recording.save()
+        assert sum(len(responses) for responses in recording.api.values()) == config.counts['requests']
+
+        # Port 9 (discard) is never served: any request that reaches the network fails
+        offline = 'http://127.0.0.1:9/zip_data.nsf/SearchZip'
+        replay = Cassette(path, 'replay')
+        client = ZipClient(base_url=offline, max_retries=5, backoff_base=10)
+        replay.attach(client)
+        start = time.perf_counter()
+        try:
+            replayed = [client.lookup(*address) for address in addresses]
+            missing = client.lookup('חיפה', 'כנרת', '999')
+        finally:
+            client.close()
+        elapsed = time.perf_counter() - start
+        assert replayed == recorded, "Replay must return exactly what was recorded"
+        assert 'Not in cassette' in missing['error'] and len(replay.misses) == 1, replay.misses
+        assert elapsed < 0.5, f"Replay should neither sleep nor touch the network, took {elapsed:.2f}s"
+        print(f"  ✅ {len(addresses)} lookups ({config.counts['requests']} requests with retries) replayed "
+              f"offline in {elapsed * 1000:.0f} ms")
+
+        replay = Cassette(path, 'replay')
+        tester = ZipCodeTester(headless=True, cache_path=None, api_base_url=offline, cassette=replay)
+        try:
+            comparison = tester.compare_results(*addresses[0])
+        finally:
+            tester.close()
+        assert comparison['website']['zipCode'] == '3303000' and not replay.misses
+        assert comparison['match'] == (comparison['api'].get('zipCode') == '3303000')
+        assert tester._driver is None, "Replay must not start a browser"
+    print("  ✅ compare_results runs from the cassette without network or browser")
+
+    from test_api_vs_website import record_from_stub
+    cases = [{'city': 'חיפה', 'street': 'כנרת', 'house': '7', 'entrance': 'א'},
+             {'city': 'ירושלים', 'street': 'המלך ג\'ורג\'', 'house': '1'}]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'comparisons.json')
+        record_from_stub(cases, path)
+        replay = Cassette(path, 'replay')
+        assert replay.source == 'stub' and 'not the live site' in replay.report()
+        tester = ZipCodeTester(headless=True, cache_path=None, api_base_url=offline, cassette=replay)
+        try:
+            comparisons = [tester.compare_results(case['city'], case['street'], case['house'],
+                                                  case.get('entrance', '')) for case in cases]
+        finally:
+            tester.close()
+    assert all(comparison['match'] for comparison in comparisons) and not replay.misses, comparisons
+    print("  ✅ A cassette recorded from the stub replays with every case matching")
+
+    print("✅ Cassette tests passed\n")
+
+
+def test_response_cache():
+    """Test cache keys, TTL, negative caching and LRU eviction"""
+    from response_cache import ResponseCache, make_key
+
+    print("Testing response cache...")
+    assert make_key(' תל  אביב', 'דיזנגוף ', '50') == make_key('תל אביב', 'דיזנגוף', '50', ''), "Keys should ignore extra whitespace"
+    assert make_key('חיפה', 'כנרת', '7', 'א') != make_key('חיפה', 'כנרת', '7', 'ב'), "Entrance must be part of the key"
+    print("  ✅ Keys are whitespace-normalized and include the entrance")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'cache.sqlite3')
+        cache = ResponseCache(path, negative_ttl=-1, max_entries=3)
+        # A second pool worker on the same file, opened while empty and recounting the table on every put
+        worker = ResponseCache(path, max_entries=3, recount_every=1)
+
+        assert cache.get('חיפה', 'כנרת', '7', 'א') is None
+        cache.put('חיפה', 'כנרת', '7', 'א', 'RES73327233', '3327233')
+        hit = cache.get('חיפה', 'כנרת', '7', 'א')
+        assert hit['zipCode'] == '3327233' and hit['raw'] == 'RES73327233', f"Unexpected hit: {hit}"
+        print("  ✅ Stored responses are returned with raw body and zip")
+
+        cache.put('חיפה', 'כנרת', '999', '', 'RES0', None)
+        assert cache.get('חיפה', 'כנרת', '999') is None, "Expired negative entry should miss"
+        cache.put('חיפה', 'כנרת', '8', '', 'RES73327234', '3327234', ttl=-1)
+        assert cache.get('חיפה', 'כנרת', '8') is None, "Expired entry should miss"
+        print("  ✅ Expired and negative entries follow their TTL")
+
+        cache.put('תל אביב', 'דיזנגוף', '50', '', 'RES0', None, ttl=60)
+        assert cache.get('תל אביב', 'דיזנגוף', '50') is not None
+        assert cache.get('ת"א', 'דיזנגוף', '50') is None, "A negative answer belongs to its exact spelling"
+        cache.put('ת"א', 'דיזנגוף', '50', '', 'RES76433222', '6433222')
+        assert cache.get('תל אביב', 'דיזנגוף', '50')['zipCode'] == '6433222', "Resolved zips win for every spelling"
+        print("  ✅ Negative answers stay with their spelling; resolved zips are shared")
+
+        for house in ('1', '2', '3'):
+            cache.put('חיפה', 'הרצל', house, '', 'RES1000000' + house, '00000' + house + '0')
+            time.sleep(0.01)
+        cache.get('חיפה', 'הרצל', '1')  # Touch so '2' becomes least recently used
+        cache.put('חיפה', 'הרצל', '4', '', 'RES10000040', '0000040')
+        assert len(cache) <= 3, f"Size cap not enforced: {len(cache)}"
+        assert cache.get('חיפה', 'הרצל', '1') is not None, "Recently used entry was evicted"
+        assert cache.get('חיפה', 'הרצל', '2') is None, "Least recently used entry was kept"
+        print("  ✅ Least recently used entries are evicted past the size cap")
+
+        worker.put('חיפה', 'הרצל', '5', '', 'RES10000050', '0000050')
+        assert len(worker) == len(cache) == 3, f"Size cap drifted across processes: {len(cache)}"
+        assert cache.get('חיפה', 'הרצל', '4') is not None, "Entry evicted ahead of older ones"
+        worker.close()
+        print("  ✅ The size cap holds across caches sharing one file")
+
+        busy = ResponseCache(os.path.join(tmp, 'busy.sqlite3'), recount_every=50)
+        statements = []
+        busy._conn.set_trace_callback(statements.append)
+        for house in range(100):
+            busy.put('חיפה', 'הרצל', str(house), '', f"RES7{house:07d}", f"{house:07d}")
+        assert sum('COUNT(*)' in statement for statement in statements) == 2, "Expected one recount per 50 puts"
+
+        def touches():
+            return sum(statement.startswith('UPDATE responses SET last_access') for statement in statements)
+
+        for house in range(63):
+            busy.get('חיפה', 'הרצל', str(house))
+        assert busy.hits == 63 and touches() == 0, "A hit should not write on its own"
+        busy.get('חיפה', 'הרצל', '63')
+        assert touches() == 64, "A full batch of access times should be written together"
+        busy.close()
+        print("  ✅ Puts recount the table only every recount_every writes and hits batch their access times")
+
+        assert 0 < cache.hit_ratio < 1, f"Unexpected hit ratio {cache.hit_ratio}"
+        cache.close()
+
+        reopened = ResponseCache(path)
+        assert reopened.get('חיפה', 'הרצל', '4')['zipCode'] == '0000040', "Cache should persist on disk"
+        assert reopened.hit_ratio == 1.0
+        reopened.close()
+        print("  ✅ Entries persist across runs and the hit ratio is tracked")
+
+    print("✅ Response cache tests passed\n")
+
+
+def test_zip_index():
+    """Test building, mapping and querying the offline zip index"""
+    from zip_index import ZipIndex, build_index, iter_address_records
+
+    print("Testing zip index...")
+    records = [
+        {'city': 'חיפה', 'street': 'כנרת', 'house': '7', 'entrance': 'א', 'zipCode': '3327233', 'valid': True},
+        {'city': 'תל אביב', 'street': 'דיזנגוף', 'house': 50, 'entrance': '', 'zipCode': '6433222', 'valid': True},
+        {'city': 'חיפה', 'street': 'כנרת', 'house': '999', 'entrance': '', 'zipCode': None, 'valid': False},
+        {'city': 'חיפה', 'street': 'הרצל', 'house': '1', 'entrance': '', 'valid': False, 'error': 'timeout'},
+        {'city': 'חיפה', 'street': 'הרצל', 'house': '2', 'zip': '', 'status': 'blocked'},
+        {'city': 'חיפה', 'street': 'הרצל', 'house': '3', 'zip': '3303000', 'status': 'ok', 'error': ''},
+        {'city': 'חיפה', 'street': 'כנרת', 'house': '7', 'entrance': 'א', 'zipCode': '3327299', 'valid': True},
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'zip_index.bin')
+        assert build_index(records, path) == 3, "Errors, blocks and negatives should not be indexed by default"
+        with ZipIndex(path) as index:
+            assert index.get('חיפה', 'כנרת', '7', 'א') == '3327299', "The later record should win"
+            assert index.get('ת"א', 'רח\' דיזנגוף', '050') == '6433222', "Lookups should use the normalized key"
+            assert index.get('חיפה', 'הרצל', '3') == '3303000', "bulk_resolve.py rows should be indexed"
+            for address in (('חיפה', 'כנרת', '7', 'ב'), ('חיפה', 'כנרת', '999'), ('חיפה', 'הרצל', '1'),
+                            ('חיפה', 'הרצל', '2'), ('א', 'ב', '1'), ('ת', 'ת', '9')):
+                assert index.get(*address) is None, f"{address} should miss"
+            assert (index.hits, index.misses) == (3, 6), f"Unexpected counters {index.hits}/{index.misses}"
+        print("  ✅ Known addresses hit under any spelling, everything else misses")
+
+        build_index(records, path, include_negative=True)
+        with ZipIndex(path) as index:
+            assert len(index) == 4 and index.get('חיפה', 'כנרת', '999') == '', "Negative answer should be kept"
+            assert index.get('חיפה', 'רחוב כנרת', '999') is None, "A negative answer belongs to its exact spelling"
+        assert build_index([], path) == 0
+        with ZipIndex(path) as index:
+            assert index.get('חיפה', 'כנרת', '7', 'א') is None, "An empty index should miss"
+        print("  ✅ Negative answers are opt-in and an empty index works")
+
+        jsonl_path, json_path = os.path.join(tmp, 'results.jsonl'), os.path.join(tmp, 'valid.json')
+        with open(jsonl_path, 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps(record, ensure_ascii=False) + '\n' for record in records[:2])
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(records[:2], f, ensure_ascii=False, indent=2)
+        assert list(iter_address_records(jsonl_path)) == list(iter_address_records(json_path)) == records[:2]
+        print("  ✅ JSONL results and JSON lists read the same")
+
+        build_index(records, path)
+        with open(path, 'rb') as f:
+            data = f.read()
+        for corrupt in (b'', data[:-1], b'NOPE' + data[4:]):
+            with open(path, 'wb') as f:
+                f.write(corrupt)
+            try:
+                ZipIndex(path).close()
+                raise AssertionError("A damaged index file should be rejected")
+            except ValueError:
+                pass
+        print("  ✅ Truncated and foreign files are rejected")
+
+        try:
+            from zip_client import ZipClient
+        except ImportError:
+            skip_without_requests('the ZipClient check')
+            return
+        with open(path, 'wb') as f:
+            f.write(data)
+        # Nothing listens on port 9, so any lookup that reaches the network fails
+        client = ZipClient(base_url='http://127.0.0.1:9/SearchZip?OpenAgent', max_retries=0, index=ZipIndex(path))
+        try:
+            assert client.lookup('חיפה', 'כנרת', '7', 'א') == {'valid': True, 'zipCode': '3327299', 'raw': None}
+            assert 'error' in client.lookup('חיפה', 'כנרת', '8'), "An index miss should go upstream"
+        finally:
+            client.close()
+        print("  ✅ ZipClient answers index hits without a request")
+
+    print("✅ Zip index tests passed\n")
+
+
+def test_wait_engine():
+    """Test the website wait conditions against a scripted fake driver"""
+    from deadlines import Deadline, DeadlineExceeded
+    from page_waits import WaitEngine, format_breakdown, merge_timings
+
+    class FakeDriver:
+        """Returns scripted counter values for execute_script calls"""
+        def __init__(self, values):
+            self.values = list(values)
+
+        def execute_script(self, script):
+            return self.values.pop(0) if len(self.values) > 1 else self.values[0]
+
+    print("Testing wait engine...")
+    waits = WaitEngine(autocomplete_timeout=1, result_timeout=1, poll_interval=0.01, settle_time=0.05)
+
+    with waits.step('fill_city'):
+        assert waits.autocomplete_settled(FakeDriver([0, 3, 5, 5])), "Settled list should be detected"
+    print("  ✅ Autocomplete list settles once its size stops changing")
+
+    calls = {'count': 0}
+
+    def find_result(driver):
+        calls['count'] += 1
+        return '3327233' if calls['count'] >= 3 else None
+
+    with waits.step('results'):
+        assert waits.result_ready(FakeDriver([[n, 0] for n in range(1, 7)]), find_result) == '3327233'
+    assert waits.result_ready(FakeDriver([[7, 0]]), lambda driver: None) is None, "Network idle should end the wait"
+    # A request still in flight is not idle, however long nothing new has started
+    late = {'count': 0}
+
+    def find_late_result(driver):
+        late['count'] += 1
+        return '3327233' if late['count'] >= 40 else None
+
+    assert waits.result_ready(FakeDriver([[7, 1]]), find_late_result) == '3327233', \
+        "An in-flight request should keep the result wait open past the settle time"
+    assert waits.network_idle(FakeDriver([[3, 1], [4, 1], [4, 0]]), timeout=1)
+    assert not waits.network_idle(FakeDriver([[4, 1]]), timeout=0.2)
+    print("  ✅ Result wait ends on a result node or network idle, never while a request is in flight")
+
+    timings = merge_timings({}, waits.drain())
+    assert set(timings) == {'fill_city', 'results'} and waits.timings == {}, f"Unexpected timings: {timings}"
+    assert 'Wall time per address' in format_breakdown(timings, 1)
+    # The old flow slept 6.5s per address, plus 0.5s only when an entrance was filled in
+    assert 'old fixed sleeps alone: 6.50s' in format_breakdown(timings, 2)
+    assert 'old fixed sleeps alone: 7.00s' in format_breakdown({**timings, 'fill_entrance': [0.1]}, 1)
+    assert 'old fixed sleeps alone: 6.75s' in format_breakdown({**timings, 'fill_entrance': [0.1]}, 2)
+    print("  ✅ Step timings are recorded and reported against the old per-case sleeps")
+
+    waits.deadline = Deadline(0.05, 'Website')
+    try:
+        waits.result_ready(FakeDriver([[n, 0] for n in range(1, 11)]), lambda driver: None)
+        raise AssertionError("The result wait should stop at the search deadline")
+    except DeadlineExceeded as e:
+        assert 'Website deadline' in str(e)
+    print("  ✅ Waits stop at the search deadline")
+
+    print("✅ Wait engine tests passed\n")
+
+
+def test_lean_profile():
+    """Test the lean page profile's blocklist and the page-ready report"""
+    from browser import RESOURCE_PATTERNS, THIRD_PARTY_HOSTS, lean_blocklist
+    from page_waits import format_page_ready, page_ready_summary
+
+    def blocked(url, patterns):
+        """Match a URL the way Network.setBlockedURLs does: '*' is the only wildcard"""
+        return any(re.fullmatch('.*'.join(map(re.escape, pattern.split('*'))), url) for pattern in patterns)
+
+    print("Testing lean page profile...")
+    patterns = lean_blocklist()
+    assert '*.png' in patterns and '*.woff2?*' in patterns and '*.mp4' in patterns, f"Missing patterns: {patterns}"
+    assert not any('css' in pattern for pattern in patterns), "Stylesheets should load unless asked for"
+    site = 'https://doar.israelpost.co.il/'
+    for url in ('logo.png', 'fonts/heebo.woff2?v=3', 'favicon.ico', 'clip.mp4'):
+        assert blocked(site + url, patterns), f"{url} should be blocked"
+    for url in ('icons/menu.icon', 'locatezip?x.png=1', 'api/pngs', 'fonts.woff2.js'):
+        assert not blocked(site + url, patterns), f"{url} should load"
+    assert blocked(site + 'site.css?v=2', RESOURCE_PATTERNS['stylesheet'])
+    assert not blocked(site + 'locatezip?x.css=1', RESOURCE_PATTERNS['stylesheet'])
+    assert set(THIRD_PARTY_HOSTS) <= set(patterns), "Third-party hosts should always be blocked"
+    assert lean_blocklist(('stylesheet',), hosts=[]) == RESOURCE_PATTERNS['stylesheet']
+    try:
+        lean_blocklist(('image', 'script'))
+        assert False, "An unknown resource type should raise"
+    except ValueError as e:
+        assert 'script' in str(e)
+    print("  ✅ Blocklist covers the chosen resource types by file extension and third-party hosts")
+
+    summary = page_ready_summary({'navigate': [1.0], 'form_ready': [0.5], 'form_reuse': [0.1, 0.2]})
+    assert summary['full_loads'] == 1 and summary['reuses'] == 2
+    assert abs(summary['full_load_avg'] - 1.5) < 1e-9 and abs(summary['reuse_avg'] - 0.15) < 1e-9
+    assert abs(summary['saved'] - 2.7) < 1e-9, f"Unexpected saving: {summary}"
+    assert 'reused forms' in format_page_ready({'navigate': [1.0], 'form_ready': [0.5], 'form_reuse': [0.1]})
+    assert 'reused' not in format_page_ready({'navigate': [1.0], 'form_ready': [0.5]})
+    print("  ✅ Page-ready report compares full loads with reused forms")
+
+    from page_waits import MARK_STALE_SCRIPT, STALE_ATTRIBUTE, mark_stale_results
+
+    class Element:
+        def __init__(self, text, stale):
+            self.text = text
+            self.stale = stale
+
+        def get_attribute(self, name):
+            return '1' if name == STALE_ATTRIBUTE and self.stale else None
+
+    class ResultPage:
+        """Result nodes by XPath; execute_script records the marker call"""
+        def __init__(self, elements):
+            self.elements = elements
+            self.scripts = []
+
+        def execute_script(self, script, *args):
+            self.scripts.append((script, args))
+
+        def find_elements(self, by, selector):
+            return self.elements if selector == RESULT_SELECTORS[0] else []
+
+    try:
+        import selenium  # noqa: F401 - _find_zip_in_results imports selenium's locators
+        from test_api_vs_website import RESULT_SELECTORS, ZipCodeTester
+    except ImportError:
+        print("  ⚠️  selenium not installed - skipping the result marker check\n")
+        return
+    page = ResultPage([])
+    mark_stale_results(page, RESULT_SELECTORS)
+    assert page.scripts == [(MARK_STALE_SCRIPT, (RESULT_SELECTORS,))] and 'MutationObserver' in MARK_STALE_SCRIPT
+    tester = ZipCodeTester(headless=True, cache_path=None)
+    try:
+        # The same zip as the previous search, but re-rendered after the submit - it is this search's answer
+        assert tester._find_zip_in_results(ResultPage([Element('3327233', False)])) == '3327233'
+        assert tester._find_zip_in_results(ResultPage([Element('3327233', True)])) is None, \
+            "A node untouched since the submit still holds the previous answer"
+    finally:
+        tester.close()
+    print("  ✅ Result nodes from before the submit are skipped, re-rendered ones count even with the same zip")
+
+    print("✅ Lean page profile tests passed\n")
+
+
+def test_network_capture():
+    """Test reading the zip from captured XHR/fetch responses with a scripted DevTools log"""
+    import base64
+    from network_capture import NetworkCapture, zip_from_body
+
+    def event(method, **params):
+        return {'level': 'INFO', 'message': json.dumps({'message': {'method': method, 'params': params}})}
+
+    def exchange(request_id, url, kind='XHR'):
+        return [
+            event('Network.requestWillBeSent', requestId=request_id, type=kind, request={'url': url}),
+            event('Network.responseReceived', requestId=request_id, type=kind, response={'url': url}),
+            event('Network.loadingFinished', requestId=request_id),
+        ]
+
+    class FakeDriver:
+        def __init__(self, batches, bodies):
+            self.batches = list(batches)  # One list of log entries per get_log() call
+            self.bodies = bodies
+            self.body_requests = []
+
+        def get_log(self, name):
+            assert name == 'performance'
+            return self.batches.pop(0) if self.batches else []
+
+        def execute_cdp_cmd(self, command, params):
+            if command == 'Network.getResponseBody':
+                self.body_requests.append(params['requestId'])
+                if params['requestId'] not in self.bodies:
+                    raise RuntimeError('No resource with given identifier found')
+                return self.bodies[params['requestId']]
+            return {}
+
+    print("Testing network capture...")
+    assert zip_from_body('{"id": 1234567, "data": {"zipCode": "3327233", "phone": "0501234567"}}') == '3327233'
+    assert zip_from_body('[{"street": "כנרת", "Mikud": 3327233}]') == '3327233'
+    assert zip_from_body('{"result": "RES83327233"}') == '3327233'
+    assert zip_from_body('RES83327233') == zip_from_body(' 3327233\n') == '3327233'
+    assert zip_from_body('{"id": 1234567, "count": 12345}') is None, "Numbers under other keys are not zips"
+    assert zip_from_body('<div>Call 1234567</div>') is None, "Free text is never scanned for digits"
+    assert zip_from_body('') is None and zip_from_body(None) is None
+    print("  ✅ Zips are read by key or SearchZip format, unrelated numbers are ignored")
+
+    old_events = exchange('old', 'https://doar.israelpost.co.il/api/zip')
+    driver = FakeDriver(
+        [old_events,  # Consumed by clear()
+         exchange('img', 'https://doar.israelpost.co.il/logo.png', kind='Image')
+         + exchange('fail', 'https://doar.israelpost.co.il/api/log')[:2]
+         + [event('Network.loadingFailed', requestId='fail')]
+         + exchange('evicted', 'https://doar.israelpost.co.il/api/config'),
+         [],
+         exchange('zip', 'https://doar.israelpost.co.il/api/zip')],
+        {'old': {'body': '{"zip": "1111111"}'},
+         'img': {'body': '{"zip": "2222222"}'},
+         'zip': {'body': base64.b64encode('{"zip": "3327233"}'.encode()).decode(), 'base64Encoded': True}},
+    )
+    capture = NetworkCapture(driver, poll_interval=0)
+    capture.clear()
+    assert capture.wait_for_zip(timeout=1) == {'zipCode': '3327233', 'url': 'https://doar.israelpost.co.il/api/zip'}
+    assert driver.body_requests == ['evicted', 'zip'], f"Unexpected body reads: {driver.body_requests}"
+    print("  ✅ Only finished XHR/fetch responses are read; earlier, failed and evicted ones are skipped")
+
+    driver = FakeDriver([exchange('other', 'https://doar.israelpost.co.il/api/config')], {'other': {'body': '{}'}})
+    capture = NetworkCapture(driver, poll_interval=0.01, idle_time=0.05)
+    start = time.monotonic()
+    assert capture.wait_for_zip(timeout=5) is None
+    assert time.monotonic() - start < 1, "A quiet network should end the wait long before the timeout"
+
+    driver = FakeDriver([exchange('zip', 'https://cdn.example.com/zip')], {'zip': {'body': '{"zip": "3327233"}'}})
+    capture = NetworkCapture(driver, url_pattern=r'israelpost\.co\.il', poll_interval=0.01, idle_time=0.05)
+    assert capture.wait_for_zip(timeout=5) is None, "Responses outside url_pattern must be ignored"
+    print("  ✅ Gives up once the network is idle and honours the URL filter")
+
+    print("✅ Network capture tests passed\n")
+
+
+class FakePoolTester:
+    """Stands in for ZipCodeTester in pool workers: no browser, counts restarts, 'crash' loses the session"""
+    def __init__(self, timer=None, **options):
+        from page_waits import WaitEngine
+        from phase_timing import PhaseTimer
+
+        self.timer = timer or PhaseTimer()
+        self.waits = WaitEngine(timer=self.timer)
+        self.client = type('Client', (), {'cache': None})()
+        self.session = 0
+        self.alive = True
+
+    def compare_results(self, city, street, house, entrance=''):
+        if house == 'crash':
+            self.alive = False
+            return {'session': self.session, 'website': {'error': 'invalid session id'}}
+        return {'session': self.session, 'started': time.monotonic(), 'website': {'zipCode': '3327233'}}
+
+    def restart_driver(self):
+        self.session += 1
+        self.alive = True
+
+    def driver_alive(self):
+        return self.alive
+
+    def close(self):
+        pass
+
+
+def dying_pool_tester(**options):
+    """ZipCodeTester with a fake browser whose session dies in the middle of the search for house 'dies'"""
+    from test_api_vs_website import ZipCodeTester
+
+    class FakeDriver:
+        def __init__(self):
+            self.dead = False
+
+        @property
+        def current_url(self):
+            if self.dead:
+                raise RuntimeError('invalid session id')
+            return 'https://doar.israelpost.co.il/locatezip'
+
+        def save_screenshot(self, path):
+            self.current_url  # A crashed browser cannot take one either
+            return True
+
+        def quit(self):
+            pass
+
+    class DyingTester(ZipCodeTester):
+        def _create_driver(self):
+            self.session = getattr(self, 'session', -1) + 1
+            return FakeDriver()
+
+        def search_via_api(self, city, street, house, entrance=''):
+            return {'zipCode': '3327233', 'source': 'api'}
+
+        def _search_via_website(self, city, street, house, entrance):
+            try:
+                self.driver.current_url
+                if house == 'dies':
+                    self.driver.dead = True
+                    self.driver.current_url
+                return {'zipCode': '3327233', 'source': 'website', 'session': self.session}
+            except Exception as e:
+                return self._website_error(e)
+
+    options.update(cache_path=None)
+    return DyingTester(**options)
+
+
+def test_driver_pool():
+    """Test that pool workers recycle their browser after K uses and after a lost session"""
+    from driver_pool import run_comparisons
+    from result_sink import JsonlSink
+
+    print("Testing driver pool...")
+    cases = [{'city': 'חיפה', 'street': 'כנרת', 'house': house} for house in ('1', '2', '3', 'crash', '5', '6')]
+    results, stats = run_comparisons(cases, workers=1, max_uses=2, rate=None, tester_factory=FakePoolTester)
+    assert [result['session'] for result in results] == [0, 0, 1, 1, 2, 2], f"Unexpected sessions: {results}"
+    assert stats['recycled'] == 2, f"Expected 2 recycled cases, got {stats['recycled']}"
+    print("  ✅ A worker restarts its browser after max_uses searches and right after a lost session")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'results.jsonl')
+        sink = JsonlSink(path)
+        for index in range(3):
+            sink.write(index, {'session': -1})
+        results, _ = run_comparisons(cases, sink=sink, workers=2, max_uses=2, rate=None,
+                                     tester_factory=FakePoolTester)
+        sink.close()
+        with open(path, encoding='utf-8') as f:
+            indices = [json.loads(line)['index'] for line in f]
+    assert results is None and sorted(indices) == list(range(6)), f"Unexpected sink contents: {indices}"
+    print("  ✅ Cases already in the sink are skipped and the rest are streamed to it")
+
+    results, _ = run_comparisons(cases[:3] * 2, workers=3, rate=20, tester_factory=FakePoolTester)
+    starts = sorted(result['started'] for result in results)
+    gaps = [later - earlier for earlier, later in zip(starts, starts[1:])]
+    assert min(gaps) >= 0.04, f"Comparisons started closer together than the pool-wide rate allows: {gaps}"
+    print("  ✅ One rate ceiling paces every worker together, with no sleep after each case")
+
+    try:
+        import zip_client  # noqa: F401 - ZipCodeTester needs requests
+    except ImportError:
+        skip_without_requests('the lost-session pool check')
+        return
+    cases = [{'city': 'חיפה', 'street': 'כנרת', 'house': house} for house in ('1', 'dies', '3', '4')]
+    results, stats = run_comparisons(cases, workers=1, max_uses=10, rate=None, tester_factory=dying_pool_tester)
+    assert 'invalid session id' in results[1]['website']['error'], f"Unexpected result: {results[1]}"
+    assert [result['website'].get('session') for result in results] == [0, None, 1, 1], results
+    assert stats['recycled'] == 1, f"Expected one restart, got {stats['recycled']}"
+    print("  ✅ A browser that dies mid-search fails that case only; the worker restarts it and carries on")
+
+    print("✅ Driver pool tests passed\n")
+
+
+def test_work_queue():
+    """Test shard leases, lease reclaiming, result merging and the shared rate limit"""
+    import sqlite3
+    from batch_resolver import RateLimiter
+    from work_queue import SharedRateLimiter, WorkQueue, run_worker, sweep_addresses
+
+    print("Testing work queue...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'queue.sqlite3')
+        queue_a = WorkQueue(path, lease_seconds=60, worker_id='a')
+        queue_b = WorkQueue(path, lease_seconds=60, worker_id='b')
+        assert queue_a.enqueue(sweep_addresses(['חיפה'], ['כנרת', 'הרצל'], 1, 12), shard_size=10) == 3
+        first, second = queue_a.lease(), queue_b.lease()
+        assert (first.id, second.id, len(first.addresses)) == (1, 2, 10), "Each worker gets its own shard"
+        assert first.addresses[0] == ('חיפה', 'כנרת', '1', '')
+
+        error = {'city': 'חיפה', 'street': 'כנרת', 'house': '1', 'entrance': '', 'zipCode': None, 'valid': False,
+                 'error': 'timeout'}
+        valid = {'city': 'חיפה', 'street': 'רחוב כנרת', 'house': '01', 'entrance': '', 'zipCode': '3327201',
+                 'valid': True}
+        assert queue_a.complete(first, [valid]) and queue_b.complete(second, [error])
+        assert [record['zipCode'] for record in queue_a.iter_results()] == ['3327201'], "Valid answer should win"
+        print("  ✅ Shards are leased once and results merge on the normalized address")
+
+        quick = WorkQueue(path, lease_seconds=0.05, worker_id='crashed')
+        abandoned = quick.lease()
+        time.sleep(0.1)
+        reclaimed = queue_b.lease()
+        assert reclaimed.id == abandoned.id and reclaimed.attempt == 2, "An expired lease should be reclaimed"
+        assert not quick.complete(abandoned, []), "A worker that lost its lease must not finish the shard"
+        assert queue_b.complete(reclaimed, []) and queue_b.lease() is None
+        status = queue_b.status()
+        assert (status['done'], status['reclaimed'], status['pending']) == (3, 1, 0), f"Unexpected status: {status}"
+        for queue in (queue_a, queue_b, quick):
+            queue.close()
+        print("  ✅ Expired leases from crashed workers are reclaimed")
+
+        capped = WorkQueue(os.path.join(tmp, 'capped.sqlite3'), lease_seconds=0, max_attempts=2)
+        capped.enqueue(sweep_addresses(['חיפה'], ['כנרת'], 1, 3))
+        assert capped.lease().attempt == 1 and capped.lease().attempt == 2, "An expired lease is leased again"
+        assert capped.lease() is None and capped.status()['failed'] == 1, "A shard must give up after max_attempts"
+        capped.close()
+        print("  ✅ A shard that keeps failing is marked failed after max_attempts leases")
+
+        path = os.path.join(tmp, 'stolen.sqlite3')
+        slow = WorkQueue(path, lease_seconds=0.1, worker_id='slow')
+        thief = WorkQueue(path, lease_seconds=60, worker_id='thief')
+        slow.enqueue(sweep_addresses(['חיפה'], ['כנרת'], 1, 5))
+        stolen = []
+        looked_up = []
+
+        def stalling_lookup(city, street, house, entrance=''):
+            looked_up.append(house)
+            if house == '3':
+                time.sleep(0.15)  # Long enough for the lease to expire and be taken over
+                stolen.append(thief.lease())
+            return {'valid': True, 'zipCode': '3327233'}
+
+        assert run_worker(slow, stalling_lookup, concurrency=1, rate_limit=RateLimiter()) == 0
+        assert stolen[0].attempt == 2 and looked_up == ['1', '2', '3'], f"Looked up after losing the lease: {looked_up}"
+        assert len(list(thief.iter_results())) == 3, "Answers found before the lease was lost are still merged"
+        slow.close()
+        thief.close()
+        print("  ✅ A worker whose lease was reclaimed stops working on the shard")
+
+        conn = sqlite3.connect(path)
+        conn.execute("UPDATE host SET name = 'elsewhere'")
+        conn.commit()
+        conn.close()
+        try:
+            WorkQueue(path)
+            raise AssertionError("A queue created on another machine should be refused")
+        except ValueError as e:
+            assert 'elsewhere' in str(e)
+        print("  ✅ A queue file is only worked from the machine that created it")
+
+        path = os.path.join(tmp, 'sweep.sqlite3')
+        queue = WorkQueue(path)
+        addresses = list(sweep_addresses(['חיפה', 'עכו'], ['כנרת', 'הרצל'], 1, 10))
+        queue.enqueue(addresses + addresses[:10], shard_size=5)  # Overlapping work merges into one record each
+        queue.close()
+        blocked_once = []
+        looked_up = []
+
+        def lookup(city, street, house, entrance=''):
+            looked_up.append((city, street, house))
+            time.sleep(0.02)
+            if house == '7' and not blocked_once:
+                blocked_once.append(house)
+                return {'valid': False, 'blocked': True, 'error': 'blocked'}
+            return {'valid': True, 'zipCode': f"{len(city)}{len(street)}{int(house):05d}"}
+
+        def drain(workers, rate=None):
+            queues = [WorkQueue(path, worker_id=f"w{i}") for i in range(workers)]
+            if rate is not None:
+                queues[0].set_rate(rate)
+            start = time.perf_counter()
+            threads = [threading.Thread(target=run_worker, args=(q, lookup, 1, SharedRateLimiter(q, block_pause=0.2)))
+                       for q in queues]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            status = queues[0].status()
+            results = list(queues[0].iter_results())
+            for q in queues:
+                q.close()
+            return elapsed, status, results
+
+        single, status, results = drain(1)
+        assert status['done'] == 11 and len(results) == len(addresses), f"Expected {len(addresses)} merged: {status}"
+        assert blocked_once and all(record['valid'] for record in results), "A blocked address should be retried"
+        assert len(looked_up) == len(addresses) + 10 + 1, "Only the blocked address should be looked up again"
+        assert single >= 0.2, "Even without a rate, a block pauses the workers"
+
+        def reset():
+            conn = sqlite3.connect(path)
+            conn.execute('DELETE FROM shards WHERE id > 10')
+            conn.execute("UPDATE shards SET state = 'pending', owner = NULL, lease_expires = NULL, attempts = 0")
+            conn.execute('DELETE FROM results')
+            conn.commit()
+            conn.close()
+
+        reset()
+        single, _, _ = drain(1)  # Timed again without the block pause
+        reset()
+        parallel, status, results = drain(4)
+        assert status['done'] == 10 and len(results) == len(addresses)
+        assert single / parallel > 2.5, f"4 workers should be close to 4x faster: {single:.2f}s vs {parallel:.2f}s"
+        print(f"  ✅ Workers drain the queue in parallel ({single / parallel:.1f}x faster with 4) into one output")
+
+        reset()
+        limited, _, _ = drain(4, rate=100)
+        assert limited >= 0.4, f"50 lookups at 100 req/s shared by 4 workers took only {limited:.2f}s"
+        limiter = SharedRateLimiter(WorkQueue(path))
+        assert limiter.rate == 100
+        limiter.queue.close()
+        print("  ✅ The request rate stored in the queue holds across all workers")
+
+    print("✅ Work queue tests passed\n")
+
+
+def test_phase_timing():
+    """Test the phase histograms, their exports and the disabled fast path"""
+    import json
+    from page_waits import WaitEngine
+    from phase_timing import PhaseTimer
+
+    print("Testing phase timing...")
+    timer = PhaseTimer(buckets=(0.01, 0.1, 1.0))
+    for seconds in (0.005, 0.05, 0.05, 0.5, 5.0):
+        timer.observe('api', 'ttfb', seconds)
+    with timer.phase('api', 'parse'):
+        pass
+    waits = WaitEngine(timer=timer)
+    with waits.step('navigate'):
+        pass
+    assert waits.drain().keys() == {'navigate'}, "Steps must still be recorded on the engine"
+
+    prometheus = timer.to_prometheus()
+    assert 'mikud_phase_seconds_bucket{path="api",phase="ttfb",le="0.1"} 3' in prometheus
+    assert 'mikud_phase_seconds_bucket{path="api",phase="ttfb",le="+Inf"} 5' in prometheus
+    assert 'mikud_phase_seconds_count{path="website",phase="navigate"} 1' in prometheus
+    exported = json.loads(json.dumps(timer.to_json()))
+    ttfb = exported['phases']['api']['ttfb']
+    assert (ttfb['count'], ttfb['p50'], ttfb['p99']) == (5, 0.1, None), f"Unexpected quantiles: {ttfb}"
+    print("  ✅ Prometheus buckets are cumulative; JSON carries counts and bucket quantiles")
+
+    merged = PhaseTimer(buckets=(0.01, 0.1, 1.0))
+    merged.merge(timer.drain())
+    merged.merge(json.loads(json.dumps(merged.snapshot())))
+    assert merged.histograms[('api', 'ttfb')].count == 10 and not timer.histograms
+    print("  ✅ Snapshots from worker processes merge into one timer")
+
+    disabled = PhaseTimer(enabled=False)
+    assert disabled.phase('api', 'dns') is disabled.phase('api', 'parse'), "Disabled phases must share one no-op"
+    start = time.perf_counter()
+    for _ in range(100000):
+        with disabled.phase('api', 'dns'):
+            pass
+    per_call = (time.perf_counter() - start) / 100000
+    assert not disabled.histograms and per_call < 5e-6, f"Disabled timing costs {per_call * 1e9:.0f}ns per phase"
+    print(f"  ✅ Disabled timing records nothing ({per_call * 1e9:.0f}ns per phase)")
+
+    try:
+        import zip_client
+    except ImportError:
+        skip_without_requests('the timed connection check')
+        return
+    import socket
+    from stub_server import StubConfig, start_in_thread
+
+    server, base = start_in_thread(StubConfig())
+    real_getaddrinfo = socket.getaddrinfo
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        if host != 'stub.test':
+            return real_getaddrinfo(host, port, *args, **kwargs)
+        # Nothing listens on 127.0.0.2 - the connection has to fall back to the second address
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', (address, port)) for address in ('127.0.0.2', '127.0.0.1')]
+
+    socket.getaddrinfo = getaddrinfo
+    timer = PhaseTimer()
+    client = zip_client.ZipClient(base_url=base.replace('127.0.0.1', 'stub.test'), max_retries=0, timer=timer)
+    try:
+        result = client.lookup('חיפה', 'כנרת', '7')
+    finally:
+        socket.getaddrinfo = real_getaddrinfo
+        client.close()
+        server.shutdown()
+    assert result.get('valid'), f"Timed connections should try every resolved address: {result}"
+    assert timer.histograms[('api', 'dns')].count == timer.histograms[('api', 'connect')].count == 1
+    assert zip_client._timed_connection_class(object, timer) is object, "No _new_conn hook: connect untimed"
+    print("  ✅ Timed connections walk every resolved address and fall back when urllib3 has no hook")
+
+    print("✅ Phase timing tests passed\n")
+
+
+def test_result_sink():
+    """Test streaming results, resuming from a checkpoint and exporting JSON"""
+    import json
+    from result_sink import JsonlSink, input_fingerprint, iter_records, write_json_array
+
+    print("Testing result sink...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'results.jsonl')
+        sink = JsonlSink(path, checkpoint_every=2)
+        for index in (0, 1, 3, 4):
+            sink.write(index, {'zipCode': f"{index:07d}"})
+        # Simulate a crash: no close(), and a half-written record at the end
+        sink._file.write('{"index": 2, "zipC')
+        sink._file.flush()
+
+        resumed = JsonlSink(path, checkpoint_every=2)
+        assert resumed.resumed == 4, f"Expected 4 finished inputs, got {resumed.resumed}"
+        assert [i for i in range(6) if not resumed.is_done(i)] == [2, 5], "Only unfinished inputs should remain"
+        assert resumed.watermark == 2, f"Watermark should stop at the gap, got {resumed.watermark}"
+        print("  ✅ Restart skips finished inputs and drops the partial record")
+
+        resumed.write(2, {'zipCode': '0000002'})
+        assert resumed.watermark == 5 and not resumed._done_above, "Watermark should advance past the gap"
+        resumed.close()
+        print("  ✅ Watermark advances and out-of-order indices are released")
+
+        records = list(iter_records(path))
+        assert sorted(r['index'] for r in records) == [0, 1, 2, 3, 4], f"Unexpected records: {records}"
+
+        path = os.path.join(tmp, 'probe.jsonl')
+        inputs = [{'city': 'חיפה', 'house': str(house)} for house in range(1, 101)]
+        sink = JsonlSink(path, fingerprint=input_fingerprint(inputs))
+        for index in range(100):
+            sink.write(index, {'blocked': True} if index % 10 == 0 else {'zipCode': '3327233'})
+        assert sink.watermark == 100 and not sink._done_above, "Blocked records must not hold the watermark back"
+        sink.close()
+        resumed = JsonlSink(path, fingerprint=input_fingerprint(inputs))
+        assert [i for i in range(100) if not resumed.is_done(i)] == list(range(0, 100, 10)), \
+            "Blocked inputs should be probed again by the next run"
+        assert resumed.resumed == 90 and not resumed.restarted
+        resumed.write(10, {'zipCode': '3327233'})
+        assert resumed.is_done(10)
+        resumed.close()
+
+        edited = [{'city': 'עכו', 'house': '1'}] + inputs  # Every index now points at another address
+        restarted = JsonlSink(path, fingerprint=input_fingerprint(edited))
+        assert restarted.restarted and restarted.resumed == 0 and not restarted.is_done(1)
+        restarted.close()
+        assert list(iter_records(path)) == [], "Results for the old inputs should be discarded"
+        print("  ✅ Blocked results keep the checkpoint moving and are redone; changed inputs start over")
+
+        sink = JsonlSink(path, fingerprint=input_fingerprint(inputs))
+        for index in range(5):
+            sink.write(index, {'zipCode': '3327233'})
+        sink.close()
+        for garbage in ('{"fingerprint": ', '{"watermark": 3}', '[]'):
+            with open(path + '.ckpt', 'w', encoding='utf-8') as f:
+                f.write(garbage)
+            corrupt = JsonlSink(path, fingerprint=input_fingerprint(edited))
+            assert corrupt.restarted and corrupt.resumed == 0 and not corrupt.is_done(0), \
+                f"A corrupt checkpoint cannot vouch for the inputs: {garbage!r}"
+            corrupt.write(0, {'zipCode': '3327233'})
+            corrupt.close()
+        with open(path + '.ckpt', 'w', encoding='utf-8') as f:
+            f.write('not json')
+        rescanned = JsonlSink(path)
+        assert rescanned.resumed == 1 and rescanned.is_done(0) and not rescanned.is_done(1)
+        rescanned.close()
+        print("  ✅ A corrupt checkpoint starts over when fingerprinted and rescans from the start otherwise")
+
+        out = os.path.join(tmp, 'results.json')
+        data = [{'city': 'חיפה', 'zipCode': '3327233'}, {'city': 'תל אביב', 'nested': {'a': 1}}]
+        assert write_json_array(iter(data), out) == 2
+        with open(out, encoding='utf-8') as f:
+            assert f.read() == json.dumps(data, ensure_ascii=False, indent=2), "Export must match json.dump layout"
+        write_json_array(iter([]), out)
+        with open(out, encoding='utf-8') as f:
+            assert f.read() == '[]'
+        print("  ✅ Streamed JSON export matches json.dump(indent=2)")
+
+    print("✅ Result sink tests passed\n")
+
+
+def test_range_discovery():
+    """Test that bisection finds zip boundaries with few lookups"""
+    from range_discovery import discover_ranges, discover_street_ranges
+
+    def street_zip(house):
+        # Odd side changes at 41, even side at 90, no houses above 150
+        if house > 150:
+            return None
+        if house % 2:
+            return '3100000' if house < 41 else '3200000'
+        return '3300000' if house < 90 else '3400000'
+
+    print("Testing range discovery...")
+    calls = []
+    ranges = discover_street_ranges(lambda house: calls.append(house) or street_zip(house), 1, 200)
+    expected = [
+        {'from_house': 1, 'to_house': 39, 'zip': '3100000', 'side': 'odd'},
+        {'from_house': 2, 'to_house': 88, 'zip': '3300000', 'side': 'even'},
+        {'from_house': 41, 'to_house': 149, 'zip': '3200000', 'side': 'odd'},
+        {'from_house': 90, 'to_house': 150, 'zip': '3400000', 'side': 'even'},
+    ]
+    assert ranges == expected, f"Unexpected ranges: {ranges}"
+    assert len(calls) == len(set(calls)) and len(calls) < 40, f"Too many lookups: {len(calls)}"
+    print(f"  ✅ Found {len(ranges)} intervals with {len(calls)} lookups instead of 200")
+
+    assert discover_ranges(lambda house: '1234567', range(1, 101)) == [(1, 100, '1234567')]
+    assert discover_ranges(lambda house: None, range(1, 10)) == []
+    assert discover_ranges(street_zip, []) == []
+    print("  ✅ Constant streets need two lookups and empty results are dropped")
+
+    try:
+        from probe_addresses import AddressProber
+    except ImportError:
+        skip_without_requests('the probe_street_ranges checks')
+        return
+    prober = AddressProber(cache_path=None, api_base_url='http://127.0.0.1:9/zip_data.nsf/SearchZip')
+    answers = {}
+
+    def flaky_lookup(city, street, house, entrance=''):
+        house = int(house)
+        answers[house] = answers.get(house, 0) + 1
+        if house in (1, 199) and answers[house] == 1:
+            return {'valid': False, 'error': 'timeout'}  # Transient - answers on the retry
+        zip_code = street_zip(house)
+        return {'valid': True, 'zipCode': zip_code} if zip_code else {'valid': False, 'raw': 'RES0'}
+
+    prober.test_address_via_api = flaky_lookup
+    try:
+        assert prober.probe_street_ranges('חיפה', 'כנרת', 1, 200, delay=0) == [
+            {'city': 'חיפה', 'street': 'כנרת', **interval} for interval in expected
+        ], "Transient errors should be retried, not read as 'no zip'"
+
+        prober.test_address_via_api = lambda *address: {'valid': False, 'blocked': True, 'error': 'blocked'}
+        assert prober.probe_street_ranges('חיפה', 'כנרת', 1, 200, delay=0, attempts=2) == [], \
+            "A house that keeps failing should abandon the street rather than store wrong intervals"
+    finally:
+        prober.close()
+    print("  ✅ Failed lookups are retried and never taken as 'no zip'")
+
+    print("✅ Range discovery tests passed\n")
+
+
+def test_range_store():
+    """Test interval compression, overrides, incremental merges and persistence of the range store"""
+    from range_discovery import discover_street_ranges
+    from range_store import StreetRangeStore
+    from stub_server import synthetic_zip
+
+    print("Testing range store...")
+    store = StreetRangeStore()
+    for house in range(1, 201):
+        store.add_point('חיפה', 'כנרת', str(house), '', synthetic_zip('חיפה', 'כנרת', str(house)))
+    for house in range(1, 201):
+        expected = synthetic_zip('חיפה', 'כנרת', str(house))
+        assert store.lookup('חיפה', 'כנרת', str(house)) == expected, f"House {house} should be {expected}"
+    stats = store.stats()
+    assert stats['flat_records'] == 200 and stats['intervals'] <= 22, f"Points were not compressed: {stats}"
+    assert stats['ratio'] >= 9, f"Unexpected compression ratio {stats['ratio']:.1f}"
+    print(f"  ✅ 200 houses stored as {stats['intervals']} intervals ({stats['ratio']:.1f}x)")
+
+    assert store.lookup('חיפה', 'רחוב כנרת', '007') == store.lookup('חיפה', 'כנרת', '7'), "Keys should be normalized"
+    assert store.lookup('חיפה', 'כנרת', '201') is None and store.lookup('חיפה', 'הרצל', '1') is None
+    store.add_point('חיפה', 'כנרת', '7', 'א', '3327233')
+    store.add_point('חיפה', 'כנרת', '7ב', '', '3327234')
+    assert store.lookup('חיפה', 'כנרת', '7', 'כניסה א\'') == '3327233', "Entrance override should win"
+    assert store.lookup('חיפה', 'כנרת', '7 ב') == '3327234', "Lettered house should be an override"
+    assert store.lookup('חיפה', 'כנרת', '7', 'ג') is None, "Unknown entrances are not guessed"
+    assert store.lookup('חיפה', 'כנרת', '7') == synthetic_zip('חיפה', 'כנרת', '7'), "Override leaked to the house"
+    print("  ✅ Misses stay misses; entrances and lettered houses are exact overrides")
+
+    store.add_point('חיפה', 'כנרת', '9', '', '9999999')
+    assert store.lookup('חיפה', 'כנרת', '9') == '9999999', "A newer point should win"
+    assert store.lookup('חיפה', 'כנרת', '7') == synthetic_zip('חיפה', 'כנרת', '7'), "Neighbours must keep their zip"
+    assert store.lookup('חיפה', 'כנרת', '11') == synthetic_zip('חיפה', 'כנרת', '11'), "Neighbours must keep their zip"
+    store.add_point('חיפה', 'כנרת', '9', '', synthetic_zip('חיפה', 'כנרת', '9'))
+    assert store.stats()['intervals'] == stats['intervals'], "Restoring the zip should re-merge the interval"
+    print("  ✅ New points split and re-merge intervals in place")
+
+    ranges = discover_street_ranges(lambda house: '3100000' if house % 2 else '3300000', 1, 100)
+    for interval in ranges:
+        store.add_range('חיפה', 'הרצל', interval['from_house'], interval['to_house'], interval['zip'],
+                        interval['side'])
+    store.add_range('חיפה', 'הנביאים', 1, 10, '3200000')
+    assert store.lookup('חיפה', 'הרצל', '51') == '3100000' and store.lookup('חיפה', 'הרצל', '52') == '3300000'
+    assert store.lookup('חיפה', 'הנביאים', '1') == store.lookup('חיפה', 'הנביאים', '10') == '3200000'
+    print("  ✅ Discovered ranges merge by side, 'both' covers odd and even")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'zip_ranges.json')
+        store.save(path)
+        reloaded = StreetRangeStore.load(path)
+        assert reloaded.to_dict() == store.to_dict(), "Store should round-trip through JSON"
+        assert reloaded.lookup('חיפה', 'כנרת', '7', 'א') == '3327233'
+    print("  ✅ Store round-trips through JSON")
+
+    print("✅ Range store tests passed\n")
+
+
+def test_benchmarks():
+    """Test the benchmark runner and the regression check on a tiny corpus"""
+    from benchmarks import compare_to_baseline, run_benchmarks
+
+    print("Testing benchmark runner...")
+    results = run_benchmarks(size=200, repeat=1, min_time=0)
+    assert set(results) >= {'build_url', 'parse_responses', 'validate_address'}, f"Missing benchmarks: {results}"
+    assert all(r['ops_per_sec'] > 0 and r['peak_alloc_bytes_per_call'] >= 0 for r in results.values())
+    print(f"  ✅ {len(results)} benchmarks report ops/sec and bytes per call")
+
+    baseline = {'results': {'build_url': {'ops_per_sec': 1000}, 'parse_response': {'ops_per_sec': 1000}}}
+    current = {'build_url': {'ops_per_sec': 850}, 'parse_response': {'ops_per_sec': 700}, 'new': {'ops_per_sec': 1}}
+    assert compare_to_baseline(current, baseline, 0.2) == ['parse_response'], "Only drops beyond the threshold fail"
+    print("  ✅ Regressions beyond the threshold are reported")
+
+    print("✅ Benchmark runner tests passed\n")
+
+
+def test_stub_server():
+    """Test the SearchZip stand-in's parameter contract and fault injection"""
+    import http.client
+    from urllib.parse import urlsplit
+    from mikud_utils import build_url, parse_response
+    from response_cache import make_key
+    from stub_server import StubConfig, start_in_thread, synthetic_zip
+
+    def get(url):
+        # http.client sends the path as given, so literal spaces reach the stub like they do from the extension
+        parts = urlsplit(url)
+        conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=5)
+        conn._validate_path = lambda path: None
+        conn.request('GET', f"{parts.path}?{parts.query}")
+        response = conn.getresponse()
+        body = response.read().decode('utf-8')
+        conn.close()
+        return response.status, body
+
+    print("Testing stub server...")
+    seed = {make_key('חיפה', 'כנרת', '7', 'א'): '3327233'}
+    server, base = start_in_thread(StubConfig(seed=seed, strict_spaces=True))
+    try:
+        status, body = get(build_url('חיפה', 'כנרת', '7', 'א', base_url=base))
+        assert (status, body) == (200, 'RES73327233'), f"Seeded address: {status} {body}"
+        assert parse_response(body)[0]['zipCode'] == '3327233'
+        print("  ✅ Seeded addresses answer in RES<d><zip> form")
+
+        status, body = get(build_url('ראש העין', 'מגדל דוד', '44', base_url=base))
+        assert status == 200 and body.endswith(synthetic_zip('ראש העין', 'מגדל דוד', '44')), f"Literal spaces: {body}"
+        status, body = get(build_url('ראש העין', 'מגדל דוד', '44', base_url=base).replace(' ', '%20'))
+        assert body == 'RES0', f"Strict mode should reject %20 in Street: {body}"
+        print("  ✅ Literal spaces in Street are accepted and %20 rejected in strict mode")
+
+        status, _ = get(f"{base}?OpenAgent&Location=x&POB=&Street=y&House=1&Entrance=")
+        assert status == 400, "Street before House must be rejected"
+        print("  ✅ Parameter order is enforced")
+    finally:
+        server.shutdown()
+
+    config = StubConfig(error_rate=0.5, captcha_rate=0.5, random_seed=1)
+    server, base = start_in_thread(config)
+    try:
+        statuses = [get(build_url('חיפה', 'כנרת', str(i), base_url=base)) for i in range(20)]
+        assert {status for status, _ in statuses} == {200, 500}, f"Unexpected statuses: {statuses}"
+        assert any('ShieldSquare' in body for _, body in statuses), "Expected CAPTCHA pages"
+        assert config.counts['error'] + config.counts['captcha'] == 20
+    finally:
+        server.shutdown()
+
+    config = StubConfig(throttle_rps=5)
+    server, base = start_in_thread(config)
+    try:
+        statuses = [get(build_url('חיפה', 'כנרת', '1', base_url=base))[0] for _ in range(10)]
+        assert statuses.count(429) >= 4, f"Expected throttling: {statuses}"
+    finally:
+        server.shutdown()
+    print("  ✅ Errors, CAPTCHA pages and 429 throttling are injected")
+
+    print("✅ Stub server tests passed\n")
+
+
+def test_load_harness():
+    """Test the load harness statistics against a fake lookup"""
+    from load_test import address_mix, classify, format_table, percentile, run_load
+
+    print("Testing load harness...")
+    values = [i / 100 for i in range(1, 101)]
+    assert (percentile(values, 50), percentile(values, 99), percentile(values, 100)) == (0.5, 0.99, 1.0)
+    assert percentile([], 50) is None
+    assert classify({'valid': True, 'zipCode': '1234567'}) == 'ok'
+    assert classify({'valid': False, 'raw': 'RES0'}) == 'not_found'
+    assert classify({'valid': False, 'blocked': True, 'error': 'x', 'raw': '<html>ShieldSquare Captcha</html>'}) == 'captcha'
+    assert classify({'valid': False, 'error': '429 Client Error: Too Many Requests for url: x'}) == 'http_429'
+    assert classify({'valid': False, 'error': 'Read timed out. (read timeout=5)'}) == 'timeout'
+    print("  ✅ Percentiles and outcome classification")
+
+    calls = []
+
+    def fake_lookup(city, street, house, entrance=''):
+        calls.append(house)
+        time.sleep(0.002)
+        if house == '3':
+            raise ValueError('boom')
+        return {'valid': True, 'zipCode': '1234567', 'raw': 'RES71234567'}
+
+    addresses = address_mix([('חיפה', 'כנרת', str(i), '') for i in range(10)], repeat_ratio=0.5, seed=1)
+    stats, elapsed = run_load(fake_lookup, addresses, concurrency=4, duration=5, max_requests=200)
+    summary = stats.summary(elapsed)
+    assert summary['requests'] == len(calls) == 200, f"Expected exactly 200 lookups, got {summary['requests']}"
+    assert summary['outcomes']['error'] == calls.count('3') > 0
+    assert summary['latency_ms']['p50'] <= summary['latency_ms']['p99'] <= summary['latency_ms']['max']
+    assert summary['throughput_rps'] > 0
+    table = format_table(summary, previous=summary)
+    assert 'Latency p99 (ms)' in table and '+0.0%' in table
+    print(f"  ✅ 200 lookups at {summary['throughput_rps']:.0f} req/s, p99 {summary['latency_ms']['p99']}ms")
+
+    base = [('חיפה', 'כנרת', str(i), '') for i in range(5)]
+    mix = address_mix(base, repeat_ratio=0.9, seed=2)
+    draws = [next(mix) for _ in range(5000)]
+    assert set(draws) == set(base) and len(mix.gi_frame.f_locals['sent']) == len(base), \
+        "Repeats should come from the base addresses without the sent list growing past them"
+    print("  ✅ The address mix repeats from a bounded set once every address has been sent")
+
+    stats, elapsed = run_load(fake_lookup, address_mix([('חיפה', 'כנרת', '1', '')]), concurrency=2, duration=0.2)
+    assert 0.2 <= elapsed < 1.5, f"Duration limit not honoured: {elapsed:.2f}s"
+    print("  ✅ Duration limit stops the workers")
+
+    print("✅ Load harness tests passed\n")
+
+
+def main():
+    """Run all tooling unit tests"""
+    print("=" * 60)
+    print("Python Tooling - Unit Tests")
+    print("=" * 60)
+    print()
+
+    try:
+        test_batch_resolver()
+        test_adaptive_rate_limiter()
+        test_bulk_resolve()
+        test_single_flight()
+        test_deadlines_and_hedging()
+        test_cassette()
+        test_response_cache()
+        test_zip_index()
+        test_wait_engine()
+        test_lean_profile()
+        test_network_capture()
+        test_driver_pool()
+        test_work_queue()
+        test_phase_timing()
+        test_result_sink()
+        test_range_discovery()
+        test_range_store()
+        test_benchmarks()
+        test_stub_server()
+        test_load_harness()
+
+        print("=" * 60)
+        print("✅ All tooling tests passed!")
+        print("=" * 60)
+        return 0
+
+    except AssertionError as e:
+        print(f"\n❌ Test failed: {e}")
+        return 1
+    except Exception as e:
+        print(f"\n❌ Unexpected error: {e}")
+        return 1
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,513 @@
+#!/usr/bin/env python3
+"""
+Lease-based shared work queue for sharded probing across the processes of one machine
+One SQLite file holds the shards, their leases, the merged results and the global request rate. Workers lease a
+shard, resolve it and hand the results back; a shard whose worker died is leased again once its lease expires.
+Addresses the upstream blocked go back in the queue as a shard of their own, and a shard leased max_attempts times
+is given up as 'failed'. Results are merged on the normalized address key, so a shard resolved twice still yields
+one record per address.
+The file runs in WAL mode, which coordinates writers through shared memory on one host: a queue is bound to the
+machine that created it and refused on a network filesystem
+"""
+
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from itertools import islice
+
+from batch_resolver import BatchResolver, RateLimiter
+from normalize import address_key
+
+# How good a result is - a merged address keeps the best one seen (ties go to the newest)
+RANK_ERROR = 0
+RANK_NOT_FOUND = 1
+RANK_VALID = 2
+
+# Leases per shard before it is given up (crashed workers and blocked retries both count)
+MAX_ATTEMPTS = 5
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS shards (
+    id INTEGER PRIMARY KEY,
+    addresses TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS shards_state ON shards (state, lease_expires);
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    record TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    worker TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value REAL
+);
+CREATE TABLE IF NOT EXISTS host (
+    name TEXT NOT NULL
+);
+'''
+
+# Filesystems where SQLite's WAL shared memory and locks are not safe
+NETWORK_FILESYSTEMS = {'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', '9p', 'afs', 'fuse.sshfs', 'ceph', 'glusterfs'}
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def filesystem_type(path):
+    """Type of the filesystem holding path, from /proc/self/mounts (None where that is not available)"""
+    path = os.path.realpath(path)
+    best = ('', None)
+    try:
+        with open('/proc/self/mounts', encoding='utf-8') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount_point = fields[1].replace('\\040', ' ')
+                inside = path == mount_point or path.startswith(mount_point.rstrip('/') + '/')
+                if inside and len(mount_point) >= len(best[0]):
+                    best = (mount_point, fields[2])
+    except OSError:
+        return None
+    return best[1]
+
+
+def sweep_addresses(cities, streets, low=1, high=200):
+    """Every (city, street, house, '') combination for a country-wide sweep"""
+    for city in cities:
+        for street in streets:
+            for house in range(low, high + 1):
+                yield (city, street, str(house), '')
+
+
+def result_rank(record):
+    if record.get('valid'):
+        return RANK_VALID
+    return RANK_ERROR if record.get('error') else RANK_NOT_FOUND
+
+
+class Shard:
+    __slots__ = ('id', 'addresses', 'owner', 'attempt', 'lease_expires')
+
+    def __init__(self, shard_id, addresses, owner, attempt, lease_expires):
+        self.id = shard_id
+        self.addresses = addresses
+        self.owner = owner
+        self.attempt = attempt  # Lease generation - a reclaimed shard has a higher one
+        self.lease_expires = lease_expires
+
+
+class WorkQueue:
+    def __init__(self, path, lease_seconds=300, worker_id=None, max_attempts=MAX_ATTEMPTS):
+        """
+        path: SQLite queue file on a local disk - opening one created on another machine raises ValueError
+        lease_seconds: how long a leased shard stays reserved without a renewal
+        max_attempts: a shard already leased this many times is marked 'failed' instead of leased again
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.worker_id = worker_id or default_worker_id()
+        self._lock = threading.Lock()
+        kind = filesystem_type(os.path.dirname(os.path.abspath(path)))
+        if kind in NETWORK_FILESYSTEMS:
+            raise ValueError(f"{path} is on a {kind} filesystem - SQLite WAL needs a local disk, "
+                             f"so keep the queue on the machine that runs its workers")
+        # Autocommit, with explicit BEGIN IMMEDIATE where a read decides a write
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+        self._claim_host()
+
+    def _claim_host(self):
+        """Bind the file to the machine that created it - WAL locks only coordinate processes of one host"""
+        hostname = socket.gethostname()
+
+        def claim(conn):
+            row = conn.execute('SELECT name FROM host').fetchone()
+            if row is None:
+                conn.execute('INSERT INTO host VALUES (?)', (hostname,))
+                return hostname
+            return row[0]
+
+        owner = self._transaction(claim)
+        if owner != hostname:
+            self._conn.close()
+            raise ValueError(f"{self.path} was created on {owner} - run its workers there (one queue per machine; "
+                             f"SQLite WAL does not coordinate writers across hosts)")
+
+    def _transaction(self, work):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                value = work(self._conn)
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+            return value
+
+    def enqueue(self, addresses, shard_size=200):
+        """Split (city, street, house, entrance) tuples into shards of shard_size; returns the shard count"""
+        addresses = iter(addresses)
+        counted = [0]
+
+        def chunks():
+            while True:
+                chunk = [list(address) for address in islice(addresses, shard_size)]
+                if not chunk:
+                    return
+                counted[0] += 1
+                yield (json.dumps(chunk, ensure_ascii=False),)
+
+        # One transaction: a sweep of millions of addresses would otherwise pay a commit per shard
+        self._transaction(lambda conn: conn.executemany('INSERT INTO shards (addresses) VALUES (?)', chunks()))
+        return counted[0]
+
+    def lease(self):
+        """Lease the next pending (or expired) shard - None when nothing is left to lease"""
+        def take(conn):
+            now = time.time()
+            while True:
+                row = conn.execute(
+                    "SELECT id, addresses, state, attempts FROM shards "
+                    "WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?) ORDER BY id LIMIT 1", (now,)
+                ).fetchone()
+                if row is None:
+                    return None
+                shard_id, addresses, state, attempts = row
+                if attempts < self.max_attempts:
+                    break
+                conn.execute("UPDATE shards SET state = 'failed', owner = NULL, finished_at = ? WHERE id = ?",
+                             (now, shard_id))
+            expires = now + self.lease_seconds
+            conn.execute("UPDATE shards SET state = 'leased', owner = ?, lease_expires = ?, attempts = ? "
+                         "WHERE id = ?", (self.worker_id, expires, attempts + 1, shard_id))
+            if state == 'leased':
+                conn.execute("INSERT INTO meta VALUES ('reclaimed', 1) "
+                             "ON CONFLICT (name) DO UPDATE SET value = value + 1")
+            return Shard(shard_id, [tuple(address) for address in json.loads(addresses)], self.worker_id,
+                         attempts + 1, expires)
+
+        return self._transaction(take)
+
+    def _owns(self, conn, shard):
+        row = conn.execute('SELECT state, owner, attempts FROM shards WHERE id = ?', (shard.id,)).fetchone()
+        return row is not None and row == ('leased', shard.owner, shard.attempt)
+
+    def renew(self, shard):
+        """Extend the lease; False if the shard was reclaimed by another worker in the meantime"""
+        def extend(conn):
+            if not self._owns(conn, shard):
+                return False
+            shard.lease_expires = time.time() + self.lease_seconds
+            conn.execute('UPDATE shards SET lease_expires = ? WHERE id = ?', (shard.lease_expires, shard.id))
+            return True
+
+        return self._transaction(extend)
+
+    def complete(self, shard, records, finished=True, retry=()):
+        """
+        Merge a shard's result records and mark it done (finished=False puts it back in the queue instead)
+        retry: addresses to resolve again later (e.g. blocked answers) - queued as a new shard that carries this
+        shard's attempt count, so only they are looked up again and the attempt cap still applies.
+        Results are merged even when the lease was lost - they are still answers. Returns whether the
+        shard was still ours
+        """
+        def merge(conn):
+            now = time.time()
+            conn.executemany(
+                'INSERT INTO results (key, record, rank, worker, updated_at) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET record = excluded.record, rank = excluded.rank, '
+                'worker = excluded.worker, updated_at = excluded.updated_at WHERE excluded.rank >= results.rank',
+                [(address_key(record['city'], record['street'], str(record['house']), record.get('entrance') or ''),
+                  json.dumps(record, ensure_ascii=False), result_rank(record), shard.owner, now)
+                 for record in records]
+            )
+            if not self._owns(conn, shard):
+                return False
+            if finished:
+                conn.execute("UPDATE shards SET state = 'done', finished_at = ? WHERE id = ?", (now, shard.id))
+                if retry:
+                    conn.execute('INSERT INTO shards (addresses, attempts) VALUES (?, ?)',
+                                 (json.dumps([list(address) for address in retry], ensure_ascii=False),
+                                  shard.attempt))
+            else:
+                conn.execute("UPDATE shards SET state = 'pending', owner = NULL, lease_expires = NULL WHERE id = ?",
+                             (shard.id,))
+            return True
+
+        return self._transaction(merge)
+
+    def release(self, shard):
+        """Give a leased shard back without results (e.g. on shutdown)"""
+        return self.complete(shard, [], finished=False)
+
+    def status(self):
+        """Shard counts by state, merged results and reclaimed leases ('failed' shards ran out of attempts)"""
+        with self._lock:
+            counts = dict(self._conn.execute('SELECT state, COUNT(*) FROM shards GROUP BY state'))
+            now = time.time()
+            expired = self._conn.execute("SELECT COUNT(*) FROM shards WHERE state = 'leased' AND lease_expires < ?",
+                                         (now,)).fetchone()[0]
+            results = dict(self._conn.execute('SELECT rank, COUNT(*) FROM results GROUP BY rank'))
+            reclaimed = self._conn.execute("SELECT value FROM meta WHERE name = 'reclaimed'").fetchone()
+        return {
+            'pending': counts.get('pending', 0),
+            'leased': counts.get('leased', 0) - expired,
+            'expired': expired,
+            'done': counts.get('done', 0),
+            'failed': counts.get('failed', 0),
+            'results': sum(results.values()),
+            'valid': results.get(RANK_VALID, 0),
+            'reclaimed': int(reclaimed[0]) if reclaimed else 0,
+        }
+
+    def report(self):
+        """One-line progress summary"""
+        status = self.status()
+        total = status['pending'] + status['leased'] + status['expired'] + status['done'] + status['failed']
+        return (f"Queue: {status['done']}/{total} shards done ({status['leased']} leased, {status['expired']} "
+                f"expired, {status['reclaimed']} reclaimed, {status['failed']} failed), "
+                f"{status['results']:,} addresses merged "
+                f"({status['valid']:,} with a zip)")
+
+    def iter_results(self):
+        """Merged records, one per normalized address"""
+        with self._lock:
+            rows = self._conn.execute('SELECT record FROM results ORDER BY key').fetchall()
+        for (record,) in rows:
+            yield json.loads(record)
+
+    def export(self, path):
+        """Write the merged results as JSONL (readable by zip_index.py and range_store.py); returns the count"""
+        count = 0
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in self.iter_results():
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                count += 1
+        os.replace(tmp_path, path)
+        return count
+
+    def set_rate(self, rate):
+        """Global requests-per-second ceiling shared by every worker (None = unlimited)"""
+        with self._lock:
+            self._conn.execute("INSERT INTO meta VALUES ('rate', ?) ON CONFLICT (name) DO UPDATE SET value = ?",
+                               (rate, rate))
+
+    def get_rate(self):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE name = 'rate'").fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        self._conn.close()
+
+
+class SharedRateLimiter(RateLimiter):
+    """
+    RateLimiter whose next free slot lives in the queue file, so the ceiling holds across every worker
+    A blocked answer pushes the shared slot back by block_pause for all of them - with or without a ceiling
+    """
+
+    def __init__(self, queue, rate=None, block_pause=30.0):
+        super().__init__(rate if rate is not None else queue.get_rate())
+        self.queue = queue
+        self.block_pause = block_pause
+
+    def _reserve(self):
+        def reserve(conn):
+            # Wall-clock time, like the leases - every worker reads this machine's clock
+            now = time.time()
+            row = conn.execute("SELECT value FROM meta WHERE name = 'next_slot'").fetchone()
+            slot = max(now, row[0] if row else 0.0)
+            if not self.rate:
+                return slot - now  # No ceiling, but a block pause still holds
+            interval = 1.0 / self.rate
+            conn.execute("INSERT INTO meta VALUES ('next_slot', ?) ON CONFLICT (name) DO UPDATE SET value = ?",
+                         (slot + interval, slot + interval))
+            return slot - now
+
+        return self.queue._transaction(reserve)
+
+    def record(self, result):
+        if not result.get('blocked'):
+            return
+
+        def pause(conn):
+            until = time.time() + self.block_pause
+            conn.execute("INSERT INTO meta VALUES ('next_slot', ?) "
+                         "ON CONFLICT (name) DO UPDATE SET value = MAX(value, ?)", (until, until))
+
+        self.queue._transaction(pause)
+
+
+def run_worker(queue, lookup, concurrency=4, rate_limit=None, on_shard=None):
+    """
+    Lease shards until the queue is drained, resolving each with a BatchResolver
+    lookup: (city, street, house, entrance) -> ZipClient.lookup-style result
+    rate_limit: RateLimiter shared by the shard's lookups (default: SharedRateLimiter over the queue's rate)
+    on_shard(shard, records): called after each shard is handed back
+    Blocked addresses are queued again as a shard of their own (after the limiter's pause), the rest are merged.
+    A shard whose lease cannot be renewed belongs to another worker now: no more of its addresses are looked up.
+    Returns the number of shards this worker finished
+    """
+    limiter = rate_limit if rate_limit is not None else SharedRateLimiter(queue)
+    resolver = BatchResolver(lookup, concurrency=concurrency, rate_limit=limiter)
+    finished = 0
+    while True:
+        shard = queue.lease()
+        if shard is None:
+            return finished
+        records = []
+        blocked = []
+        lost = []
+
+        def on_result(index, address, result):
+            city, street, house, entrance = address
+            if result.get('blocked'):
+                blocked.append(address)
+            else:
+                record = {'city': city, 'street': street, 'house': house, 'entrance': entrance,
+                          'zipCode': result.get('zipCode'), 'valid': bool(result.get('valid'))}
+                if 'error' in result:
+                    record['error'] = result['error']
+                records.append(record)
+            # Renew once half the lease is gone, so a slow shard is not reclaimed from a live worker
+            if not lost and shard.lease_expires - time.time() < queue.lease_seconds / 2 and not queue.renew(shard):
+                print(f"⚠️  Lease on shard {shard.id} was reclaimed - leaving the rest of it to its new owner")
+                lost.append(shard.id)
+
+        try:
+            # skip is checked as each address is pulled, so a lost lease stops the shard after the lookups in flight
+            resolver.resolve(shard.addresses, on_result=on_result, skip=lambda index: bool(lost), collect=False)
+        except BaseException:
+            queue.complete(shard, records, finished=False)
+            raise
+        if queue.complete(shard, records, retry=blocked):
+            finished += 1
+        if on_shard:
+            on_shard(shard, records)
+
+
+def _work(path, concurrency, lease_seconds, api_base_url, cache_path):
+    """Worker process: an AddressProber working through shards until the queue is drained"""
+    from probe_addresses import AddressProber
+
+    queue = WorkQueue(path, lease_seconds=lease_seconds)
+    prober = AddressProber(cache_path=cache_path, api_base_url=api_base_url)
+    try:
+        return prober.probe_queue(queue, concurrency=concurrency)
+    finally:
+        prober.close()
+        queue.close()
+
+
+def main():
+    from zip_index import iter_address_records
+
+    parser = argparse.ArgumentParser(description='Shared work queue for sharded probing by parallel worker processes')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    plan = commands.add_parser('plan', help='Add shards to the queue (created if missing)')
+    plan.add_argument('queue', help='Queue file on a local disk, e.g. probe_queue.sqlite3 (workers run on this machine)')
+    plan.add_argument('--input', help='Addresses to probe (JSON list or JSONL with city/street/house/entrance)')
+    plan.add_argument('--cities', help='Comma-separated cities to sweep (with --streets)')
+    plan.add_argument('--streets', help='Comma-separated streets to sweep in every city')
+    plan.add_argument('--houses', default='1-200', help='House number range to sweep (default: 1-200)')
+    plan.add_argument('--shard-size', type=int, default=200, help='Addresses per shard (default: 200)')
+    plan.add_argument('--rate', type=float, required=True,
+                      help='Global requests per second across all workers (required - every worker paces to it)')
+
+    work = commands.add_parser('work', help='Run workers on this machine until the queue is drained')
+    work.add_argument('queue')
+    work.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes (default: CPUs)')
+    work.add_argument('--concurrency', type=int, default=4, help='Lookups in flight per worker (default: 4)')
+    work.add_argument('--lease', type=float, default=300, help='Lease length in seconds (default: 300)')
+    work.add_argument('--cache', default='zip_cache.sqlite3', help="Response cache path, 'none' to disable")
+    work.add_argument('--api-base-url', help='SearchZip endpoint (default: $MIKUD_API_BASE_URL or production)')
+
+    status = commands.add_parser('status', help='Show queue progress')
+    status.add_argument('queue')
+
+    export = commands.add_parser('export', help='Write the merged, deduplicated results as JSONL')
+    export.add_argument('queue')
+    export.add_argument('-o', '--output', default='probe_results.jsonl', help='Output (default: probe_results.jsonl)')
+    args = parser.parse_args()
+
+    if args.command == 'work':
+        from concurrent.futures import ProcessPoolExecutor
+
+        if not os.path.exists(args.queue):
+            print(f"❌ {args.queue} does not exist - run `work_queue.py plan` first")
+            return 1
+        try:
+            queue = WorkQueue(args.queue)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return 1
+        rate = queue.get_rate()
+        queue.close()
+        if not rate:
+            print(f"❌ {args.queue} has no request rate - run `work_queue.py plan {args.queue} --rate N` first")
+            return 1
+        cache_path = None if args.cache == 'none' else args.cache
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            futures = [executor.submit(_work, args.queue, args.concurrency, args.lease, args.api_base_url, cache_path)
+                       for _ in range(args.workers)]
+            finished = sum(future.result() for future in futures)
+        queue = WorkQueue(args.queue)
+        print(f"✅ {finished} shards finished in {time.perf_counter() - start:.1f}s")
+        print(queue.report())
+        queue.close()
+        return 0
+
+    try:
+        queue = WorkQueue(args.queue)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    try:
+        if args.command == 'plan':
+            if args.input:
+                addresses = ((r['city'], r['street'], str(r['house']), r.get('entrance') or '')
+                             for r in iter_address_records(args.input))
+            elif args.cities and args.streets:
+                low, _, high = args.houses.partition('-')
+                addresses = sweep_addresses(args.cities.split(','), args.streets.split(','), int(low),
+                                            int(high or low))
+            else:
+                print("❌ Give --input, or --cities and --streets")
+                return 1
+            if args.rate <= 0:
+                print("❌ --rate must be positive")
+                return 1
+            shards = queue.enqueue(addresses, args.shard_size)
+            queue.set_rate(args.rate)
+            print(f"✅ Added {shards} shards to {args.queue}")
+        elif args.command == 'export':
+            count = queue.export(args.output)
+            print(f"✅ Exported {count:,} merged addresses to {args.output}")
+        print(queue.report())
+        return 0
+    finally:
+        queue.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
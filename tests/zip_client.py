@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Pooled HTTP client for the SearchZip API
+Reuses keep-alive connections and retries transient failures with jittered backoff
+"""
+
+import os
+import random
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from urllib3.util.connection import allowed_gai_family
+
+from deadlines import NO_DEADLINE, Deadline, DeadlineExceeded, HedgePolicy
+from mikud_utils import API_BASE_URL, BLOCKED_ERROR, build_url, is_blocked_response, parse_response
+from phase_timing import NULL_TIMER
+from response_cache import exact_key
+from single_flight import SingleFlight
+
+# Statuses the upstream uses to push back on a client - reported as blocks, not plain errors
+BLOCK_STATUSES = (403, 429)
+
+
+# Connection setup time spent by the current thread's request, subtracted from its time to first byte
+_connection_setup = threading.local()
+
+
+def _timed_connection_class(base, timer):
+    """
+    Subclass a urllib3 connection class to time DNS, TCP connect and (for HTTPS) the TLS handshake
+    This hooks urllib3's private _new_conn/_dns_host; where a urllib3 version lacks them, connections are made
+    untimed by urllib3 itself
+    """
+    if not callable(getattr(base, '_new_conn', None)):
+        return base
+
+    class TimedConnection(base):
+        def _new_conn(self):
+            host = getattr(self, '_dns_host', None)
+            if not isinstance(host, str):
+                return super()._new_conn()
+            # Resolve here so DNS is timed on its own
+            start = time.perf_counter()
+            try:
+                addresses = list(dict.fromkeys(
+                    info[4][0] for info in socket.getaddrinfo(host, self.port, allowed_gai_family(), socket.SOCK_STREAM)
+                ))
+            except OSError:
+                addresses = []
+            if not addresses:
+                return super()._new_conn()  # urllib3 raises its own resolution error
+            resolved = time.perf_counter()
+            # Then try every address in order, like urllib3's create_connection (IPv6 first, IPv4 fallback...)
+            error = None
+            for address in addresses:
+                self._dns_host = address
+                try:
+                    conn = super()._new_conn()
+                    break
+                except (NewConnectionError, ConnectTimeoutError) as e:
+                    error = e
+                finally:
+                    self._dns_host = host
+            else:
+                raise error
+            self._connected_at = time.perf_counter()
+            timer.observe('api', 'dns', resolved - start)
+            timer.observe('api', 'connect', self._connected_at - resolved)
+            _connection_setup.seconds = getattr(_connection_setup, 'seconds', 0.0) + self._connected_at - start
+            return conn
+
+        def connect(self):
+            self._connected_at = None
+            super().connect()
+            if isinstance(self, HTTPSConnection) and self._connected_at is not None:
+                # HTTPSConnection.connect() is _new_conn() followed by the TLS handshake
+                tls = time.perf_counter() - self._connected_at
+                timer.observe('api', 'tls', tls)
+                _connection_setup.seconds += tls
+
+    TimedConnection.__name__ = f"Timed{base.__name__}"
+    return TimedConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose pools use the timed connection classes"""
+
+    def __init__(self, timer, **kwargs):
+        self.timer = timer
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': type('TimedHTTPConnectionPool', (HTTPConnectionPool,),
+                         {'ConnectionCls': _timed_connection_class(HTTPConnection, self.timer)}),
+            'https': type('TimedHTTPSConnectionPool', (HTTPSConnectionPool,),
+                          {'ConnectionCls': _timed_connection_class(HTTPSConnection, self.timer)}),
+        }
+
+
+def resolve_base_url(base_url=None):
+    """Explicit base URL, else $MIKUD_API_BASE_URL (e.g. a local stub_server.py), else the live endpoint"""
+    return base_url or os.environ.get('MIKUD_API_BASE_URL') or API_BASE_URL
+
+
+class ZipClient:
+    def __init__(self, base_url=None, max_connections_per_host=8,
+                 connect_timeout=3.05, read_timeout=10, max_retries=3,
+                 backoff_base=0.5, backoff_max=8.0, cache=None, timer=None, index=None, coalesce=True,
+                 deadline=None, hedge=None):
+        """
+        base_url: SearchZip endpoint (see resolve_base_url)
+        max_connections_per_host: keep-alive pool size; callers block when it is exhausted
+        connect_timeout / read_timeout: seconds, passed to requests as a (connect, read) tuple
+        max_retries: extra attempts on 5xx responses, timeouts and connection errors
+        backoff_base / backoff_max: full-jitter exponential backoff between attempts
+        cache: optional ResponseCache consulted before every lookup
+        timer: optional PhaseTimer - records api.dns/connect/tls/ttfb/download/parse per lookup
+        index: optional ZipIndex - known addresses are answered from it before the cache and the network
+        coalesce: concurrent lookups of the same address text share one upstream request (see self.flights)
+        deadline: seconds one lookup may take end to end - every attempt's timeouts and backoff sleeps are cut
+                  to what is left, and an exhausted budget is reported as a timeout error
+        hedge: optional HedgePolicy (True for the defaults) - a request with no answer after the observed p95
+               gets a second identical one, and whichever answers first is used
+        """
+        self.base_url = resolve_base_url(base_url)
+        self.cache = cache
+        self.index = index
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timer = timer or NULL_TIMER
+        self.flights = SingleFlight() if coalesce else None
+        self.deadline = deadline
+        self.hedge = HedgePolicy() if hedge is True else hedge or None
+        self._max_connections = max_connections_per_host
+        self._hedge_executor = None
+        self._executor_lock = threading.Lock()
+
+        # Retries are handled here (not by urllib3) so that the backoff can be jittered
+        pool_options = dict(pool_connections=4, pool_maxsize=max_connections_per_host, pool_block=True, max_retries=0)
+        # The stock adapter unless timing is on, so disabled timing costs nothing per connection
+        adapter = TimedHTTPAdapter(self.timer, **pool_options) if self.timer.enabled else HTTPAdapter(**pool_options)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'Accept-Language': 'he'})
+
+    def _backoff(self, attempt, deadline=NO_DEADLINE):
+        """Sleep a random duration in [0, base * 2^attempt], capped at backoff_max and the deadline"""
+        with self.timer.phase('api', 'retry_wait'):
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+            time.sleep(min(delay, deadline.remaining()))
+
+    def _get(self, url, timeout=None):
+        """session.get, split into time to first byte and body download when timing is on"""
+        timeout = timeout or self.timeout
+        if not self.timer.enabled:
+            return self.session.get(url, timeout=timeout)
+        _connection_setup.seconds = 0.0
+        start = time.perf_counter()
+        response = self.session.get(url, timeout=timeout)
+        total = time.perf_counter() - start
+        # requests' elapsed runs from sending the request to parsed headers, including connection setup
+        headers_at = response.elapsed.total_seconds()
+        self.timer.observe('api', 'ttfb', max(0.0, headers_at - _connection_setup.seconds))
+        self.timer.observe('api', 'download', max(0.0, total - headers_at))
+        return response
+
+    def _executor(self):
+        with self._executor_lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(max_workers=self._max_connections * 2,
+                                                          thread_name_prefix='zip-hedge')
+            return self._hedge_executor
+
+    def _get_recorded(self, url, timeout):
+        """_get() that feeds the response time to the hedge policy's latency window"""
+        start = time.perf_counter()
+        response = self._get(url, timeout)
+        self.hedge.record(time.perf_counter() - start)
+        return response
+
+    def _send(self, url, deadline):
+        """
+        One attempt, with timeouts cut to the deadline
+        With a HedgePolicy, a second identical request is sent once the first has taken longer than the hedge
+        delay (budget permitting); the first successful answer wins and the other is left to finish unused
+        """
+        timeout = deadline.cap(self.timeout)
+        if self.hedge is None:
+            return self._get(url, timeout)
+
+        self.hedge.start_primary()
+        delay = self.hedge.hedge_delay()
+        if delay is None or delay >= deadline.remaining():
+            return self._get_recorded(url, timeout)
+
+        start = time.perf_counter()
+        primary = self._executor().submit(self._get_recorded, url, timeout)
+        if wait([primary], timeout=delay).done or not self.hedge.try_hedge():
+            return primary.result()
+        try:
+            hedged = self._executor().submit(self._get_recorded, url, deadline.cap(self.timeout))
+            pending = {primary, hedged}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if future is hedged:
+                            self.hedge.won()
+                        return future.result()
+            return primary.result()  # Both failed - report the primary's error
+        finally:
+            self.timer.observe('api', 'hedged', time.perf_counter() - start)
+
+    def fetch(self, url, deadline=NO_DEADLINE):
+        """GET a URL and return the stripped body, retrying transient failures within the deadline"""
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                response = self._send(url, deadline)
+            except (requests.Timeout, requests.ConnectionError):
+                deadline.check()  # A timeout cut short by the deadline is reported as the deadline
+                if last_attempt:
+                    raise
+                self._backoff(attempt, deadline)
+                continue
+
+            if response.status_code >= 500 and not last_attempt:
+                self._backoff(attempt, deadline)
+                continue
+
+            response.raise_for_status()
+            return response.text.strip()
+
+    def lookup(self, city, street, house, entrance=""):
+        """
+        Look up an address - returns {'valid', 'zipCode', 'raw'} or {'valid': False, 'error'}
+        CAPTCHA pages and 403/429 answers also carry 'blocked': True so rate control can back off
+        """
+        deadline = Deadline(self.deadline) if self.deadline else NO_DEADLINE
+        if self.index is not None:
+            with self.timer.phase('api', 'index'):
+                indexed = self.index.get(city, street, house, entrance)
+            if indexed is not None:
+                # No response body behind an index answer, but callers always get the same keys
+                return {'valid': True, 'zipCode': indexed, 'raw': None} if indexed else {'valid': False, 'raw': None}
+
+        if self.cache is not None:
+            with self.timer.phase('api', 'cache'):
+                cached = self.cache.get(city, street, house, entrance)
+            if cached:
+                if cached['zipCode']:
+                    return {'valid': True, 'zipCode': cached['zipCode'], 'raw': cached['raw']}
+                return {'valid': False, 'raw': cached['raw']}
+
+        if self.flights is None:
+            return self._lookup_upstream(city, street, house, entrance, deadline)
+        # Coalesced on the exact text sent: another spelling's miss is not an answer for this one
+        result, shared = self.flights.do(exact_key(city, street, house, entrance),
+                                         lambda: self._lookup_upstream(city, street, house, entrance, deadline))
+        # Each caller gets its own dict, errors included
+        return dict(result) if shared else result
+
+    def _lookup_upstream(self, city, street, house, entrance, deadline=NO_DEADLINE):
+        """The SearchZip request behind lookup(), storing clean answers in the cache"""
+        try:
+            result_text = self.fetch(build_url(city, street, house, entrance, base_url=self.base_url), deadline)
+        except requests.HTTPError as e:
+            result = {'valid': False, 'error': str(e)}
+            if e.response is not None and e.response.status_code in BLOCK_STATUSES:
+                result['blocked'] = True
+            return result
+        except DeadlineExceeded as e:
+            self.timer.observe('api', 'deadline_exceeded', deadline.seconds)
+            return {'valid': False, 'error': str(e)}
+        except Exception as e:
+            # Errors are never cached
+            return {'valid': False, 'error': str(e)}
+
+        if is_blocked_response(result_text):
+            # Never cached either - the same address answers normally once the block lifts
+            return {'valid': False, 'blocked': True, 'error': BLOCKED_ERROR, 'raw': result_text}
+
+        with self.timer.phase('api', 'parse'):
+            parsed = parse_response(result_text)
+        zip_code = parsed[0]['zipCode'] if parsed else None
+        if self.cache is not None:
+            self.cache.put(city, street, house, entrance, result_text, zip_code)
+        if zip_code:
+            return {'valid': True, 'zipCode': zip_code, 'raw': result_text}
+        return {'valid': False, 'raw': result_text}
+
+    def close(self):
+        """Close pooled connections, the cache and the index"""
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False)  # Losing hedges may still be running
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+        if self.index is not None:
+            self.index.close()
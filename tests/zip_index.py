@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Offline zip code index compiled from probe and bulk results
+A sorted, memory-mapped binary file keyed on the normalized address (the exact spelling for "no zip" answers): opening it parses nothing, a lookup is a
+binary search over the mapped pages, and ZipClient only goes upstream for addresses the index does not know
+"""
+
+import argparse
+import array
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+from normalize import address_key
+from response_cache import exact_key
+from result_sink import iter_records
+
+# magic, version, zip field width, entry count, build time (unix seconds)
+HEADER = struct.Struct('<4sHHII')
+MAGIC = b'MKZI'
+VERSION = 1
+ZIP_WIDTH = 8  # 5-7 digit zip codes, NUL padded; an empty field is a known "no zip" answer
+OFFSET = struct.Struct('<I')
+
+# bulk_resolve.py statuses that say nothing about the address itself
+UNRESOLVED_STATUSES = ('blocked', 'error', 'invalid')
+
+
+def iter_address_records(path):
+    """Stream address records from a JSONL file, or a JSON list like valid_addresses.json"""
+    with open(path, encoding='utf-8') as f:
+        head = f.read(64).lstrip()
+    if head.startswith('['):
+        with open(path, encoding='utf-8') as f:
+            yield from json.load(f)
+    else:
+        yield from iter_records(path)
+
+
+def index_entry(record, include_negative=False):
+    """
+    (key, zip) for a record the index should hold, else None
+    Errors and blocks are skipped; "no zip" answers only with include_negative (they are what a typo returns),
+    and then under the exact spelling - like the response cache, a miss for one alias says nothing about the others
+    """
+    if record.get('error') or record.get('blocked') or record.get('status') in UNRESOLVED_STATUSES:
+        return None
+    zip_code = record.get('zipCode') or record.get('zip') or ''
+    if not zip_code:
+        answered = record.get('valid') is False or record.get('status') == 'not_found'
+        if not (include_negative and answered):
+            return None
+    address = (record['city'], record['street'], str(record['house']), record.get('entrance') or '')
+    return (address_key(*address) if zip_code else exact_key(*address)), zip_code
+
+
+def build_index(records, path, include_negative=False):
+    """
+    Compile address records into an index file at `path` - later records win for the same address
+    The file is written beside the target and renamed into place, so processes that have the old index
+    mapped keep reading it. Returns the number of entries
+    """
+    entries = {}
+    for record in records:
+        entry = index_entry(record, include_negative)
+        if entry is not None:
+            entries[entry[0]] = entry[1]
+
+    # Sorted by UTF-8 bytes, the order find() compares in
+    items = sorted((key.encode('utf-8', 'surrogatepass'), zip_code.encode('ascii')) for key, zip_code in entries.items())
+    keys = [key for key, _ in items]
+
+    offsets = [0]
+    for key in keys:
+        offsets.append(offsets[-1] + len(key))
+
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, ZIP_WIDTH, len(keys), int(time.time())))
+        f.write(struct.pack(f'<{len(offsets)}I', *offsets))
+        f.write(b''.join(zip_code.ljust(ZIP_WIDTH, b'\0') for _, zip_code in items))
+        f.write(b''.join(keys))
+    os.replace(tmp_path, path)
+    return len(keys)
+
+
+class ZipIndex:
+    def __init__(self, path):
+        """Map an index built by build_index(); raises ValueError for a file that is not one"""
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < HEADER.size:
+            self._map.close()
+            raise ValueError(f"{path} is not a zip index (too short)")
+        magic, version, zip_width, count, built_at = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION or zip_width != ZIP_WIDTH:
+            self._map.close()
+            raise ValueError(f"{path} is not a version {VERSION} zip index")
+
+        self.count = count
+        self.built_at = built_at
+        self._zips = HEADER.size + OFFSET.size * (count + 1)
+        self._keys = self._zips + ZIP_WIDTH * count
+        if len(self._map) < self._keys:
+            self._map.close()
+            raise ValueError(f"{path} is truncated or corrupt")
+        offsets = memoryview(self._map)[HEADER.size:self._zips]
+        if sys.byteorder == 'little':
+            self._offsets = offsets.cast('I')  # Zero-copy view of the offset table
+        else:
+            self._offsets = array.array('I', offsets)
+            self._offsets.byteswap()
+        offsets.release()
+        if self._keys + self._offsets[count] != len(self._map):
+            self.close()
+            raise ValueError(f"{path} is truncated or corrupt")
+
+    def find(self, key):
+        """Zip for a normalized key ('' for a known "no zip" answer), or None when the index does not have it"""
+        target = key.encode('utf-8', 'surrogatepass')
+        data, offsets, keys = self._map, self._offsets, self._keys
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if data[keys + offsets[mid]:keys + offsets[mid + 1]] < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and data[keys + offsets[lo]:keys + offsets[lo + 1]] == target:
+            zip_start = self._zips + ZIP_WIDTH * lo
+            return data[zip_start:zip_start + ZIP_WIDTH].rstrip(b'\0').decode('ascii')
+        return None
+
+    def get(self, city, street, house, entrance=''):
+        """
+        Zip for a raw address under any spelling; a "no zip" answer ('') only for the exact spelling it was
+        recorded with. Counts hits and misses
+        """
+        zip_code = self.find(address_key(city, street, house, entrance or ''))
+        if zip_code is None:
+            zip_code = self.find(exact_key(city, street, house, entrance or ''))
+        with self._lock:
+            if zip_code is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return zip_code
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, key):
+        return self.find(key) is not None
+
+    @property
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def report(self):
+        """One-line hit ratio summary for the end of a run"""
+        return (f"Index: {self.hits} hits / {self.hits + self.misses} lookups "
+                f"({self.hit_ratio:.1%} hit ratio, {self.count} entries in {self.path})")
+
+    def close(self):
+        if isinstance(self._offsets, memoryview):
+            self._offsets.release()  # The map cannot close while a view of it is exported
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query the offline zip code index')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='Compile result files into an index')
+    build.add_argument('inputs', nargs='+', help='probe_results.jsonl, valid_addresses.json or bulk_resolve.py JSONL')
+    build.add_argument('-o', '--output', default='zip_index.bin', help='Index file (default: zip_index.bin)')
+    build.add_argument('--include-negative', action='store_true', help='Also keep "no zip found" answers')
+
+    lookup = commands.add_parser('lookup', help='Look up one address')
+    lookup.add_argument('index', help='Index file')
+    lookup.add_argument('city')
+    lookup.add_argument('street')
+    lookup.add_argument('house')
+    lookup.add_argument('entrance', nargs='?', default='')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        def records():
+            for path in args.inputs:
+                yield from iter_address_records(path)
+
+        start = time.perf_counter()
+        count = build_index(records(), args.output, args.include_negative)
+        size = os.path.getsize(args.output)
+        print(f"✅ Indexed {count:,} addresses into {args.output} "
+              f"({size / 1024:,.1f} KiB, {time.perf_counter() - start:.2f}s)")
+        return 0
+
+    try:
+        index = ZipIndex(args.index)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        return 1
+    with index:
+        start = time.perf_counter()
+        zip_code = index.get(args.city, args.street, args.house, args.entrance)
+        elapsed_us = (time.perf_counter() - start) * 1e6
+    if zip_code is None:
+        print(f"❌ Not in the index ({elapsed_us:.1f} µs)")
+        return 1
+    print(f"✅ {zip_code or 'no zip code'} ({elapsed_us:.1f} µs)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,121 @@
+// Hebrew address normalization utility
+// Produces canonical keys so that surface variants of one address (geresh vs apostrophe, niqqud,
+// extra spaces, "רח'" prefixes, city aliases) compare equal. Keys are for comparison only -
+// the API is always called with what the user typed.
+
+const Normalize = {
+  // Invisible formatting characters: zero-width, bidi marks/embeddings/isolates, BOM, soft hyphen
+  INVISIBLE: /[\u00AD\u200B-\u200F\u202A-\u202E\u2066-\u2069\uFEFF]/g,
+
+  // Niqqud and cantillation marks (maqaf, paseq and sof pasuq are punctuation and handled below)
+  MARKS: /[\u0591-\u05BD\u05BF\u05C1\u05C2\u05C4\u05C5\u05C7]/g,
+
+  // Geresh and apostrophe look-alikes -> '
+  APOSTROPHES: /[\u05F3\u2018\u2019\u201B\u2032`\u00B4]/g,
+
+  // Gershayim, curly double quotes and a doubled apostrophe -> "
+  QUOTES: /[\u05F4\u201C\u201D\u201F\u2033]|''/g,
+
+  // Maqaf and dash look-alikes -> -
+  DASHES: /[\u05BE\u2010-\u2015\u2212]/g,
+
+  // Generic "street" prefixes, possibly repeated ("רח' רחוב הגפן")
+  STREET_PREFIX: /^(?:(?:רחוב|רח'|רח\.) )+(?=[^ ])/,
+
+  // Alternative spellings and common abbreviations -> canonical city name (keys are already cleaned)
+  CITY_ALIASES: {
+    'תל אביב-יפו': 'תל אביב',
+    'תל אביב יפו': 'תל אביב',
+    'תל-אביב': 'תל אביב',
+    'תל-אביב-יפו': 'תל אביב',
+    'ת"א': 'תל אביב',
+    'ת"א-יפו': 'תל אביב',
+    'י-ם': 'ירושלים',
+    'פתח תקוה': 'פתח תקווה',
+    'פ"ת': 'פתח תקווה',
+    'ב"ש': 'באר שבע',
+    'ראשל"צ': 'ראשון לציון',
+    'מודיעין': 'מודיעין-מכבים-רעות'
+  },
+
+  /**
+   * Canonical punctuation and spacing shared by every field
+   * @param {string} text
+   * @returns {string}
+   */
+  clean(text) {
+    if (!text || typeof text !== 'string') {
+      return '';
+    }
+
+    return text
+      .replace(this.INVISIBLE, '')
+      .replace(this.MARKS, '')
+      .replace(this.APOSTROPHES, "'")
+      .replace(this.QUOTES, '"')
+      .replace(this.DASHES, '-')
+      .replace(/\s+/g, ' ')
+      .trim()
+      .replace(/ ?- ?/g, '-')
+      .replace(/[A-Z]/g, char => char.toLowerCase());
+  },
+
+  /**
+   * @param {string} city
+   * @returns {string}
+   */
+  normalizeCity(city) {
+    const cleaned = this.clean(city).replace(/^קרית /, 'קריית ');
+    return Object.prototype.hasOwnProperty.call(this.CITY_ALIASES, cleaned) ? this.CITY_ALIASES[cleaned] : cleaned;
+  },
+
+  /**
+   * @param {string} street
+   * @returns {string}
+   */
+  normalizeStreet(street) {
+    return this.clean(street)
+      .replace(this.STREET_PREFIX, '')
+      .replace(/^שד['.] /, 'שדרות ');
+  },
+
+  /**
+   * @param {string} houseNumber
+   * @returns {string}
+   */
+  normalizeHouseNumber(houseNumber) {
+    // "7 א" and "07" are the same house as "7א" and "7"
+    return this.clean(houseNumber).replace(/ /g, '').replace(/^0+(?=\d)/, '');
+  },
+
+  /**
+   * @param {string} entrance
+   * @returns {string}
+   */
+  normalizeEntrance(entrance) {
+    // "כניסה א'" -> "א"
+    return this.clean(entrance).replace(/^כניסה ?/, '').replace(/'$/, '').replace(/ /g, '');
+  },
+
+  /**
+   * Canonical key for an address, in API parameter order (Location, House, Entrance, Street)
+   * @param {string} city
+   * @param {string} street
+   * @param {string} houseNumber
+   * @param {string} entrance
+   * @returns {string}
+   */
+  addressKey(city, street, houseNumber, entrance = '') {
+    return [
+      this.normalizeCity(city),
+      this.normalizeHouseNumber(houseNumber),
+      this.normalizeEntrance(entrance),
+      this.normalizeStreet(street)
+    ].join('\u001f');
+  }
+};
+
+// Export for use in other scripts
+if (typeof module !== 'undefined' && module.exports) {
+  module.exports = Normalize;
+}
@@ -1,5 +1,8 @@
 // Storage management utility
 
+// normalize.js is loaded first as a script tag in the extension pages; under Node it is required
+const normalizer = typeof Normalize !== 'undefined' ? Normalize : require('./normalize.js');
+
 const Storage = {
   /**
    * Check if history is enabled
@@ -56,11 +59,10 @@ const Storage = {
     const history = await this.getHistory();
     const maxItems = await this.getMaxHistoryItems();
 
-    // Remove duplicates (same city, street, houseNumber)
-    const filtered = history.filter(item => 
-      item.city !== searchItem.city ||
-      item.street !== searchItem.street ||
-      item.houseNumber !== searchItem.houseNumber
+    // Remove duplicates (same city, street, houseNumber once normalized - "רח' הרצל" is "הרצל")
+    const key = normalizer.addressKey(searchItem.city, searchItem.street, searchItem.houseNumber);
+    const filtered = history.filter(item =>
+      normalizer.addressKey(item.city, item.street, item.houseNumber) !== key
     );
 
     // Add new item at the beginning